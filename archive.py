@@ -0,0 +1,75 @@
+"""Фоновый перенос старых броней и закрытых заказов в архивные таблицы.
+
+Раз в ARCHIVE_INTERVAL секунд всё, что старше ARCHIVE_RETENTION_DAYS,
+переносится пачками по ARCHIVE_BATCH строк — каждая пачка отдельной
+транзакцией с паузой между ними, чтобы хендлеры не ждали писателя.
+"""
+
+import asyncio
+import logging
+from datetime import date, timedelta
+
+import async_db as db
+from config import ARCHIVE_RETENTION_DAYS, ARCHIVE_BATCH, ARCHIVE_INTERVAL, ARCHIVE_BATCH_PAUSE
+
+logger = logging.getLogger(__name__)
+
+
+class Archiver:
+    def __init__(self, retention_days, batch_size, interval, pause):
+        self.retention_days = retention_days
+        self.batch_size = batch_size
+        self.interval = interval
+        self.pause = pause
+        self._task = None
+        self._inflight = None  # текущая пачка: поток БД не прервать отменой задачи
+
+    async def _drain(self, move, before):
+        total = 0
+        while True:
+            self._inflight = asyncio.ensure_future(move(before, self.batch_size))
+            moved = await asyncio.shield(self._inflight)
+            self._inflight = None
+            total += moved
+            if moved < self.batch_size:
+                return total
+            await asyncio.sleep(self.pause)
+
+    async def run_once(self):
+        """Один проход; возвращает (броней, заказов) перенесено."""
+        before = (date.today() - timedelta(days=self.retention_days)).isoformat()
+        bookings = await self._drain(db.archive_bookings, before)
+        orders = await self._drain(db.archive_orders, before)
+        if bookings or orders:
+            logger.info("Архив: перенесено броней %s, заказов %s (до %s)", bookings, orders, before)
+        return bookings, orders
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception:
+                logger.exception("Ошибка архивации")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Остановить до закрытия пула БД. Пачка, которая уже пишется,
+        дописывается и коммитится: stop() дожидается её, а следующую не начинает."""
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        if self._inflight is not None:
+            await asyncio.wait([self._inflight])
+            self._inflight = None
+        self._task = None
+
+
+archiver = Archiver(ARCHIVE_RETENTION_DAYS, ARCHIVE_BATCH, ARCHIVE_INTERVAL, ARCHIVE_BATCH_PAUSE)
@@ -0,0 +1,117 @@
+"""Асинхронная обёртка над database.py: каждый вызов уходит в пул потоков."""
+
+import asyncio
+import contextvars
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import database
+import metrics
+from config import DB_THREADS, METRICS_ENABLED
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=DB_THREADS, thread_name_prefix="db")
+
+
+def _to_async(func):
+    """Превращает синхронную функцию database.py в корутину."""
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        ctx = contextvars.copy_context()
+        call = functools.partial(ctx.run, func, *args, **kwargs)
+        if not METRICS_ENABLED:
+            return await loop.run_in_executor(_executor, call)
+        started = time.perf_counter()
+        try:
+            return await loop.run_in_executor(_executor, call)
+        finally:
+            metrics.record_db_call(func.__name__, time.perf_counter() - started)
+    return wrapper
+
+
+def shutdown():
+    """Дождаться завершения запросов и остановить пул потоков."""
+    _executor.shutdown(wait=True)
+
+
+ping = _to_async(database.ping)
+
+#  Меню
+add_menu_item = _to_async(database.add_menu_item)
+import_menu = _to_async(database.import_menu)
+delete_menu_item = _to_async(database.delete_menu_item)
+get_menu_page = _to_async(database.get_menu_page)
+get_menu_item = _to_async(database.get_menu_item)
+get_all_menu_items = _to_async(database.get_all_menu_items)
+# Только счётчик в памяти — без пула потоков
+get_menu_version = database.get_menu_version
+
+#  Заказы
+create_order = _to_async(database.create_order)
+get_order_by_uuid = _to_async(database.get_order_by_uuid)
+get_active_order_by_user = _to_async(database.get_active_order_by_user)
+add_to_cart = _to_async(database.add_to_cart)
+remove_cart_item = _to_async(database.remove_cart_item)
+get_cart_items = _to_async(database.get_cart_items)
+get_order_total = _to_async(database.get_order_total)
+get_order_subtotals = _to_async(database.get_order_subtotals)
+add_order_participant = _to_async(database.add_order_participant)
+get_order_participants = _to_async(database.get_order_participants)
+get_order_by_id = _to_async(database.get_order_by_id)
+get_order_by_booking_id = _to_async(database.get_order_by_booking_id)
+close_order = _to_async(database.close_order)
+
+#  Пользователи
+add_user = _to_async(database.add_user)
+get_user = _to_async(database.get_user)
+get_all_users = _to_async(database.get_all_users)
+update_user_phone = _to_async(database.update_user_phone)
+set_user_role = _to_async(database.set_user_role)
+delete_user = _to_async(database.delete_user)
+# Только счётчики в памяти — без пула потоков
+get_user_cache_stats = database.get_user_cache_stats
+
+#  Столы
+get_all_tables = _to_async(database.get_all_tables)
+add_table = _to_async(database.add_table)
+import_tables = _to_async(database.import_tables)
+delete_table = _to_async(database.delete_table)
+reset_all_tables = _to_async(database.reset_all_tables)
+
+#  Брони
+add_booking = _to_async(database.add_booking)
+book_slot = _to_async(database.book_slot)
+get_active_booking = _to_async(database.get_active_booking)
+get_all_bookings_full = _to_async(database.get_all_bookings_full)
+get_bookings_page = _to_async(database.get_bookings_page)
+delete_booking = _to_async(database.delete_booking)
+cancel_booking = _to_async(database.cancel_booking)
+get_table_bookings = _to_async(database.get_table_bookings)
+get_free_slots = _to_async(database.get_free_slots)
+get_free_tables = _to_async(database.get_free_tables)
+find_party_tables = _to_async(database.find_party_tables)
+get_party_hours = _to_async(database.get_party_hours)
+get_user_bookings_history = _to_async(database.get_user_bookings_history)
+
+#  Архив
+archive_bookings = _to_async(database.archive_bookings)
+archive_orders = _to_async(database.archive_orders)
+
+sync_caches = _to_async(database.sync_caches)
+
+#  Состояния FSM
+fsm_load = _to_async(database.fsm_load)
+fsm_save = _to_async(database.fsm_save)
+
+#  Медиа
+get_media_file_id = _to_async(database.get_media_file_id)
+save_media_file_id = _to_async(database.save_media_file_id)
+forget_media_file_id = _to_async(database.forget_media_file_id)
+
+#  Статистика
+get_stats = _to_async(database.get_stats)
+reconcile_stats = _to_async(database.reconcile_stats)
@@ -0,0 +1,82 @@
+"""Индекс занятости столов: битовая маска часов на каждую пару (стол, дата).
+
+Бит h маски выставлен, если у стола есть активная бронь на слот h:00 - h+1:00.
+День загружается из БД одним запросом при первом обращении, дальше
+поддерживается функциями записи database.py.
+"""
+
+import threading
+from datetime import date
+
+from config import WORKING_HOURS_START, WORKING_HOURS_END
+
+WORKING_MASK = sum(1 << h for h in range(WORKING_HOURS_START, WORKING_HOURS_END))
+
+
+def slot_label(hour: int) -> str:
+    return f"{hour}:00 - {hour + 1}:00"
+
+
+def slot_hour(booking_time) -> int | None:
+    """'12:00 - 13:00' -> 12; None для неразборчивых значений."""
+    try:
+        return int(str(booking_time).split(":", 1)[0])
+    except ValueError:
+        return None
+
+
+class SlotIndex:
+    def __init__(self, loader):
+        # loader(booking_date) -> [(table_id, booking_time), ...] активных броней
+        self._loader = loader
+        self._days: dict[str, dict[int, int]] = {}
+        self._lock = threading.Lock()
+
+    def _day(self, booking_date):
+        # Вызывается под self._lock: так загрузка не разминётся с book/release
+        day = self._days.get(booking_date)
+        if day is None:
+            today = date.today().isoformat()
+            for d in [d for d in self._days if d < today]:
+                del self._days[d]
+            day = {}
+            for table_id, booking_time in self._loader(booking_date):
+                hour = slot_hour(booking_time)
+                if hour is not None:
+                    day[table_id] = day.get(table_id, 0) | (1 << hour)
+            self._days[booking_date] = day
+        return day
+
+    def busy_mask(self, table_id, booking_date) -> int:
+        with self._lock:
+            return self._day(booking_date).get(table_id, 0)
+
+    def is_free(self, table_id, booking_date, hour) -> bool:
+        return not self.busy_mask(table_id, booking_date) >> hour & 1
+
+    def free_hours(self, table_id, booking_date) -> list[int]:
+        free = WORKING_MASK & ~self.busy_mask(table_id, booking_date)
+        return [h for h in range(WORKING_HOURS_START, WORKING_HOURS_END) if free >> h & 1]
+
+    def free_tables(self, booking_date, hour, table_ids) -> list[int]:
+        with self._lock:
+            day = self._day(booking_date)
+            return [t for t in table_ids if not day.get(t, 0) >> hour & 1]
+
+    def book(self, table_id, booking_date, booking_time):
+        hour = slot_hour(booking_time)
+        with self._lock:
+            day = self._days.get(booking_date)
+            if day is not None and hour is not None:
+                day[table_id] = day.get(table_id, 0) | (1 << hour)
+
+    def release(self, table_id, booking_date, booking_time):
+        hour = slot_hour(booking_time)
+        with self._lock:
+            day = self._days.get(booking_date)
+            if day is not None and hour is not None:
+                day[table_id] = day.get(table_id, 0) & ~(1 << hour)
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
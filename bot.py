@@ -2,10 +2,23 @@ import asyncio
 import logging
 
 from aiogram import Bot, Dispatcher
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 
+import async_db
 import database as db
-from config import BOT_TOKEN
+import metrics
+from config import (
+    BOT_TOKEN, BOT_API_URL, BOT_MODE, FSM_STORAGE, WORKERS,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT, ARCHIVE_ENABLED,
+)
+from archive import archiver
+from broadcast import broadcaster, cart_digest
 from handlers import get_all_routers
+from storage import SQLiteStorage, FSMFlushMiddleware
+from utils import set_bot_username
+from webhook import run_webhook
+from workers import run_front
 
 #Логирование
 logging.basicConfig(
@@ -16,21 +29,75 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+#Остановка: вызывается диспетчером после закрытия FSM, до закрытия сессии бота
+async def on_shutdown():
+    await archiver.stop()
+    await cart_digest.close()
+    await broadcaster.close()
+    async_db.shutdown()
+    db.close_pool()
+
+
+def make_bot(token: str = BOT_TOKEN) -> Bot:
+    if BOT_API_URL:
+        session = AiohttpSession(api=TelegramAPIServer.from_base(BOT_API_URL))
+        return Bot(token=token, session=session)
+    return Bot(token=token)
+
+
+def build_dispatcher() -> Dispatcher:
+    if FSM_STORAGE == "sqlite":
+        storage = SQLiteStorage()
+        dp = Dispatcher(storage=storage)
+        dp.update.outer_middleware(FSMFlushMiddleware(storage))
+    else:
+        dp = Dispatcher()
+
+    #Подключение всех роутеров
+    for r in get_all_routers():
+        dp.include_router(r)
+
+    dp.shutdown.register(on_shutdown)
+    return dp
+
+
 async def main():
     #Инициализация базы
     db.init_db()
     logger.info("БД инициализирована")
 
-    bot = Bot(token=BOT_TOKEN)
-    dp = Dispatcher()
+    bot = make_bot()
+    me = await bot.get_me()
+    set_bot_username(me.username)
+    logger.info("Бот @%s", me.username)
+    dp = build_dispatcher()
 
-    #Подключение всех роутеров
-    for r in get_all_routers():
-        dp.include_router(r)
+    logger.info("Бот запущен! Режим: %s", BOT_MODE)
+    # Архивирует только главный процесс, воркеры его не запускают
+    if ARCHIVE_ENABLED:
+        archiver.start()
+    if WORKERS > 1:
+        # Хендлеры работают в воркерах (метрики тоже там), здесь только приём апдейтов
+        try:
+            await run_front(bot, dp.resolve_used_update_types(), me.username)
+        finally:
+            await bot.session.close()
+            await on_shutdown()
+        return
 
-    logger.info("Бот запущен!")
-    await bot.delete_webhook(drop_pending_updates=True)
-    await dp.start_polling(bot)
+    metrics_runner = None
+    if METRICS_ENABLED:
+        metrics.install(dp, bot)
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT)
+    try:
+        if BOT_MODE == "webhook":
+            await run_webhook(dp, bot)
+        else:
+            await bot.delete_webhook(drop_pending_updates=True)
+            await dp.start_polling(bot)
+    finally:
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
 
 
 if __name__ == "__main__":
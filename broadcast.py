@@ -0,0 +1,189 @@
+"""Рассылка сообщений: параллельно, в рамках лимитов Telegram и с повторами.
+
+Telegram допускает ~30 сообщений в секунду на бота и ~1 в секунду в один чат;
+при превышении отвечает RetryAfter с временем ожидания. Лимит общий на бота,
+поэтому при WORKERS процессах каждый получает BROADCAST_GLOBAL_RATE / WORKERS.
+"""
+
+import asyncio
+import html
+import logging
+
+from aiogram import Bot
+from aiogram.exceptions import (
+    TelegramRetryAfter, TelegramForbiddenError, TelegramBadRequest,
+    TelegramNetworkError, TelegramServerError,
+)
+
+import async_db
+from config import (
+    BROADCAST_CONCURRENCY, BROADCAST_GLOBAL_RATE, BROADCAST_CHAT_INTERVAL,
+    BROADCAST_MAX_RETRIES, BROADCAST_BACKOFF, CART_DIGEST_WINDOW, WORKERS,
+)
+
+logger = logging.getLogger(__name__)
+
+
+class RateLimiter:
+    """Выдаёт не больше rate разрешений в секунду, равномерно."""
+
+    def __init__(self, rate):
+        self._interval = 1 / rate
+        self._next = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        async with self._lock:
+            now = asyncio.get_running_loop().time()
+            delay = self._next - now
+            self._next = max(now, self._next) + self._interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def pause(self, seconds):
+        """Не выдавать разрешений ближайшие seconds секунд (flood wait бота)."""
+        self._next = max(self._next, asyncio.get_running_loop().time() + seconds)
+
+
+class Broadcaster:
+    def __init__(self, concurrency=BROADCAST_CONCURRENCY, global_rate=BROADCAST_GLOBAL_RATE / WORKERS,
+                 chat_interval=BROADCAST_CHAT_INTERVAL, max_retries=BROADCAST_MAX_RETRIES,
+                 backoff=BROADCAST_BACKOFF):
+        self._sem = asyncio.Semaphore(concurrency)
+        self._global = RateLimiter(global_rate)
+        self._chat_interval = chat_interval
+        self._chat_next: dict[int, float] = {}
+        self._max_retries = max_retries
+        self._backoff = backoff
+        self._tasks: set[asyncio.Task] = set()
+
+    async def _wait_chat(self, chat_id):
+        now = asyncio.get_running_loop().time()
+        if len(self._chat_next) > 10000:
+            self._chat_next = {k: v for k, v in self._chat_next.items() if v > now}
+        ready = self._chat_next.get(chat_id, 0.0)
+        self._chat_next[chat_id] = max(now, ready) + self._chat_interval
+        if ready > now:
+            await asyncio.sleep(ready - now)
+
+    async def send(self, bot: Bot, chat_id: int, text: str, **kwargs) -> bool:
+        """Отправить одно сообщение с повторами. False — не доставлено."""
+        for attempt in range(self._max_retries + 1):
+            async with self._sem:
+                await self._wait_chat(chat_id)
+                await self._global.wait()
+                try:
+                    await bot.send_message(chat_id, text, **kwargs)
+                    return True
+                except TelegramRetryAfter as e:
+                    # 429 — лимит на весь бот: ждут и этот чат, и остальные
+                    delay = e.retry_after
+                    self._chat_next[chat_id] = asyncio.get_running_loop().time() + delay
+                    self._global.pause(delay)
+                except (TelegramNetworkError, TelegramServerError) as e:
+                    delay = self._backoff * 2 ** attempt
+                    logger.info("Повтор отправки user=%s через %.1fс: %s", chat_id, delay, e)
+                except (TelegramForbiddenError, TelegramBadRequest) as e:
+                    logger.warning("Не удалось отправить уведомление user=%s: %s", chat_id, e)
+                    return False
+            await asyncio.sleep(delay)
+        logger.warning("Уведомление user=%s не доставлено после %s попыток", chat_id, self._max_retries + 1)
+        return False
+
+    async def fan_out(self, bot: Bot, chat_ids, text: str, **kwargs) -> int:
+        """Разослать всем параллельно. Возвращает число доставленных."""
+        results = await asyncio.gather(
+            *(self.send(bot, chat_id, text, **kwargs) for chat_id in chat_ids),
+            return_exceptions=True)
+        for chat_id, r in zip(chat_ids, results):
+            if isinstance(r, Exception):
+                logger.warning("Не удалось отправить уведомление user=%s: %s", chat_id, r)
+        return sum(r is True for r in results)
+
+    def spawn(self, coro) -> asyncio.Task:
+        """Запустить рассылку в фоне, не задерживая хендлер."""
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def close(self):
+        """Дождаться фоновых рассылок (при остановке бота)."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class CartDigest:
+    """Сводка событий корзины: одно сообщение на участника за окно.
+
+    Добавления копятся по заказу CART_DIGEST_WINDOW секунд, затем каждый
+    участник получает список того, что добавили другие
+    («Анна: 2× Пицца, Чай»). flush() отправляет сводку сразу (при оформлении).
+
+    При нескольких процессах сводка заказа копится в процессе его
+    инициатора — там же выполняется оформление: route(owner_id, event)
+    передаёт событие туда и возвращает True, если процесс чужой.
+    """
+
+    def __init__(self, sender: Broadcaster, participants_loader, window=CART_DIGEST_WINDOW):
+        self._sender = sender
+        # participants_loader(order_id) -> корутина со списком user_id участников
+        self._load_participants = participants_loader
+        self._window = window
+        self._pending: dict[int, dict] = {}
+        self.route = None
+
+    def add(self, bot: Bot, order_id: int, owner_id: int, user_id: int, user_name: str, item_name: str):
+        if self.route is not None and self.route(owner_id, {
+                "order_id": order_id, "owner_id": owner_id, "user_id": user_id,
+                "user_name": user_name, "item_name": item_name}):
+            return
+        buf = self._pending.get(order_id)
+        if buf is None:
+            buf = {"bot": bot, "events": {}, "names": {}}
+            self._pending[order_id] = buf
+            buf["timer"] = self._sender.spawn(self._flush_later(order_id))
+        items = buf["events"].setdefault(user_id, {})
+        items[item_name] = items.get(item_name, 0) + 1
+        buf["names"][user_id] = user_name
+
+    async def _flush_later(self, order_id):
+        await asyncio.sleep(self._window)
+        await self.flush(order_id)
+
+    @staticmethod
+    def _render(buf, exclude_user_id):
+        lines = []
+        for user_id, items in buf["events"].items():
+            if user_id == exclude_user_id:
+                continue
+            dishes = ", ".join(f"{n}× {html.escape(name)}" if n > 1 else html.escape(name)
+                               for name, n in items.items())
+            lines.append(f"<b>{html.escape(buf['names'][user_id])}</b>: {dishes}")
+        return "🛒 <b>Добавлено в заказ:</b>\n" + "\n".join(lines) if lines else None
+
+    async def flush(self, order_id):
+        buf = self._pending.pop(order_id, None)
+        if buf is None:
+            return
+        timer = buf["timer"]
+        if timer is not asyncio.current_task():
+            timer.cancel()
+        sends = []
+        for chat_id in await self._load_participants(order_id):
+            text = self._render(buf, chat_id)
+            if text:
+                sends.append(self._sender.send(buf["bot"], chat_id, text, parse_mode="HTML"))
+        await asyncio.gather(*sends, return_exceptions=True)
+
+    async def close(self):
+        for order_id in list(self._pending):
+            await self.flush(order_id)
+
+
+async def _order_participant_ids(order_id):
+    return [p['user_id'] for p in await async_db.get_order_participants(order_id)]
+
+
+broadcaster = Broadcaster()
+cart_digest = CartDigest(broadcaster, _order_participant_ids)
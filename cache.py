@@ -0,0 +1,147 @@
+"""Кэши в памяти процесса для часто читаемых и редко меняющихся данных."""
+
+import threading
+import time
+from collections import OrderedDict
+
+
+class MenuCache:
+    """Меню целиком: упорядоченный по id список и словарь id -> позиция.
+
+    version растёт при каждом изменении меню, по нему же можно
+    сбрасывать производные кэши (например, клавиатуры страниц).
+    """
+
+    def __init__(self, loader):
+        # loader() -> список позиций меню, упорядоченный по id
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._items = None
+        self._by_id = {}
+        self.version = 0
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._items = None
+            self._by_id = {}
+
+    def _ensure(self):
+        items = self._items
+        if items is not None:
+            return items
+        version = self.version
+        loaded = self._loader()
+        with self._lock:
+            # Меню поменялось во время загрузки — отдаём, но не запоминаем
+            if version == self.version:
+                self._items = loaded
+                self._by_id = {item['id']: item for item in loaded}
+        return loaded
+
+    def page(self, page, per_page):
+        items = self._ensure()
+        offset = (page - 1) * per_page
+        return [dict(i) for i in items[offset:offset + per_page]], offset + per_page < len(items)
+
+    def get(self, item_id):
+        self._ensure()
+        item = self._by_id.get(item_id)
+        return dict(item) if item else None
+
+    def all(self):
+        return [dict(i) for i in self._ensure()]
+
+
+class Snapshot:
+    """Одно значение целиком (например, схема зала), пересобирается
+    loader-ом при первом обращении после invalidate()."""
+
+    def __init__(self, loader):
+        self._loader = loader
+        self._lock = threading.Lock()
+        self._value = None
+        self.version = 0
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._value = None
+
+    def get(self):
+        value = self._value
+        if value is not None:
+            return value
+        version = self.version
+        loaded = self._loader()
+        with self._lock:
+            # Изменилось во время загрузки — отдаём, но не запоминаем
+            if version == self.version:
+                self._value = loaded
+        return loaded
+
+
+class TTLCache:
+    """Ограниченный LRU-кэш с временем жизни записей и счётчиками попаданий."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get_or_load(self, key, loader):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            generation = self._generation
+        value = loader(key)
+        with self._lock:
+            # Пока грузили, запись могли инвалидировать — тогда не кэшируем
+            if generation == self._generation:
+                self._data[key] = (now + self.ttl, value)
+                self._data.move_to_end(key)
+                while len(self._data) > self.maxsize:
+                    self._data.popitem(last=False)
+        return value
+
+    def get(self, key):
+        """Значение или None; для случаев, когда загрузка асинхронная."""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+            return None
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._generation += 1
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            return {"size": len(self._data), "hits": self.hits, "misses": self.misses}
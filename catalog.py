@@ -0,0 +1,166 @@
+"""Загрузка и выгрузка меню и схемы столов файлом (CSV или JSON).
+
+Форматы — те же, что отдаёт выгрузка, так что файл можно выгрузить,
+поправить в таблице и загрузить обратно.
+
+Меню:   name, price, description, category
+Столы:  name, seats, neighbors — соседи по именам, в CSV через "|"
+
+CSV — с заголовком, разделитель "," или ";" (как сохраняет Excel).
+JSON — список объектов с теми же полями, соседи — списком.
+"""
+
+import csv
+import io
+import json
+import math
+
+NEIGHBORS_SEP = "|"
+MAX_ERRORS = 10  # сколько ошибок показывать админу
+
+MENU_FIELDS = ("name", "price", "description", "category")
+TABLE_FIELDS = ("name", "seats", "neighbors")
+
+
+class CatalogError(ValueError):
+    """Файл не прошёл проверку; errors — сообщения с номерами строк."""
+
+    def __init__(self, errors):
+        super().__init__("; ".join(errors))
+        self.errors = errors
+
+
+#  Разбор файла
+def _records(data: bytes, filename: str):
+    """(номер строки, словарь полей) из CSV или JSON, по расширению файла."""
+    try:
+        text = data.decode("utf-8-sig")
+    except UnicodeDecodeError:
+        raise CatalogError(["файл должен быть в кодировке UTF-8"])
+    if filename.lower().endswith(".json"):
+        try:
+            rows = json.loads(text)
+        except json.JSONDecodeError as e:
+            raise CatalogError([f"некорректный JSON: {e}"])
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise CatalogError(["JSON должен быть списком объектов"])
+        return list(enumerate(rows, 1))
+    try:
+        dialect = csv.Sniffer().sniff(text.split("\n", 1)[0], delimiters=",;")
+    except csv.Error:
+        dialect = csv.excel
+    reader = csv.DictReader(io.StringIO(text), dialect=dialect)
+    # Строка 1 — заголовок
+    return [(i, {k.strip().lower(): v for k, v in row.items() if k})
+            for i, row in enumerate(reader, 2)]
+
+
+def _text(value):
+    return "" if value is None else str(value).strip()
+
+
+def _number(value, integer):
+    text = _text(value).replace(",", ".").replace(" ", "")
+    number = float(text)
+    # nan, inf и 1e400 float() принимает, в БД им не место
+    if not math.isfinite(number):
+        raise ValueError(text)
+    if integer and not number.is_integer():
+        raise ValueError(text)
+    return int(number) if integer else number
+
+
+def _parse(records, fields, convert):
+    if not records:
+        raise CatalogError(["в файле нет строк"])
+    missing = [f for f in fields[:2] if f not in records[0][1]]
+    if missing:
+        raise CatalogError([f"нет колонок: {', '.join(missing)}"])
+    items, errors, seen = [], [], {}
+    for line, row in records:
+        name = _text(row.get("name"))
+        if not name:
+            errors.append(f"строка {line}: пустое название")
+            continue
+        if name in seen:
+            errors.append(f"строка {line}: «{name}» уже было в строке {seen[name]}")
+            continue
+        seen[name] = line
+        try:
+            items.append(convert(name, row))
+        except ValueError as e:
+            errors.append(f"строка {line} («{name}»): {e}")
+    if errors:
+        raise CatalogError(errors)
+    return items
+
+
+def _menu_item(name, row):
+    try:
+        price = _number(row.get("price"), integer=False)
+    except ValueError:
+        raise ValueError(f"цена «{_text(row.get('price'))}» — не число")
+    if price < 0:
+        raise ValueError("отрицательная цена")
+    return {"name": name, "price": price,
+            "description": _text(row.get("description")),
+            "category": _text(row.get("category")) or "main"}
+
+
+def _table(name, row):
+    try:
+        seats = _number(row.get("seats"), integer=True)
+    except ValueError:
+        raise ValueError(f"мест «{_text(row.get('seats'))}» — не целое число")
+    if seats < 1:
+        raise ValueError("мест должно быть больше нуля")
+    neighbors = row.get("neighbors") or []
+    if isinstance(neighbors, str):
+        neighbors = neighbors.split(NEIGHBORS_SEP)
+    elif not isinstance(neighbors, list):
+        raise ValueError("соседи — строка через «|» или список имён")
+    neighbors = [n for n in (_text(n) for n in neighbors) if n]
+    if name in neighbors:
+        raise ValueError("стол не может быть соседом сам себе")
+    return {"name": name, "seats": seats, "neighbors": neighbors}
+
+
+def parse_menu(data: bytes, filename: str) -> list[dict]:
+    """Позиции меню из файла; при ошибках — CatalogError со всеми сразу."""
+    return _parse(_records(data, filename), MENU_FIELDS, _menu_item)
+
+
+def parse_tables(data: bytes, filename: str) -> list[dict]:
+    """Столы из файла. Соседи проверяются при загрузке в БД: они могут
+    ссылаться и на столы, которых нет в файле."""
+    return _parse(_records(data, filename), TABLE_FIELDS, _table)
+
+
+#  Выгрузка
+def _dump(rows, fields, fmt):
+    if fmt == "json":
+        return json.dumps(list(rows), ensure_ascii=False, indent=1).encode("utf-8")
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerow(fields)
+    for row in rows:
+        writer.writerow([NEIGHBORS_SEP.join(row[f]) if isinstance(row[f], list) else row[f]
+                         for f in fields])
+    # BOM — чтобы Excel открыл кириллицу без вопросов о кодировке
+    return buf.getvalue().encode("utf-8-sig")
+
+
+def dump_menu(items, fmt="csv") -> bytes:
+    rows = ({"name": i["name"], "price": int(i["price"]) if float(i["price"]).is_integer() else i["price"],
+             "description": i["description"] or "", "category": i["category"] or ""}
+            for i in items)
+    return _dump(rows, MENU_FIELDS, fmt)
+
+
+def dump_tables(tables, fmt="csv") -> bytes:
+    """tables — словарь id -> стол, как из get_all_tables; соседи — по именам."""
+    names = {t_id: t["name"] for t_id, t in tables.items()}
+    rows = ({"name": t["name"], "seats": t["seats"],
+             "neighbors": [names[n] for n in t["neighbors"] if n in names]}
+            for t in sorted(tables.values(), key=lambda t: t["name"]))
+    return _dump(rows, TABLE_FIELDS, fmt)
@@ -3,6 +3,33 @@ import os
 # Токен бота
 BOT_TOKEN = "TOKEN"
 
+# Адрес Bot API; пусто — api.telegram.org. Для нагрузочных прогонов —
+# локальная заглушка tools/fake_telegram.py, например "http://127.0.0.1:8081"
+BOT_API_URL = ""
+
+# Получение апдейтов: "polling" или "webhook"
+BOT_MODE = "polling"
+
+# Webhook: Telegram шлёт апдейты на WEBHOOK_BASE_URL + WEBHOOK_PATH,
+# локально их принимает aiohttp-сервер на WEBHOOK_HOST:WEBHOOK_PORT (за reverse proxy)
+WEBHOOK_BASE_URL = "https://example.com"
+WEBHOOK_PATH = "/webhook"
+WEBHOOK_SECRET = ""  # X-Telegram-Bot-Api-Secret-Token, пусто — без проверки
+WEBHOOK_HOST = "127.0.0.1"
+WEBHOOK_PORT = 8080
+# Webhook принимает один процесс бота. Несколько копий за одним прокси не
+# запускать: FSM и кэши у каждой свои. Для нескольких ядер — WORKERS
+
+# Рабочих процессов: 1 — всё в одном процессе; больше — фронт раздаёт апдейты
+# процессам по chat_id (workers.py), все работают с одной restaurant.db
+WORKERS = 1
+
+# Метрики Prometheus (metrics.py) на http://METRICS_HOST:METRICS_PORT/metrics;
+# воркер N слушает METRICS_PORT + 1 + N. Включают подсчёт строк на каждое чтение из БД
+METRICS_ENABLED = False
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9100
+
 # Имя файла базы данных
 DB_NAME = "restaurant.db"
 
@@ -18,6 +45,9 @@ RESTAURANT_NAME = "RE-STOR"
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 TABLE_PHOTO_PATH = os.path.join(BASE_DIR, "OKOSAURIONA.png")
 
+# Загрузка меню и столов файлом (catalog.py): максимальный размер файла
+IMPORT_MAX_BYTES = 1024 * 1024
+
 # Позиций меню на страницу
 ITEMS_PER_PAGE = 5
 
@@ -28,5 +58,65 @@ WORKING_HOURS_END = 22
 # Максимум дней вперёд для бронирования
 MAX_BOOKING_DAYS = 7
 
+# Броней на страницу в списках сотрудника и админа
+BOOKINGS_PER_PAGE = 10
+
+# Хранилище состояний диалогов: "sqlite" (переживает рестарт) или "memory"
+FSM_STORAGE = "sqlite"
+# Диалогов в памяти SQLiteStorage; сверх этого вытесняются давно не тронутые
+# сохранённые (при следующем апдейте перечитываются из БД)
+FSM_CACHE_SIZE = 10000
+
+# Архив: брони старше ARCHIVE_RETENTION_DAYS дней (по дате брони) и закрытые
+# заказы той же давности переносятся в *_archive пачками по ARCHIVE_BATCH строк
+ARCHIVE_ENABLED = True
+ARCHIVE_RETENTION_DAYS = 90
+ARCHIVE_BATCH = 500
+ARCHIVE_INTERVAL = 3600  # секунд между проходами
+ARCHIVE_BATCH_PAUSE = 0.2  # пауза между пачками, чтобы не держать писателя
+
+# Подбор соседних столов для компании (seating.py): максимум столов в наборе
+SEATING_MAX_TABLES = 4
+
 # Порог людей создания совместного заказа
 SHARED_ORDER_THRESHOLD = 4
+
+# Рассылка участникам заказа
+BROADCAST_CONCURRENCY = 10  # одновременных запросов к Telegram
+# сообщений в секунду на бота (лимит Telegram ~30); при WORKERS > 1 делится
+# поровну между процессами — у каждого свой ограничитель
+BROADCAST_GLOBAL_RATE = 25
+BROADCAST_CHAT_INTERVAL = 1.0  # секунд между сообщениями в один чат
+BROADCAST_MAX_RETRIES = 3
+BROADCAST_BACKOFF = 0.5  # начальная пауза при сетевых ошибках, сек
+
+# Окно, за которое добавления в корзину собираются в одну сводку, сек
+CART_DIGEST_WINDOW = 15
+
+# Потоков для работы с БД (чтобы SQLite не блокировал event loop)
+DB_THREADS = 4
+
+# Пул соединений SQLite: один писатель + читатели
+DB_POOL_READERS = 4
+DB_BUSY_TIMEOUT = 5  # секунд ожидания блокировки
+DB_CACHED_STATEMENTS = 256  # кэш подготовленных запросов на соединение
+
+# PRAGMA для каждого соединения
+DB_JOURNAL_MODE = "WAL"
+DB_SYNCHRONOUS = "NORMAL"
+DB_CACHE_SIZE = -16000  # отрицательное значение — в КиБ (~16 МБ)
+DB_MMAP_SIZE = 64 * 1024 * 1024
+
+# Трассировка SQL (sqltrace.py): время каждого запроса, лог медленных с планом
+# и топ запросов по суммарному времени при остановке. Замедляет работу с БД
+DB_TRACE = False
+DB_SLOW_QUERY_MS = 50
+DB_TRACE_EXPLAIN = True  # EXPLAIN QUERY PLAN для медленных запросов
+DB_TRACE_TOP = 20
+
+# Кэш пользователей (get_user): размер и время жизни записи, сек
+USER_CACHE_SIZE = 10000
+USER_CACHE_TTL = 300
+
+# Кэш готовых клавиатур (utils.cached_kb): сколько разметок держать
+KEYBOARD_CACHE_SIZE = 512
@@ -3,116 +3,141 @@
 import sqlite3
 import json
 import uuid
+import queue
 import logging
+import threading
 from contextlib import contextmanager
-from config import DB_NAME
+
+import migrations
+from availability import SlotIndex
+from cache import MenuCache, Snapshot, TTLCache
+from config import (
+    DB_NAME, DB_POOL_READERS, DB_BUSY_TIMEOUT, DB_CACHED_STATEMENTS,
+    DB_JOURNAL_MODE, DB_SYNCHRONOUS, DB_CACHE_SIZE, DB_MMAP_SIZE,
+    USER_CACHE_SIZE, USER_CACHE_TTL, METRICS_ENABLED,
+    DB_TRACE, DB_SLOW_QUERY_MS, DB_TRACE_EXPLAIN, DB_TRACE_TOP,
+    WORKING_HOURS_START, WORKING_HOURS_END, SEATING_MAX_TABLES,
+)
+from seating import Floor
+from sqltrace import Tracer, TracedConnection
+from updatestats import counting_row
 
 logger = logging.getLogger(__name__)
 
 
+#Пул соединений: один писатель, несколько читателей
+class ConnectionPool:
+    """Долгоживущие соединения к одной базе.
+
+    Запись идёт через единственное соединение под замком, чтение —
+    через очередь соединений-читателей (в WAL они не ждут писателя).
+    """
+
+    def __init__(self, path, readers=DB_POOL_READERS):
+        self.path = path
+        self._write_lock = threading.Lock()
+        self._writer = self._connect()
+        self._readers = queue.Queue()
+        for _ in range(readers):
+            self._readers.put(self._connect())
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.path, timeout=DB_BUSY_TIMEOUT, check_same_thread=False,
+            cached_statements=DB_CACHED_STATEMENTS)
+        conn.row_factory = counting_row if METRICS_ENABLED else sqlite3.Row
+        conn.execute(f'PRAGMA journal_mode = {DB_JOURNAL_MODE}')
+        conn.execute(f'PRAGMA synchronous = {DB_SYNCHRONOUS}')
+        conn.execute(f'PRAGMA cache_size = {int(DB_CACHE_SIZE)}')
+        conn.execute(f'PRAGMA mmap_size = {int(DB_MMAP_SIZE)}')
+        return conn
+
+    @contextmanager
+    def writer(self):
+        with self._write_lock:
+            conn = self._writer
+            try:
+                yield conn
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            finally:
+                # delete_user/delete_table включают foreign_keys только для себя
+                conn.execute('PRAGMA foreign_keys = OFF')
+
+    @contextmanager
+    def reader(self):
+        conn = self._readers.get()
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            self._readers.put(conn)
+
+    def close(self):
+        with self._write_lock:
+            self._writer.close()
+        while not self._readers.empty():
+            self._readers.get_nowait().close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(DB_NAME)
+    return _pool
+
+
+def close_pool():
+    """Закрыть все соединения (при остановке бота или смене файла БД)."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            if tracer is not None:
+                with _pool.reader() as conn:
+                    logger.info(tracer.report(DB_TRACE_TOP, conn))
+            _pool.close()
+            _pool = None
+
+
+# Статистика запросов при DB_TRACE, см. sqltrace.py
+tracer = Tracer(DB_SLOW_QUERY_MS, DB_TRACE_EXPLAIN) if DB_TRACE else None
+
+
 #Коннект к БД
 @contextmanager
-def get_connection():
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row
-    try:
-        yield conn
-        conn.commit()
-    except Exception:
-        conn.rollback()
-        raise
-    finally:
-        conn.close()
+def get_connection(readonly=False):
+    pool = get_pool()
+    with (pool.reader() if readonly else pool.writer()) as conn:
+        if tracer is None:
+            yield conn
+            return
+        traced = TracedConnection(conn, tracer)
+        try:
+            yield traced
+        finally:
+            traced.finish()
+
+
+def ping():
+    """Проверка, что база отвечает (для readiness-проверки)."""
+    with get_connection(readonly=True) as conn:
+        return conn.execute('SELECT 1').fetchone()[0] == 1
 
 
 #Инициализация БД
 def init_db():
     with get_connection() as conn:
-        c = conn.cursor()
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS tables (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            seats INTEGER NOT NULL,
-            status TEXT DEFAULT 'free',
-            neighbors TEXT DEFAULT '[]'
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS users (
-            user_id INTEGER PRIMARY KEY,
-            username TEXT,
-            full_name TEXT,
-            phone_number TEXT,
-            role TEXT DEFAULT 'user',
-            is_regular BOOLEAN DEFAULT 0
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS bookings (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            user_id INTEGER,
-            table_id INTEGER,
-            booking_date TEXT,
-            booking_time TEXT,
-            people_count INTEGER,
-            pre_order_sum REAL DEFAULT 0,
-            status TEXT DEFAULT 'active',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(user_id) REFERENCES users(user_id),
-            FOREIGN KEY(table_id) REFERENCES tables(id)
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS menu (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            name TEXT NOT NULL,
-            price REAL NOT NULL,
-            description TEXT,
-            category TEXT
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS orders (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            link_uuid TEXT UNIQUE,
-            initiator_id INTEGER,
-            booking_id INTEGER,
-            status TEXT DEFAULT 'open',
-            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(booking_id) REFERENCES bookings(id)
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS cart_items (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER,
-            user_id INTEGER,
-            item_id INTEGER,
-            quantity INTEGER DEFAULT 1,
-            FOREIGN KEY(order_id) REFERENCES orders(id),
-            FOREIGN KEY(item_id) REFERENCES menu(id)
-        )''')
-
-        c.execute('''
-        CREATE TABLE IF NOT EXISTS order_participants (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            order_id INTEGER,
-            user_id INTEGER,
-            joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY(order_id) REFERENCES orders(id),
-            FOREIGN KEY(user_id) REFERENCES users(user_id),
-            UNIQUE(order_id, user_id)
-        )''')
-        for stmt in [
-            "ALTER TABLE orders ADD COLUMN booking_id INTEGER",
-            "ALTER TABLE bookings ADD COLUMN booking_date TEXT",
-        ]:
-            try:
-                c.execute(stmt)
-            except sqlite3.OperationalError:
-                pass
+        migrations.migrate(conn)
+    reconcile_stats()
 
     logger.info("База данных инициализирована")
 
@@ -122,52 +147,78 @@ def add_menu_item(name, price, description="", category="main"):
         conn.cursor().execute(
             'INSERT INTO menu (name, price, description, category) VALUES (?, ?, ?, ?)',
             (name, price, description, category))
+    menu.invalidate()
+
+
+def import_menu(items):
+    """Загрузить позиции меню одной транзакцией (см. catalog.py).
+
+    Позиции с уже существующим названием обновляются, остальные
+    добавляются. Возвращает (добавлено, обновлено).
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT DISTINCT name FROM menu')
+        existing = {row['name'] for row in c.fetchall()}
+        new = [i for i in items if i['name'] not in existing]
+        old = [i for i in items if i['name'] in existing]
+        c.executemany('INSERT INTO menu (name, price, description, category) '
+                      'VALUES (:name, :price, :description, :category)', new)
+        c.executemany('UPDATE menu SET price = :price, description = :description, '
+                      'category = :category WHERE name = :name', old)
+    menu.invalidate()
+    return len(new), len(old)
 
 
 def delete_menu_item(item_id):
     with get_connection() as conn:
         conn.cursor().execute('DELETE FROM menu WHERE id = ?', (item_id,))
+    menu.invalidate()
 
 
-def get_menu_page(page=1, per_page=5):
-    with get_connection() as conn:
+def _load_menu():
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
-        offset = (page - 1) * per_page
-        c.execute('SELECT * FROM menu LIMIT ? OFFSET ?', (per_page, offset))
-        items = [dict(row) for row in c.fetchall()]
-        c.execute('SELECT count(*) FROM menu')
-        total = c.fetchone()[0]
-    return items, (offset + per_page) < total
+        c.execute('SELECT * FROM menu ORDER BY id')
+        return [dict(row) for row in c.fetchall()]
+
+
+# Меню читается на каждой странице, а меняется несколько раз в день
+menu = MenuCache(_load_menu)
+
+
+def get_menu_version():
+    return menu.version
+
+
+def get_menu_page(page=1, per_page=5):
+    return menu.page(page, per_page)
 
 
 def get_menu_item(item_id):
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute('SELECT * FROM menu WHERE id = ?', (item_id,))
-        row = c.fetchone()
-    return dict(row) if row else None
+    return menu.get(item_id)
 
 
 def get_all_menu_items():
-    with get_connection() as conn:
-        c = conn.cursor()
-        c.execute('SELECT * FROM menu ORDER BY category, name')
-        return [dict(row) for row in c.fetchall()]
+    return sorted(menu.all(), key=lambda i: (i['category'] or '', i['name']))
 
 
 #  Заказы
+def _insert_order(c, initiator_id, booking_id=None):
+    link = str(uuid.uuid4())[:8]
+    c.execute('INSERT INTO orders (link_uuid, initiator_id, booking_id) VALUES (?, ?, ?)',
+              (link, initiator_id, booking_id))
+    return c.lastrowid, link
+
+
 def create_order(initiator_id, booking_id=None):
     with get_connection() as conn:
-        c = conn.cursor()
-        link = str(uuid.uuid4())[:8]
-        c.execute('INSERT INTO orders (link_uuid, initiator_id, booking_id) VALUES (?, ?, ?)',
-                  (link, initiator_id, booking_id))
-        order_id = c.lastrowid
+        order_id, link = _insert_order(conn.cursor(), initiator_id, booking_id)
     return order_id, link
 
 
 def get_order_by_uuid(link_uuid):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM orders WHERE link_uuid = ?', (link_uuid,))
         row = c.fetchone()
@@ -175,7 +226,7 @@ def get_order_by_uuid(link_uuid):
 
 
 def get_active_order_by_user(user_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute(
             'SELECT * FROM orders WHERE initiator_id = ? AND status="open" ORDER BY id DESC LIMIT 1',
@@ -185,34 +236,73 @@ def get_active_order_by_user(user_id):
 
 
 def add_to_cart(order_id, user_id, item_id):
+    """Добавить одну порцию: строка (заказ, гость, блюдо) одна, растёт quantity.
+
+    Цена фиксируется в момент первого добавления. False — блюда нет в меню.
+    """
     with get_connection() as conn:
-        conn.cursor().execute(
-            'INSERT INTO cart_items (order_id, user_id, item_id) VALUES (?, ?, ?)',
-            (order_id, user_id, item_id))
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO cart_items (order_id, user_id, item_id, quantity, unit_price)
+            SELECT ?, ?, id, 1, price FROM menu WHERE id = ?
+            ON CONFLICT(order_id, user_id, item_id) DO UPDATE SET quantity = quantity + 1
+        ''', (order_id, user_id, item_id))
+        return c.rowcount > 0
 
 
 def remove_cart_item(cart_item_id):
-    """Удалить позицию из корзины по ID записи."""
+    """Убрать одну порцию из строки корзины; последняя порция удаляет строку."""
     with get_connection() as conn:
-        conn.cursor().execute('DELETE FROM cart_items WHERE id = ?', (cart_item_id,))
+        c = conn.cursor()
+        c.execute('UPDATE cart_items SET quantity = quantity - 1 WHERE id = ? AND quantity > 1',
+                  (cart_item_id,))
+        if c.rowcount == 0:
+            c.execute('DELETE FROM cart_items WHERE id = ?', (cart_item_id,))
 
 
 def get_cart_items(order_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('''
-            SELECT ci.id as cart_id, ci.*, m.name, m.price, u.full_name
+            SELECT ci.id as cart_id, ci.user_id, ci.item_id, ci.quantity,
+                   ci.unit_price as price, ci.quantity * ci.unit_price as line_total,
+                   m.name, u.full_name
             FROM cart_items ci
             JOIN menu m ON ci.item_id = m.id
             LEFT JOIN users u ON ci.user_id = u.user_id
             WHERE ci.order_id = ?
+            ORDER BY ci.id
         ''', (order_id,))
         return [dict(row) for row in c.fetchall()]
 
 
 def get_order_total(order_id):
-    items = get_cart_items(order_id)
-    return sum(item['price'] for item in items)
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT COALESCE(SUM(ci.quantity * ci.unit_price), 0)
+            FROM cart_items ci
+            JOIN menu m ON ci.item_id = m.id
+            WHERE ci.order_id = ?
+        ''', (order_id,))
+        return c.fetchone()[0]
+
+
+def get_order_subtotals(order_id):
+    """Суммы по участникам: [{'user_id', 'full_name', 'items', 'total'}, ...]."""
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute('''
+            SELECT ci.user_id, u.full_name,
+                   SUM(ci.quantity) as items, SUM(ci.quantity * ci.unit_price) as total
+            FROM cart_items ci
+            JOIN menu m ON ci.item_id = m.id
+            LEFT JOIN users u ON ci.user_id = u.user_id
+            WHERE ci.order_id = ?
+            GROUP BY ci.user_id
+            ORDER BY MIN(ci.id)
+        ''', (order_id,))
+        return [dict(row) for row in c.fetchall()]
 
 
 def add_order_participant(order_id, user_id):
@@ -223,7 +313,7 @@ def add_order_participant(order_id, user_id):
 
 
 def get_order_participants(order_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('''
             SELECT op.*, u.full_name, u.username, u.user_id
@@ -235,7 +325,7 @@ def get_order_participants(order_id):
 
 
 def get_order_by_id(order_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM orders WHERE id = ?', (order_id,))
         row = c.fetchone()
@@ -243,7 +333,7 @@ def get_order_by_id(order_id):
 
 
 def get_order_by_booking_id(booking_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM orders WHERE booking_id = ? AND status="open"', (booking_id,))
         row = c.fetchone()
@@ -262,18 +352,32 @@ def add_user(user_id, username, full_name, phone_number=None, role='user'):
             INSERT OR IGNORE INTO users (user_id, username, full_name, phone_number, role)
             VALUES (?, ?, ?, ?, ?)
         ''', (user_id, username, full_name, phone_number, role))
+    users.invalidate(user_id)
 
 
-def get_user(user_id):
-    with get_connection() as conn:
+def _load_user(user_id):
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM users WHERE user_id = ?', (user_id,))
         row = c.fetchone()
     return dict(row) if row else None
 
 
+# get_user дёргается на каждом главном меню и почти в каждом хендлере
+users = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL)
+
+
+def get_user(user_id):
+    user = users.get_or_load(user_id, _load_user)
+    return dict(user) if user else None
+
+
+def get_user_cache_stats():
+    return users.stats()
+
+
 def get_all_users():
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM users')
         return [dict(row) for row in c.fetchall()]
@@ -282,11 +386,13 @@ def get_all_users():
 def update_user_phone(user_id, phone):
     with get_connection() as conn:
         conn.cursor().execute('UPDATE users SET phone_number = ? WHERE user_id = ?', (phone, user_id))
+    users.invalidate(user_id)
 
 
 def set_user_role(user_id, role):
     with get_connection() as conn:
         conn.cursor().execute('UPDATE users SET role = ? WHERE user_id = ?', (role, user_id))
+    users.invalidate(user_id)
 
 
 def delete_user(user_id):
@@ -294,11 +400,14 @@ def delete_user(user_id):
         c = conn.cursor()
         c.execute('PRAGMA foreign_keys = ON')
         c.execute('DELETE FROM bookings WHERE user_id = ?', (user_id,))
+        c.execute('DELETE FROM bookings_archive WHERE user_id = ?', (user_id,))
         c.execute('DELETE FROM users WHERE user_id = ?', (user_id,))
+    users.invalidate(user_id)
+    slots.clear()
 
 #  Столы
 def get_all_tables():
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         c.execute('SELECT * FROM tables')
         rows = c.fetchall()
@@ -321,14 +430,73 @@ def add_table(name, seats, neighbors_list=None):
         conn.cursor().execute(
             'INSERT INTO tables (name, seats, neighbors) VALUES (?, ?, ?)',
             (name, seats, json.dumps(neighbors_list)))
+    floor.invalidate()
+
+
+def import_tables(tables):
+    """Загрузить схему столов одной транзакцией (см. catalog.py).
+
+    Столы с существующим названием обновляются, остальные добавляются.
+    Соседи задаются именами и могут ссылаться на столы вне файла; связь
+    симметрична — у соседей загруженного стола он тоже становится соседом.
+    Неизвестный сосед — ValueError, и ничего не меняется.
+    Возвращает (добавлено, обновлено).
+    """
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('SELECT id, name FROM tables')
+        ids = {row['name']: row['id'] for row in c.fetchall()}
+        unknown = sorted({n for t in tables for n in t['neighbors']}
+                         - set(ids) - {t['name'] for t in tables})
+        if unknown:
+            raise ValueError(f"неизвестные соседи: {', '.join(unknown)}")
+        new = [t for t in tables if t['name'] not in ids]
+        old = [t for t in tables if t['name'] in ids]
+        c.executemany('INSERT INTO tables (name, seats) VALUES (:name, :seats)', new)
+        c.executemany('UPDATE tables SET seats = :seats WHERE name = :name', old)
+
+        c.execute('SELECT id, name, neighbors FROM tables')
+        rows = c.fetchall()
+        ids = {row['name']: row['id'] for row in rows}
+        graph = {row['id']: set(json.loads(row['neighbors'])) for row in rows}
+        before = {t_id: set(n) for t_id, n in graph.items()}
+        # Связи столов из файла задаются файлом целиком: сначала снимаем
+        # старые, потом ставим объявленные — в обе стороны
+        for t in tables:
+            t_id = ids[t['name']]
+            for n in graph[t_id]:
+                graph.get(n, set()).discard(t_id)
+            graph[t_id] = set()
+        for t in tables:
+            t_id = ids[t['name']]
+            for n in t['neighbors']:
+                graph[t_id].add(ids[n])
+                graph[ids[n]].add(t_id)
+        c.executemany('UPDATE tables SET neighbors = ? WHERE id = ?',
+                      [(json.dumps(sorted(n)), t_id) for t_id, n in graph.items()
+                       if n != before[t_id]])
+    floor.invalidate()
+    return len(new), len(old)
 
 
 def delete_table(t_id):
     with get_connection() as conn:
         c = conn.cursor()
         c.execute('PRAGMA foreign_keys = ON')
-        c.execute('DELETE FROM bookings WHERE table_id=?', (t_id,))
+        # Вместе с бронью компании уходят и её остальные столы. Компании
+        # собираются до удаления из обеих таблиц: пачка архивации могла
+        # разнести строки одной компании по горячей таблице и архиву
+        c.execute('SELECT json_group_array(party_id) FROM ('
+                  'SELECT party_id FROM bookings WHERE table_id=? AND party_id IS NOT NULL '
+                  'UNION SELECT party_id FROM bookings_archive WHERE table_id=? AND party_id IS NOT NULL)',
+                  (t_id, t_id))
+        parties = c.fetchone()[0]
+        for table in ('bookings', 'bookings_archive'):
+            c.execute(f'DELETE FROM {table} WHERE party_id {_IN_BATCH}', (parties,))
+            c.execute(f'DELETE FROM {table} WHERE table_id=?', (t_id,))
         c.execute('DELETE FROM tables WHERE id=?', (t_id,))
+    slots.clear()
+    floor.invalidate()
 
 
 def reset_all_tables():
@@ -336,51 +504,171 @@ def reset_all_tables():
         c = conn.cursor()
         c.execute('UPDATE tables SET status="free"')
         c.execute('UPDATE bookings SET status="cancelled" WHERE status="active"')
+    slots.clear()
 
 
 #  Брони
+def _load_day_bookings(booking_date):
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute(
+            'SELECT table_id, booking_time FROM bookings WHERE booking_date = ? AND status = "active"',
+            (booking_date,))
+        return c.fetchall()
+
+
+# Занятость столов по часам, см. availability.py
+slots = SlotIndex(_load_day_bookings)
+
+
+def _insert_booking(c, user_id, table_id, booking_date, booking_time, people_count, pre_order_sum):
+    c.execute('''
+        INSERT INTO bookings (user_id, table_id, booking_date, booking_time, people_count, pre_order_sum)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', (user_id, table_id, booking_date, booking_time, people_count, pre_order_sum))
+    return c.lastrowid
+
+
 def add_booking(user_id, table_id, booking_date, booking_time, people_count, pre_order_sum=0):
     with get_connection() as conn:
-        conn.cursor().execute('''
-            INSERT INTO bookings (user_id, table_id, booking_date, booking_time, people_count, pre_order_sum)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (user_id, table_id, booking_date, booking_time, people_count, pre_order_sum))
+        booking_id = _insert_booking(conn.cursor(), user_id, table_id, booking_date,
+                                     booking_time, people_count, pre_order_sum)
+    slots.book(table_id, booking_date, booking_time)
+    return booking_id
+
+
+def book_slot(user_id, table_id, booking_date, booking_time, people_count,
+              pre_order_sum=0, with_order=False, extra_tables=()):
+    """Занять слот одной транзакцией.
+
+    Уникальность активной брони на (стол, дата, время) гарантирует индекс
+    ux_bookings_active_slot. extra_tables — остальные столы компании: они
+    занимаются в той же транзакции строками с party_id основной брони
+    (у самой основной party_id = id), так что занят либо весь набор,
+    либо ничего. При with_order в той же транзакции создаётся совместный
+    заказ с инициатором в участниках.
+    Возвращает {'booking_id', 'order_id', 'link_uuid'} или None, если слот уже занят.
+    """
+    order_id = link = None
+    try:
+        with get_connection() as conn:
+            c = conn.cursor()
+            booking_id = _insert_booking(c, user_id, table_id, booking_date,
+                                         booking_time, people_count, pre_order_sum)
+            if extra_tables:
+                c.execute('UPDATE bookings SET party_id = id WHERE id = ?', (booking_id,))
+            # Гости и предзаказ записаны в основной брони
+            c.executemany('''
+                INSERT INTO bookings (user_id, table_id, booking_date, booking_time, people_count, party_id)
+                VALUES (?, ?, ?, ?, 0, ?)
+            ''', [(user_id, t_id, booking_date, booking_time, booking_id) for t_id in extra_tables])
+            if with_order:
+                order_id, link = _insert_order(c, user_id, booking_id)
+                c.execute('INSERT OR IGNORE INTO order_participants (order_id, user_id) VALUES (?, ?)',
+                          (order_id, user_id))
+    except sqlite3.IntegrityError:
+        logger.info("Слот занят: table=%s %s %s", [table_id, *extra_tables], booking_date, booking_time)
+        return None
+    for t_id in (table_id, *extra_tables):
+        slots.book(t_id, booking_date, booking_time)
+    return {"booking_id": booking_id, "order_id": order_id, "link_uuid": link}
 
 
 def get_active_booking(user_id):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
-        c.execute('''
+        c.execute(f'''
             SELECT b.*, t.name as table_name
             FROM bookings b
             JOIN tables t ON b.table_id = t.id
-            WHERE b.user_id = ? AND b.status = 'active'
+            WHERE b.user_id = ? AND b.status = 'active' AND {_MAIN_BOOKING}
             ORDER BY b.id DESC LIMIT 1
         ''', (user_id,))
         row = c.fetchone()
-    return dict(row) if row else None
+        return _with_party_tables(c, [dict(row)])[0] if row else None
 
 
 def get_all_bookings_full():
-    with get_connection() as conn:
+    """Все брони, включая архивные."""
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
-        c.execute('''
+        c.execute(f'''
             SELECT b.id, b.booking_date, b.booking_time, b.people_count, b.status,
-                   b.pre_order_sum,
+                   b.pre_order_sum, b.party_id,
                    u.full_name as user_name, u.phone_number,
                    t.name as table_name
-            FROM bookings b
+            FROM {_ALL_BOOKINGS} b
             LEFT JOIN users u ON b.user_id = u.user_id
             LEFT JOIN tables t ON b.table_id = t.id
+            WHERE {_MAIN_BOOKING}
             ORDER BY b.created_at DESC
         ''')
-        return [dict(row) for row in c.fetchall()]
+        return _with_party_tables(c, [dict(row) for row in c.fetchall()])
+
+
+def get_bookings_page(status='active', date_from=None, date_to=None,
+                      after=None, limit=10, with_contacts=False):
+    """Страница броней с фильтрами в SQL и постраничностью по ключу.
+
+    Порядок — (booking_date, id); after — курсор (booking_date, id) последней
+    строки предыдущей страницы. with_contacts добавляет телефон и предзаказ.
+    Неактивные брони читаются и из архива, если период до него дотягивается;
+    активные списки — это предстоящие брони, они всегда в горячей таблице.
+    Возвращает (строки, курсор следующей страницы или None).
+    """
+    columns = ("b.id, b.booking_date, b.booking_time, b.people_count, b.party_id, "
+               "u.full_name as user_name, t.name as table_name")
+    if with_contacts:
+        columns += ", u.phone_number, b.pre_order_sum"
+    where, params = [_MAIN_BOOKING], []
+    if status:
+        where.append('b.status = ?')
+        params.append(status)
+    if date_from:
+        where.append('b.booking_date >= ?')
+        params.append(date_from)
+    if date_to:
+        where.append('b.booking_date <= ?')
+        params.append(date_to)
+    if after:
+        where.append("(COALESCE(b.booking_date, ''), b.id) > (?, ?)")
+        params.extend(after)
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        source = 'bookings'
+        if status != 'active':
+            c.execute('SELECT MAX(booking_date) FROM bookings_archive')
+            horizon = c.fetchone()[0]
+            if horizon is not None and (not date_from or date_from <= horizon):
+                source = _ALL_BOOKINGS
+        sql = f'''
+            SELECT {columns}
+            FROM {source} b
+            LEFT JOIN users u ON b.user_id = u.user_id
+            LEFT JOIN tables t ON b.table_id = t.id
+            WHERE {" AND ".join(where)}
+            ORDER BY COALESCE(b.booking_date, ''), b.id
+            LIMIT ?
+        '''
+        c.execute(sql, (*params, limit + 1))
+        rows = _with_party_tables(c, [dict(row) for row in c.fetchall()])
+    if len(rows) <= limit:
+        return rows, None
+    last = rows[limit - 1]
+    return rows[:limit], (last['booking_date'] or '', last['id'])
 
 
 def delete_booking(booking_id):
+    """Удалить бронь; бронь компании — вместе со всеми её столами."""
     with get_connection() as conn:
         c = conn.cursor()
-        c.execute('DELETE FROM bookings WHERE id=?', (booking_id,))
+        c.execute('SELECT table_id, booking_date, booking_time, status FROM bookings '
+                  'WHERE id=? OR party_id=?', (booking_id, booking_id))
+        rows = c.fetchall()
+        c.execute('DELETE FROM bookings WHERE id=? OR party_id=?', (booking_id, booking_id))
+    for row in rows:
+        if row['status'] == 'active':
+            slots.release(row['table_id'], row['booking_date'], row['booking_time'])
 
 
 def cancel_booking(user_id):
@@ -388,12 +676,19 @@ def cancel_booking(user_id):
     if not booking:
         return False
     with get_connection() as conn:
-        conn.cursor().execute('UPDATE bookings SET status="cancelled" WHERE id = ?', (booking['id'],))
+        c = conn.cursor()
+        c.execute('SELECT table_id FROM bookings WHERE id = ? OR party_id = ?',
+                  (booking['id'], booking['id']))
+        table_ids = [row['table_id'] for row in c.fetchall()]
+        c.execute('UPDATE bookings SET status="cancelled" WHERE id = ? OR party_id = ?',
+                  (booking['id'], booking['id']))
+    for t_id in table_ids:
+        slots.release(t_id, booking['booking_date'], booking['booking_time'])
     return True
 
 
 def get_table_bookings(table_id, booking_date=None):
-    with get_connection() as conn:
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
         if booking_date:
             c.execute(
@@ -406,57 +701,259 @@ def get_table_bookings(table_id, booking_date=None):
         return [row['booking_time'] for row in c.fetchall()]
 
 
+def get_free_slots(table_id, booking_date):
+    """Свободные часы стола на дату (по индексу занятости, без SQL)."""
+    return slots.free_hours(table_id, booking_date)
+
+
+def get_free_tables(booking_date, hour, min_seats=1):
+    """Столы, где хватает мест и свободен слот hour."""
+    tables = get_all_tables()
+    fits = [t_id for t_id, t in tables.items() if t['seats'] >= min_seats]
+    return {t_id: tables[t_id] for t_id in slots.free_tables(booking_date, hour, fits)}
+
+
+# Схема зала для подбора столов компании, см. seating.py
+floor = Snapshot(lambda: Floor(get_all_tables()))
+
+
+def find_party_tables(booking_date, hour, people, max_tables=SEATING_MAX_TABLES):
+    """Наименьший набор соседних столов, свободных в hour, на people гостей.
+
+    Возвращает {'table_ids', 'label', 'seats'} или None.
+    """
+    plan = floor.get()
+    free = slots.free_tables(booking_date, hour, list(plan.seats))
+    table_ids = plan.combine(people, free, max_tables)
+    if table_ids is None:
+        return None
+    return {"table_ids": table_ids, "label": plan.label(table_ids),
+            "seats": sum(plan.seats[t] for t in table_ids)}
+
+
+def get_party_hours(booking_date, people, max_tables=SEATING_MAX_TABLES):
+    """Часы, в которые компанию можно посадить за соседние столы."""
+    plan = floor.get()
+    return [h for h in range(WORKING_HOURS_START, WORKING_HOURS_END)
+            if plan.combine(people, slots.free_tables(booking_date, h, list(plan.seats)),
+                            max_tables) is not None]
+
+
+def _with_party_tables(c, rows):
+    """Дописать к table_name броней компаний остальные их столы.
+
+    Компанию видно по самой строке (party_id = id), обычные брони
+    лишних запросов не делают. Горячая таблица и архив читаются
+    отдельно, каждая по своему индексу party_id.
+    """
+    by_id = {row['id']: row for row in rows if row['party_id']}
+    if not by_id:
+        return rows
+    batch = json.dumps(list(by_id))
+    for table in ('bookings', 'bookings_archive'):
+        c.execute(f'''
+            SELECT b.party_id, t.name
+            FROM {table} b
+            JOIN tables t ON b.table_id = t.id
+            WHERE b.party_id {_IN_BATCH} AND b.id != b.party_id
+            ORDER BY b.id
+        ''', (batch,))
+        for party_id, name in c.fetchall():
+            by_id[party_id]['table_name'] = f"{by_id[party_id]['table_name']} + {name}"
+    return rows
+
+
 def get_user_bookings_history(user_id, limit=10):
-    """История броней пользователя."""
-    with get_connection() as conn:
+    """История броней пользователя; не хватило свежих — добираем из архива."""
+    sql = f'''
+        SELECT b.*, t.name as table_name
+        FROM {{}} b
+        JOIN tables t ON b.table_id = t.id
+        WHERE b.user_id = ? AND {_MAIN_BOOKING}
+        ORDER BY b.created_at DESC
+        LIMIT ?
+    '''
+    with get_connection(readonly=True) as conn:
         c = conn.cursor()
-        c.execute('''
-            SELECT b.*, t.name as table_name
-            FROM bookings b
-            JOIN tables t ON b.table_id = t.id
-            WHERE b.user_id = ?
-            ORDER BY b.created_at DESC
-            LIMIT ?
-        ''', (user_id, limit))
-        return [dict(row) for row in c.fetchall()]
+        c.execute(sql.format('bookings'), (user_id, limit))
+        rows = [dict(row) for row in c.fetchall()]
+        if len(rows) < limit:
+            c.execute(sql.format('bookings_archive'), (user_id, limit - len(rows)))
+            rows += [dict(row) for row in c.fetchall()]
+        return _with_party_tables(c, rows)
 
 
-#  Статистика
-def get_stats():
+#  Архив
+# Брони с датой раньше границы и закрытые заказы, созданные раньше неё,
+# переезжают в *_archive (миграция v11). Горячие таблицы остаются
+# маленькими; история и отчёты читают архив сами, когда нужно.
+_BOOKING_COLUMNS = ('id, user_id, table_id, booking_date, booking_time, people_count, '
+                    'pre_order_sum, status, created_at, party_id')
+_ALL_BOOKINGS = (f'(SELECT {_BOOKING_COLUMNS} FROM bookings '
+                 f'UNION ALL SELECT {_BOOKING_COLUMNS} FROM bookings_archive)')
+_IN_BATCH = 'IN (SELECT value FROM json_each(?))'
+# Основная строка брони: обычная бронь или первый стол компании
+_MAIN_BOOKING = '(b.party_id IS NULL OR b.party_id = b.id)'
+
+
+def _move(c, table, columns, where, batch):
+    c.execute(f'INSERT INTO {table}_archive ({columns}) '
+              f'SELECT {columns} FROM {table} WHERE {where} {_IN_BATCH}', (batch,))
+    c.execute(f'DELETE FROM {table} WHERE {where} {_IN_BATCH}', (batch,))
+
+
+def archive_bookings(before_date, batch_size=500):
+    """Перенести в архив пачку броней с booking_date < before_date.
+
+    Активные брони прошедших дней уходят в архив со статусом 'completed'.
+    Возвращает число перенесённых; меньше batch_size — старых больше нет.
+    """
     with get_connection() as conn:
         c = conn.cursor()
+        c.execute('SELECT id FROM bookings WHERE booking_date < ? LIMIT ?',
+                  (before_date, batch_size))
+        ids = [row['id'] for row in c.fetchall()]
+        if ids:
+            batch = json.dumps(ids)
+            c.execute(f"UPDATE bookings SET status = 'completed' "
+                      f"WHERE status = 'active' AND id {_IN_BATCH}", (batch,))
+            _move(c, 'bookings', _BOOKING_COLUMNS, 'id', batch)
+    # Индекс занятости не трогаем: прошедшие дни уже не бронируются
+    return len(ids)
+
+
+def archive_orders(before_date, batch_size=500):
+    """Перенести в архив пачку закрытых заказов, созданных раньше before_date,
+    вместе с корзинами и участниками. Открытые заказы не трогаются."""
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute("SELECT id FROM orders WHERE status = 'closed' AND created_at < ? LIMIT ?",
+                  (before_date, batch_size))
+        ids = [row['id'] for row in c.fetchall()]
+        if ids:
+            batch = json.dumps(ids)
+            _move(c, 'cart_items', 'id, order_id, user_id, item_id, quantity, unit_price',
+                  'order_id', batch)
+            _move(c, 'order_participants', 'id, order_id, user_id, joined_at', 'order_id', batch)
+            _move(c, 'orders', 'id, link_uuid, initiator_id, booking_id, status, created_at',
+                  'id', batch)
+    return len(ids)
+
+
+#  Кэши между процессами
+_seen_epochs = None
+
+
+def sync_caches():
+    """Сбросить кэши процесса, если таблицы под ними менялись (в том числе
+    другими процессами — см. cache_epoch, миграция v9)."""
+    global _seen_epochs
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute('SELECT menu, users, bookings, tables FROM cache_epoch WHERE id = 1')
+        epochs = dict(c.fetchone())
+    seen, _seen_epochs = _seen_epochs, epochs
+    if seen is None:
+        return
+    if epochs['menu'] != seen['menu']:
+        menu.invalidate()
+    if epochs['users'] != seen['users']:
+        users.clear()
+    if epochs['bookings'] != seen['bookings'] or epochs['tables'] != seen['tables']:
+        slots.clear()
+    if epochs['tables'] != seen['tables']:
+        floor.invalidate()
+
+
+#  Состояния FSM
+def fsm_load(key):
+    """(state, data_json) диалога или None."""
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute('SELECT state, data FROM fsm_storage WHERE key = ?', (key,))
+        row = c.fetchone()
+    return (row['state'], row['data']) if row else None
 
-        c.execute('SELECT count(*) FROM users')
-        users_count = c.fetchone()[0]
 
-        c.execute('SELECT count(*) FROM bookings WHERE status = "active"')
-        active_bookings = c.fetchone()[0]
+def fsm_save(records):
+    """Записать пачку [(key, state, data_json), ...] одной транзакцией.
 
-        c.execute('SELECT count(*) FROM bookings')
-        total_bookings = c.fetchone()[0]
+    Пустые записи (нет состояния и данных) удаляются.
+    """
+    empty = [(key,) for key, state, data in records if state is None and data == '{}']
+    filled = [r for r in records if not (r[1] is None and r[2] == '{}')]
+    with get_connection() as conn:
+        c = conn.cursor()
+        if empty:
+            c.executemany('DELETE FROM fsm_storage WHERE key = ?', empty)
+        if filled:
+            c.executemany('''
+                INSERT INTO fsm_storage (key, state, data) VALUES (?, ?, ?)
+                ON CONFLICT(key) DO UPDATE SET
+                    state = excluded.state, data = excluded.data, updated_at = CURRENT_TIMESTAMP
+            ''', filled)
+
+
+#  Медиа
+def get_media_file_id(content_hash):
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute('SELECT file_id FROM media_files WHERE content_hash = ?', (content_hash,))
+        row = c.fetchone()
+    return row['file_id'] if row else None
 
-        c.execute('SELECT count(*) FROM orders WHERE status = "open"')
-        open_orders = c.fetchone()[0]
 
-        c.execute('SELECT count(*) FROM orders WHERE status = "closed"')
-        closed_orders = c.fetchone()[0]
+def save_media_file_id(content_hash, file_id):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('''
+            INSERT INTO media_files (content_hash, file_id) VALUES (?, ?)
+            ON CONFLICT(content_hash) DO UPDATE SET
+                file_id = excluded.file_id, uploaded_at = CURRENT_TIMESTAMP
+        ''', (content_hash, file_id))
+
+
+def forget_media_file_id(content_hash):
+    with get_connection() as conn:
+        c = conn.cursor()
+        c.execute('DELETE FROM media_files WHERE content_hash = ?', (content_hash,))
 
-        c.execute('SELECT COALESCE(SUM(pre_order_sum), 0) FROM bookings WHERE status = "active"')
-        preorder_sum = c.fetchone()[0]
 
-        c.execute('SELECT count(*) FROM menu')
-        menu_count = c.fetchone()[0]
+#  Статистика
+# Счётчики в таблице stats поддерживаются триггерами (миграция v5)
+STATS_FIELDS = (
+    "users", "active_bookings", "total_bookings", "open_orders",
+    "closed_orders", "preorder_sum", "menu_count", "tables_count",
+)
 
-        c.execute('SELECT count(*) FROM tables')
-        tables_count = c.fetchone()[0]
 
-    return {
-        "users": users_count,
-        "active_bookings": active_bookings,
-        "total_bookings": total_bookings,
-        "open_orders": open_orders,
-        "closed_orders": closed_orders,
-        "preorder_sum": preorder_sum,
-        "menu_count": menu_count,
-        "tables_count": tables_count,
-    }
+def get_stats():
+    with get_connection(readonly=True) as conn:
+        c = conn.cursor()
+        c.execute(f'SELECT {", ".join(STATS_FIELDS)} FROM stats WHERE id = 1')
+        row = c.fetchone()
+    return dict(row) if row else dict.fromkeys(STATS_FIELDS, 0)
+
+
+def reconcile_stats():
+    """Пересчитать счётчики stats с нуля: по одному проходу на таблицу."""
+    with get_connection() as conn:
+        conn.cursor().execute(f'''
+            UPDATE stats SET
+                users = (SELECT count(*) FROM users),
+                (total_bookings, active_bookings, preorder_sum) = (
+                    SELECT count(*) + (SELECT count(*) FROM bookings_archive b
+                                       WHERE {_MAIN_BOOKING}),
+                           COALESCE(SUM(status = 'active'), 0),
+                           COALESCE(SUM(CASE WHEN status = 'active' THEN pre_order_sum END), 0)
+                    FROM bookings b WHERE {_MAIN_BOOKING}),
+                (open_orders, closed_orders) = (
+                    SELECT COALESCE(SUM(status = 'open'), 0),
+                           COALESCE(SUM(status = 'closed'), 0)
+                               + (SELECT count(*) FROM orders_archive)
+                    FROM orders),
+                menu_count = (SELECT count(*) FROM menu),
+                tables_count = (SELECT count(*) FROM tables)
+            WHERE id = 1
+        ''')
+    return get_stats()
@@ -1,12 +1,17 @@
 
+import html
 import logging
+import sqlite3
 from aiogram import Router, F
-from aiogram.types import CallbackQuery, Message, InlineKeyboardButton
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import CallbackQuery, Message, InlineKeyboardButton, BufferedInputFile
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-import database as db
-from utils import make_kb, back_button, format_date
+import async_db as db
+import catalog
+from config import BOOKINGS_PER_PAGE, IMPORT_MAX_BYTES
+from utils import make_kb, back_button, cancel_row, format_date, cursor_data, parse_cursor, cached_kb
 from .profile import is_admin
 
 logger = logging.getLogger(__name__)
@@ -18,6 +23,8 @@ class AdminStates(StatesGroup):
     waiting_for_seats = State()
     waiting_for_menu_name = State()
     waiting_for_menu_price = State()
+    waiting_for_menu_file = State()
+    waiting_for_tables_file = State()
 
 
 #Главное меню админки
@@ -25,7 +32,7 @@ class AdminStates(StatesGroup):
 async def admin_menu_handler(callback: CallbackQuery):
     if not is_admin(callback.from_user.id):
         return
-    kb = make_kb([
+    kb = cached_kb(("admin_menu",), lambda: [
         [InlineKeyboardButton(text="🍔 Управление меню", callback_data="adm_menu_mgmt")],
         [InlineKeyboardButton(text="🪑 Управление столами", callback_data="adm_tables")],
         [InlineKeyboardButton(text="👥 Пользователи", callback_data="adm_users")],
@@ -39,7 +46,7 @@ async def admin_menu_handler(callback: CallbackQuery):
 #Меню
 @router.callback_query(F.data == "adm_menu_mgmt")
 async def adm_menu_mgmt(callback: CallbackQuery):
-    items = db.get_all_menu_items()
+    items = await db.get_all_menu_items()
     kb = []
 
     if items:
@@ -54,6 +61,11 @@ async def adm_menu_mgmt(callback: CallbackQuery):
             ])
 
     kb.append([InlineKeyboardButton(text="➕ Добавить позицию", callback_data="adm_add_menu")])
+    kb.append([InlineKeyboardButton(text="📥 Загрузить файлом", callback_data="adm_import_menu")])
+    kb.append([
+        InlineKeyboardButton(text="📤 CSV", callback_data="adm_export_menu_csv"),
+        InlineKeyboardButton(text="📤 JSON", callback_data="adm_export_menu_json"),
+    ])
     kb.append(back_button("admin_menu"))
 
     text = f"🍔 <b>Меню</b> ({len(items)} поз.)\n\nНажмите 🗑 для удаления."
@@ -63,8 +75,8 @@ async def adm_menu_mgmt(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("adm_del_menu_"))
 async def adm_del_menu(callback: CallbackQuery):
     item_id = int(callback.data.split("_")[3])
-    item = db.get_menu_item(item_id)
-    db.delete_menu_item(item_id)
+    item = await db.get_menu_item(item_id)
+    await db.delete_menu_item(item_id)
     await callback.answer(f"🗑 {item['name']} удалено" if item else "Удалено")
     logger.info("Удалена позиция меню id=%s", item_id)
     await adm_menu_mgmt(callback)
@@ -89,7 +101,7 @@ async def adm_menu_price(message: Message, state: FSMContext):
         await message.answer("⚠️ Введите число, например: 500")
         return
     data = await state.get_data()
-    db.add_menu_item(data['m_name'], int(message.text))
+    await db.add_menu_item(data['m_name'], int(message.text))
     await message.answer(f"✅ Блюдо «{data['m_name']}» добавлено!")
     await state.clear()
     logger.info("Добавлено блюдо: %s", data['m_name'])
@@ -98,7 +110,7 @@ async def adm_menu_price(message: Message, state: FSMContext):
 #Столы
 @router.callback_query(F.data == "adm_tables")
 async def adm_tables(callback: CallbackQuery):
-    tables = db.get_all_tables()
+    tables = await db.get_all_tables()
     kb = []
 
     for t_id, data in sorted(tables.items(), key=lambda x: x[1]['name']):
@@ -112,6 +124,11 @@ async def adm_tables(callback: CallbackQuery):
         ])
 
     kb.append([InlineKeyboardButton(text="➕ Добавить стол", callback_data="adm_add_tbl")])
+    kb.append([InlineKeyboardButton(text="📥 Загрузить файлом", callback_data="adm_import_tables")])
+    kb.append([
+        InlineKeyboardButton(text="📤 CSV", callback_data="adm_export_tables_csv"),
+        InlineKeyboardButton(text="📤 JSON", callback_data="adm_export_tables_json"),
+    ])
     kb.append([InlineKeyboardButton(text="🔄 Сбросить все столы", callback_data="adm_reset")])
     kb.append(back_button("admin_menu"))
 
@@ -123,7 +140,7 @@ async def adm_tables(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("adm_del_tbl_"))
 async def adm_del_tbl(callback: CallbackQuery):
     t_id = int(callback.data.split("_")[3])
-    db.delete_table(t_id)
+    await db.delete_table(t_id)
     await callback.answer("🗑 Стол удалён")
     logger.info("Удалён стол id=%s", t_id)
     await adm_tables(callback)
@@ -131,7 +148,7 @@ async def adm_del_tbl(callback: CallbackQuery):
 
 @router.callback_query(F.data == "adm_reset")
 async def adm_reset(callback: CallbackQuery):
-    db.reset_all_tables()
+    await db.reset_all_tables()
     await callback.answer("🔄 Все столы сброшены, брони отменены")
     logger.info("Сброс всех столов")
 
@@ -155,17 +172,111 @@ async def adm_ts(message: Message, state: FSMContext):
         await message.answer("⚠️ Введите число.")
         return
     data = await state.get_data()
-    db.add_table(data['name'], int(message.text))
+    await db.add_table(data['name'], int(message.text))
     await message.answer(f"✅ Стол «{data['name']}» добавлен!")
     await state.clear()
     logger.info("Добавлен стол: %s", data['name'])
 
 
+#Загрузка и выгрузка файлом (catalog.py)
+_IMPORT_HELP = {
+    "menu": (
+        "📥 <b>Загрузка меню</b>\n\n"
+        "Пришлите файл .csv или .json с полями "
+        "<code>name, price, description, category</code>.\n"
+        "Позиции с существующим названием обновятся, остальные добавятся.\n"
+        "Образец — выгрузка текущего меню (📤)."),
+    "tables": (
+        "📥 <b>Загрузка столов</b>\n\n"
+        "Пришлите файл .csv или .json с полями <code>name, seats, neighbors</code>; "
+        "соседи — названия столов, в CSV через «|».\n"
+        "Столы с существующим названием обновятся, остальные добавятся.\n"
+        "Образец — выгрузка текущей схемы (📤)."),
+}
+
+
+@router.callback_query(F.data.in_({"adm_import_menu", "adm_import_tables"}))
+async def adm_import_start(callback: CallbackQuery, state: FSMContext):
+    if not is_admin(callback.from_user.id):
+        return
+    kind = callback.data.removeprefix("adm_import_")
+    await callback.message.edit_text(
+        _IMPORT_HELP[kind], reply_markup=make_kb([cancel_row()]), parse_mode="HTML")
+    await state.set_state(
+        AdminStates.waiting_for_menu_file if kind == "menu" else AdminStates.waiting_for_tables_file)
+
+
+@router.message(AdminStates.waiting_for_menu_file, F.document)
+@router.message(AdminStates.waiting_for_tables_file, F.document)
+async def adm_import_file(message: Message, state: FSMContext):
+    if not is_admin(message.from_user.id):
+        return
+    doc = message.document
+    filename = doc.file_name or ""
+    if not filename.lower().endswith((".csv", ".json")):
+        await message.answer("⚠️ Нужен файл .csv или .json.")
+        return
+    if doc.file_size and doc.file_size > IMPORT_MAX_BYTES:
+        await message.answer(f"⚠️ Файл больше {IMPORT_MAX_BYTES // 1024} КБ.")
+        return
+
+    data = (await message.bot.download(doc)).getvalue()
+    tables = await state.get_state() == AdminStates.waiting_for_tables_file.state
+    try:
+        if tables:
+            added, updated = await db.import_tables(catalog.parse_tables(data, filename))
+        else:
+            added, updated = await db.import_menu(catalog.parse_menu(data, filename))
+    except (ValueError, sqlite3.Error) as e:
+        # Состояние не сбрасываем — можно сразу прислать исправленный файл
+        if isinstance(e, catalog.CatalogError):
+            errors = e.errors
+        elif isinstance(e, sqlite3.Error):
+            logger.warning("Загрузка %s из %s: ошибка БД: %s",
+                           "столов" if tables else "меню", filename, e)
+            errors = [f"ошибка базы данных: {e}"]
+        else:
+            errors = [str(e)]
+        text = "⚠️ <b>Файл не загружен</b>, ничего не изменено:\n" + "\n".join(
+            f"• {html.escape(err)}" for err in errors[:catalog.MAX_ERRORS])
+        if len(errors) > catalog.MAX_ERRORS:
+            text += f"\n…и ещё {len(errors) - catalog.MAX_ERRORS}"
+        await message.answer(text, parse_mode="HTML")
+        return
+
+    await state.clear()
+    back = "adm_tables" if tables else "adm_menu_mgmt"
+    await message.answer(
+        f"✅ Загружено из «{html.escape(filename)}»: добавлено {added}, обновлено {updated}.",
+        reply_markup=make_kb([back_button(back)]), parse_mode="HTML")
+    logger.info("Загрузка %s из %s: добавлено %s, обновлено %s",
+                "столов" if tables else "меню", filename, added, updated)
+
+
+@router.message(AdminStates.waiting_for_menu_file)
+@router.message(AdminStates.waiting_for_tables_file)
+async def adm_import_not_file(message: Message):
+    await message.answer("Пришлите файл .csv или .json документом.")
+
+
+@router.callback_query(F.data.startswith("adm_export_"))
+async def adm_export(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        return
+    _, _, kind, fmt = callback.data.split("_")
+    if kind == "menu":
+        data = catalog.dump_menu(await db.get_all_menu_items(), fmt)
+    else:
+        data = catalog.dump_tables(await db.get_all_tables(), fmt)
+    await callback.message.answer_document(BufferedInputFile(data, filename=f"{kind}.{fmt}"))
+    await callback.answer()
+
+
 #Пользователи
 
 @router.callback_query(F.data == "adm_users")
 async def adm_users(callback: CallbackQuery):
-    users = db.get_all_users()
+    users = await db.get_all_users()
     kb = []
     for u in users:
         role_icon = "👮‍♂️" if u['role'] == 'employee' else "👤"
@@ -183,9 +294,9 @@ async def adm_users(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("adm_user_"))
 async def adm_promote(callback: CallbackQuery):
     user_id = int(callback.data.split("_")[2])
-    user = db.get_user(user_id)
+    user = await db.get_user(user_id)
     new_role = 'employee' if user['role'] != 'employee' else 'user'
-    db.set_user_role(user_id, new_role)
+    await db.set_user_role(user_id, new_role)
     role_text = "сотрудник" if new_role == 'employee' else "гость"
     await callback.answer(f"Роль изменена: {role_text}")
     logger.info("Роль user=%s изменена на %s", user_id, new_role)
@@ -194,12 +305,13 @@ async def adm_promote(callback: CallbackQuery):
 
 #Брони (админка)
 
-@router.callback_query(F.data == "adm_bookings")
+@router.callback_query(F.data.startswith("adm_bookings"))
 async def adm_bookings(callback: CallbackQuery):
-    bks = db.get_all_bookings_full()
-    active = [b for b in bks if b['status'] == 'active']
+    cursor = parse_cursor(callback.data, "adm_bookings")
+    active, next_cursor = await db.get_bookings_page(after=cursor, limit=BOOKINGS_PER_PAGE)
+    s = await db.get_stats()
 
-    text = f"📅 <b>Все брони</b> (всего: {len(bks)}, активных: {len(active)})\n\n"
+    text = f"📅 <b>Все брони</b> (всего: {s['total_bookings']}, активных: {s['active_bookings']})\n\n"
 
     if not active:
         text += "Нет активных броней."
@@ -216,6 +328,10 @@ async def adm_bookings(callback: CallbackQuery):
         kb.append([InlineKeyboardButton(
             text=f"❌ Удалить #{b['id']}  {b.get('table_name','')}",
             callback_data=f"adm_del_book_{b['id']}")])
+    if next_cursor:
+        kb.append([InlineKeyboardButton(text="➡ Дальше", callback_data=cursor_data("adm_bookings", next_cursor))])
+    if cursor:
+        kb.append([InlineKeyboardButton(text="⏮ В начало", callback_data="adm_bookings")])
     kb.append(back_button("admin_menu"))
 
     await callback.message.edit_text(text, reply_markup=make_kb(kb), parse_mode="HTML")
@@ -224,7 +340,7 @@ async def adm_bookings(callback: CallbackQuery):
 @router.callback_query(F.data.startswith("adm_del_book_"))
 async def adm_del_booking(callback: CallbackQuery):
     booking_id = int(callback.data.split("_")[3])
-    db.delete_booking(booking_id)
+    await db.delete_booking(booking_id)
     await callback.answer(f"🗑 Бронь #{booking_id} удалена")
     logger.info("Удалена бронь id=%s", booking_id)
     await adm_bookings(callback)
@@ -233,7 +349,7 @@ async def adm_del_booking(callback: CallbackQuery):
 #Статистика
 @router.callback_query(F.data == "adm_stats")
 async def adm_stats(callback: CallbackQuery):
-    s = db.get_stats()
+    s = await db.get_stats()
     text = (
         "📊 <b>Статистика</b>\n\n"
         f"👥 Пользователей: {s['users']}\n"
@@ -245,5 +361,21 @@ async def adm_stats(callback: CallbackQuery):
         f"📦 Открытых заказов: {s['open_orders']}\n"
         f"✅ Завершённых заказов: {s['closed_orders']}"
     )
-    await callback.message.edit_text(
-        text, reply_markup=make_kb([back_button("admin_menu")]), parse_mode="HTML")
+    kb = make_kb([
+        [InlineKeyboardButton(text="🔄 Пересчитать", callback_data="adm_stats_reconcile")],
+        back_button("admin_menu"),
+    ])
+    await callback.message.edit_text(text, reply_markup=kb, parse_mode="HTML")
+
+
+@router.callback_query(F.data == "adm_stats_reconcile")
+async def adm_stats_reconcile(callback: CallbackQuery):
+    if not is_admin(callback.from_user.id):
+        return
+    await db.reconcile_stats()
+    await callback.answer("Счётчики пересчитаны")
+    logger.info("Статистика пересчитана")
+    try:
+        await adm_stats(callback)
+    except TelegramBadRequest:
+        pass  # цифры не изменились — Telegram отказывается редактировать
@@ -1,16 +1,22 @@
 import logging
 from datetime import datetime, timedelta
 from aiogram import Router, F
-from aiogram.types import Message, CallbackQuery, InlineKeyboardButton, FSInputFile
+from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-import database as db
+import async_db as db
+from availability import slot_label
+from media import answer_photo
 from config import (
     TABLE_PHOTO_PATH, MAX_BOOKING_DAYS,
     WORKING_HOURS_START, WORKING_HOURS_END, SHARED_ORDER_THRESHOLD,
+    BOOKINGS_PER_PAGE,
+)
+from utils import (
+    make_kb, cancel_row, back_button, format_date, cursor_data, parse_cursor, order_link, cached_kb,
+    DAY_NAMES, MONTH_NAMES,
 )
-from utils import make_kb, cancel_row, back_button, format_date, DAY_NAMES, MONTH_NAMES
 
 from .profile import get_main_kb, is_employee, is_admin
 
@@ -31,24 +37,27 @@ class BookingStates(StatesGroup):
 @router.callback_query(F.data == "start_booking")
 async def booking_start(callback: CallbackQuery, state: FSMContext):
     await callback.message.delete()
-    photo = FSInputFile(TABLE_PHOTO_PATH)
-    await callback.message.answer_photo(photo, caption="Схема столов")
+    await answer_photo(callback.message, TABLE_PHOTO_PATH, caption="Схема столов")
+
+    # Список дат меняется раз в сутки — ключ по сегодняшнему дню
+    today = datetime.now().date()
+    kb = cached_kb(("dates", today), lambda: _date_rows(today))
+    await callback.message.answer("📅 Выберите дату бронирования:", reply_markup=kb)
+    await state.set_state(BookingStates.waiting_for_date)
 
-    now = datetime.now()
+
+def _date_rows(today):
     buttons = []
     for i in range(1, MAX_BOOKING_DAYS + 1):
-        day = now + timedelta(days=i)
+        day = today + timedelta(days=i)
         day_name = DAY_NAMES[day.weekday()]
         month_name = MONTH_NAMES[day.month - 1]
         date_str = day.strftime("%Y-%m-%d")
         buttons.append([InlineKeyboardButton(
             text=f"{day_name}, {day.day} {month_name}",
             callback_data=f"bdate_{date_str}")])
-
     buttons.append(cancel_row())
-    await callback.message.answer(
-        "📅 Выберите дату бронирования:", reply_markup=make_kb(buttons))
-    await state.set_state(BookingStates.waiting_for_date)
+    return buttons
 
 
 #Дата выбрана → кол-во людей
@@ -71,9 +80,9 @@ async def booking_people(message: Message, state: FSMContext):
     if count < 1:
         await message.answer("⚠️ Минимум 1 человек.")
         return
-    await state.update_data(people_count=count)
+    await state.update_data(people_count=count, table_ids=None, tables_label=None)
 
-    tables = db.get_all_tables()
+    tables = await db.get_all_tables()
     buttons = []
     for t_id, data in sorted(tables.items(), key=lambda x: x[1]['name']):
         if data['seats'] >= count:
@@ -82,8 +91,17 @@ async def booking_people(message: Message, state: FSMContext):
                 callback_data=f"book_tbl_{t_id}")])
 
     if not buttons:
+        # Одного стола не хватает — сажаем за соседние (seating.py)
+        data = await state.get_data()
+        hours = await db.get_party_hours(data['booking_date'], count)
+        if hours:
+            await message.answer(
+                f"За один стол {count} гостей не поместятся — подберём соседние столы.\n"
+                "Выберите время:", reply_markup=_hours_kb(hours, "ptime_"))
+            await state.set_state(BookingStates.waiting_for_time)
+            return
         await message.answer("😔 Нет подходящих столов для такого количества гостей.",
-                             reply_markup=get_main_kb(message.from_user.id))
+                             reply_markup=await get_main_kb(message.from_user.id))
         await state.clear()
         return
 
@@ -96,32 +114,51 @@ async def booking_people(message: Message, state: FSMContext):
 @router.callback_query(F.data.startswith("book_tbl_"))
 async def booking_tbl(callback: CallbackQuery, state: FSMContext):
     t_id = int(callback.data.split("_")[2])
-    await state.update_data(table_id=t_id)
+    await state.update_data(table_id=t_id, table_ids=None, tables_label=None)
 
     data = await state.get_data()
     booking_date = data.get('booking_date')
-    booked_times = db.get_table_bookings(t_id, booking_date)
+    free_hours = await db.get_free_slots(t_id, booking_date)
+
+    if not free_hours:
+        await callback.message.edit_text(
+            "😔 Все слоты на этот день заняты. Попробуйте другую дату.",
+            reply_markup=make_kb([back_button("start_booking", "🔙 Выбрать дату")]))
+        return
 
+    pretty_date = data.get('pretty_date', '')
+    await callback.message.edit_text(
+        f"📅 Дата: {pretty_date}\nВыберите время:", reply_markup=_hours_kb(free_hours, "time_"))
+    await state.set_state(BookingStates.waiting_for_time)
+
+
+def _hours_kb(free_hours, prefix: str):
+    free_hours = set(free_hours)
     buttons = []
-    available = 0
     for h in range(WORKING_HOURS_START, WORKING_HOURS_END):
-        time_str = f"{h}:00 - {h+1}:00"
-        if time_str in booked_times:
+        time_str = slot_label(h)
+        if h not in free_hours:
             buttons.append([InlineKeyboardButton(text=f"❌ {time_str}", callback_data="noop")])
         else:
-            buttons.append([InlineKeyboardButton(text=f"🟢 {time_str}", callback_data=f"time_{h}")])
-            available += 1
+            buttons.append([InlineKeyboardButton(text=f"🟢 {time_str}", callback_data=f"{prefix}{h}")])
+    buttons.append(cancel_row())
+    return make_kb(buttons)
 
-    if available == 0:
+
+#Компания за соседними столами: выбор времени заново
+@router.callback_query(F.data == "book_party")
+async def booking_party(callback: CallbackQuery, state: FSMContext):
+    data = await state.get_data()
+    hours = await db.get_party_hours(data['booking_date'], data['people_count'])
+    if not hours:
         await callback.message.edit_text(
-            "😔 Все слоты на этот день заняты. Попробуйте другую дату.",
+            "😔 На этот день свободных соседних столов не осталось. Попробуйте другую дату.",
             reply_markup=make_kb([back_button("start_booking", "🔙 Выбрать дату")]))
         return
-
-    buttons.append(cancel_row())
-    pretty_date = data.get('pretty_date', '')
     await callback.message.edit_text(
-        f"📅 Дата: {pretty_date}\nВыберите время:", reply_markup=make_kb(buttons))
+        f"📅 Дата: {data.get('pretty_date', '')}\n"
+        f"👥 Гостей: {data['people_count']} — подберём соседние столы.\nВыберите время:",
+        reply_markup=_hours_kb(hours, "ptime_"))
     await state.set_state(BookingStates.waiting_for_time)
 
 
@@ -129,18 +166,38 @@ async def booking_tbl(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(BookingStates.waiting_for_time, F.data.startswith("time_"))
 async def booking_time_selection(callback: CallbackQuery, state: FSMContext):
     hour = int(callback.data.split("_")[1])
-    time_str = f"{hour}:00 - {hour+1}:00"
+    await _ask_preorder(callback, state, hour)
+
+
+#Время для компании → подбор столов → предзаказ?
+@router.callback_query(BookingStates.waiting_for_time, F.data.startswith("ptime_"))
+async def booking_party_time(callback: CallbackQuery, state: FSMContext):
+    hour = int(callback.data.split("_")[1])
+    data = await state.get_data()
+    party = await db.find_party_tables(data['booking_date'], hour, data['people_count'])
+    if party is None:
+        await callback.answer("😔 Столы на это время только что заняли", show_alert=True)
+        await booking_party(callback, state)
+        return
+    await state.update_data(table_id=party['table_ids'][0], table_ids=party['table_ids'],
+                            tables_label=party['label'])
+    await _ask_preorder(callback, state, hour,
+                        f"🪑 Столы: {party['label']} ({party['seats']} мест)\n")
+
+
+async def _ask_preorder(callback: CallbackQuery, state: FSMContext, hour: int, tables_line: str = ""):
+    time_str = slot_label(hour)
     await state.update_data(booking_time=time_str)
 
     data = await state.get_data()
     pretty = data.get('pretty_date', '')
 
-    kb = make_kb([
+    kb = cached_kb(("preorder",), lambda: [
         [InlineKeyboardButton(text="Да, предзаказ", callback_data="preorder_yes")],
         [InlineKeyboardButton(text="Нет", callback_data="preorder_no")],
     ])
     await callback.message.edit_text(
-        f"📅 Дата: {pretty}\n⏰ Время: {time_str}\n\nПредзаказ?",
+        f"📅 Дата: {pretty}\n⏰ Время: {time_str}\n{tables_line}\nПредзаказ?",
         reply_markup=kb)
     await state.set_state(BookingStates.waiting_for_preorder)
 
@@ -159,6 +216,30 @@ async def booking_yes_pre(callback: CallbackQuery, state: FSMContext):
     await state.set_state(BookingStates.waiting_for_preorder_amount)
 
 
+SLOT_TAKEN_TEXT = "😔 Этот слот только что заняли. Выберите другое время."
+
+
+def _slot_taken_kb(data: dict):
+    again = "book_party" if data.get('table_ids') else f"book_tbl_{data['table_id']}"
+    return make_kb([
+        [InlineKeyboardButton(text="⏰ Выбрать время", callback_data=again)],
+        cancel_row(),
+    ])
+
+
+async def _book(user_id: int, data: dict, preorder_sum: int):
+    """Занять стол, а для компании — сразу все подобранные столы."""
+    return await db.book_slot(user_id, data['table_id'],
+                              data['booking_date'], data['booking_time'],
+                              data['people_count'], preorder_sum,
+                              with_order=data['people_count'] > SHARED_ORDER_THRESHOLD,
+                              extra_tables=(data.get('table_ids') or [])[1:])
+
+
+def _tables_note(data: dict) -> str:
+    return f"\n🪑 Столы: {data['tables_label']}" if data.get('tables_label') else ""
+
+
 @router.message(BookingStates.waiting_for_preorder_amount)
 async def booking_sum_pre(message: Message, state: FSMContext):
     if not message.text.isdigit():
@@ -167,27 +248,24 @@ async def booking_sum_pre(message: Message, state: FSMContext):
     val = int(message.text)
     data = await state.get_data()
 
-    # Подменяем callback на message для общей функции
-    db.add_booking(message.from_user.id, data['table_id'],
-                   data['booking_date'], data['booking_time'],
-                   data['people_count'], val)
-    booking = db.get_active_booking(message.from_user.id)
+    shared = data['people_count'] > SHARED_ORDER_THRESHOLD
+    booking = await _book(message.from_user.id, data, val)
+    if booking is None:
+        await message.answer(SLOT_TAKEN_TEXT, reply_markup=_slot_taken_kb(data))
+        return
 
-    if data['people_count'] > SHARED_ORDER_THRESHOLD:
-        order_id, uuid = db.create_order(message.from_user.id, booking_id=booking['id'])
-        db.add_order_participant(order_id, message.from_user.id)
-        bot_info = await message.bot.get_me()
-        link = f"https://t.me/{bot_info.username}?start=ord_{uuid}"
+    if shared:
+        link = await order_link(message.bot, booking['link_uuid'])
 
         await message.answer(
-            f"✅ <b>Бронь с предзаказом ({val}₽) подтверждена!</b>\n"
+            f"✅ <b>Бронь с предзаказом ({val}₽) подтверждена!</b>{_tables_note(data)}\n"
             f"Создан совместный заказ: {link}",
             parse_mode="HTML",
-            reply_markup=get_main_kb(message.from_user.id))
+            reply_markup=await get_main_kb(message.from_user.id))
     else:
         await message.answer(
-            f"✅ Бронь с предзаказом ({val}₽) подтверждена!",
-            reply_markup=get_main_kb(message.from_user.id))
+            f"✅ Бронь с предзаказом ({val}₽) подтверждена!{_tables_note(data)}",
+            reply_markup=await get_main_kb(message.from_user.id))
 
     await state.clear()
     logger.info("Бронь создана: user=%s date=%s", message.from_user.id, data['booking_date'])
@@ -195,28 +273,26 @@ async def booking_sum_pre(message: Message, state: FSMContext):
 
 async def _create_booking_and_notify(callback: CallbackQuery, state: FSMContext, data: dict, preorder_sum: int):
     """Общая логика создания брони и уведомления."""
-    db.add_booking(callback.from_user.id, data['table_id'],
-                   data['booking_date'], data['booking_time'],
-                   data['people_count'], preorder_sum)
-    booking = db.get_active_booking(callback.from_user.id)
+    shared = data['people_count'] > SHARED_ORDER_THRESHOLD
+    booking = await _book(callback.from_user.id, data, preorder_sum)
+    if booking is None:
+        await callback.message.edit_text(SLOT_TAKEN_TEXT, reply_markup=_slot_taken_kb(data))
+        return
 
-    if data['people_count'] > SHARED_ORDER_THRESHOLD:
-        order_id, uuid = db.create_order(callback.from_user.id, booking_id=booking['id'])
-        db.add_order_participant(order_id, callback.from_user.id)
-        bot_info = await callback.bot.get_me()
-        link = f"https://t.me/{bot_info.username}?start=ord_{uuid}"
+    if shared:
+        link = await order_link(callback.bot, booking['link_uuid'])
 
         await callback.message.edit_text(
-            f"✅ <b>Бронь подтверждена!</b>\n"
+            f"✅ <b>Бронь подтверждена!</b>{_tables_note(data)}\n"
             f"Создан <b>Совместный заказ</b> для компании.\n"
             f"Ссылка для гостей: {link}\n\n"
             f"Они смогут добавить блюда в заказ.",
             parse_mode="HTML",
-            reply_markup=get_main_kb(callback.from_user.id))
+            reply_markup=await get_main_kb(callback.from_user.id))
     else:
         await callback.message.edit_text(
-            "✅ Бронь подтверждена!",
-            reply_markup=get_main_kb(callback.from_user.id))
+            f"✅ Бронь подтверждена!{_tables_note(data)}",
+            reply_markup=await get_main_kb(callback.from_user.id))
 
     await state.clear()
     logger.info("Бронь создана: user=%s date=%s", callback.from_user.id, data['booking_date'])
@@ -225,7 +301,7 @@ async def _create_booking_and_notify(callback: CallbackQuery, state: FSMContext,
 #Мои брони
 @router.callback_query(F.data == "my_bookings")
 async def my_bookings(callback: CallbackQuery):
-    booking = db.get_active_booking(callback.from_user.id)
+    booking = await db.get_active_booking(callback.from_user.id)
     kb = [back_button()]
 
     if not booking:
@@ -246,7 +322,7 @@ async def my_bookings(callback: CallbackQuery):
 
     kb.insert(0, [InlineKeyboardButton(text="❌ Отменить бронь", callback_data="cancel_booking")])
 
-    order = db.get_order_by_booking_id(booking['id'])
+    order = await db.get_order_by_booking_id(booking['id'])
     if order:
         kb.insert(0, [InlineKeyboardButton(text="🍕 Меню заказа", callback_data=f"open_menu_{order['id']}")])
 
@@ -255,41 +331,45 @@ async def my_bookings(callback: CallbackQuery):
 
 @router.callback_query(F.data == "cancel_booking")
 async def cancel_b(callback: CallbackQuery, state: FSMContext):
-    result = db.cancel_booking(callback.from_user.id)
+    result = await db.cancel_booking(callback.from_user.id)
     if result:
         await callback.answer("✅ Бронь отменена")
         logger.info("Бронь отменена: user=%s", callback.from_user.id)
     else:
         await callback.answer("Нет активной брони")
     await state.clear()
-    await callback.message.edit_text("Главное меню", reply_markup=get_main_kb(callback.from_user.id))
+    await callback.message.edit_text("Главное меню", reply_markup=await get_main_kb(callback.from_user.id))
 
 
 #Активные брони (сотрудник)
-@router.callback_query(F.data == "emp_bookings")
+@router.callback_query(F.data.startswith("emp_bookings"))
 async def emp_bookings(callback: CallbackQuery):
-    if not is_employee(callback.from_user.id) and not is_admin(callback.from_user.id):
+    if not await is_employee(callback.from_user.id) and not is_admin(callback.from_user.id):
         return
 
-    bks = db.get_all_bookings_full()
+    cursor = parse_cursor(callback.data, "emp_bookings")
+    bks, next_cursor = await db.get_bookings_page(
+        after=cursor, limit=BOOKINGS_PER_PAGE, with_contacts=True)
     text = "📋 <b>Активные брони:</b>\n\n"
-    found = False
 
     for b in bks:
-        if b['status'] == 'active':
-            found = True
-            date_fmt = format_date(b.get('booking_date', '') or '')
-            text += (
-                f"🔹 <b>{date_fmt} {b['booking_time']}</b> — Стол {b['table_name']}\n"
-                f"   Гость: {b['user_name']} ({b['people_count']} чел.)\n"
-                f"   Тел: {b['phone_number'] or 'не указан'}\n"
-            )
-            if b.get('pre_order_sum', 0) > 0:
-                text += f"   Предзаказ: {int(b['pre_order_sum'])}₽\n"
-            text += "\n"
-
-    if not found:
+        date_fmt = format_date(b.get('booking_date', '') or '')
+        text += (
+            f"🔹 <b>{date_fmt} {b['booking_time']}</b> — Стол {b['table_name']}\n"
+            f"   Гость: {b['user_name']} ({b['people_count']} чел.)\n"
+            f"   Тел: {b['phone_number'] or 'не указан'}\n"
+        )
+        if (b.get('pre_order_sum') or 0) > 0:
+            text += f"   Предзаказ: {int(b['pre_order_sum'])}₽\n"
+        text += "\n"
+
+    if not bks:
         text += "Нет активных броней."
 
-    await callback.message.edit_text(
-        text, reply_markup=make_kb([back_button()]), parse_mode="HTML")
+    kb = []
+    if next_cursor:
+        kb.append([InlineKeyboardButton(text="➡ Дальше", callback_data=cursor_data("emp_bookings", next_cursor))])
+    if cursor:
+        kb.append([InlineKeyboardButton(text="⏮ В начало", callback_data="emp_bookings")])
+    kb.append(back_button())
+    await callback.message.edit_text(text, reply_markup=make_kb(kb), parse_mode="HTML")
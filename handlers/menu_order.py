@@ -4,9 +4,10 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-import database as db
+import async_db as db
+from broadcast import broadcaster, cart_digest
 from config import ITEMS_PER_PAGE
-from utils import make_kb, back_button
+from utils import make_kb, back_button, order_link, keyboards
 
 from .profile import get_main_kb
 
@@ -18,26 +19,31 @@ class OrderStates(StatesGroup):
     viewing_menu = State()
 
 
-#Отправить сообщение всем участникам заказа
+#Отправить сообщение всем участникам заказа (в фоне, хендлер не ждёт)
 async def broadcast_to_order(bot: Bot, order_id: int, text: str, exclude_user_id=None):
-    participants = db.get_order_participants(order_id)
-    for p in participants:
-        if exclude_user_id and p['user_id'] == exclude_user_id:
-            continue
-        try:
-            await bot.send_message(p['user_id'], text, parse_mode="HTML")
-        except Exception as e:
-            logger.warning("Не удалось отправить уведомление user=%s: %s", p['user_id'], e)
+    broadcaster.spawn(_send_to_order(bot, order_id, text, exclude_user_id))
+
+
+async def _send_to_order(bot: Bot, order_id: int, text: str, exclude_user_id=None):
+    participants = await db.get_order_participants(order_id)
+    chat_ids = [p['user_id'] for p in participants
+                if not (exclude_user_id and p['user_id'] == exclude_user_id)]
+    await broadcaster.fan_out(bot, chat_ids, text, parse_mode="HTML")
+
+
+async def _finish_order_broadcast(bot: Bot, order_id: int, text: str, exclude_user_id=None):
+    # Сначала незавершённая сводка корзины, потом итог
+    await cart_digest.flush(order_id)
+    await _send_to_order(bot, order_id, text, exclude_user_id)
 
 
 #Создание совместного заказа
 @router.callback_query(F.data == "create_shared_order")
 async def create_shared_order(callback: CallbackQuery, state: FSMContext):
-    order_id, uuid = db.create_order(callback.from_user.id)
-    db.add_order_participant(order_id, callback.from_user.id)
+    order_id, uuid = await db.create_order(callback.from_user.id)
+    await db.add_order_participant(order_id, callback.from_user.id)
 
-    bot_info = await callback.bot.get_me()
-    link = f"https://t.me/{bot_info.username}?start=ord_{uuid}"
+    link = await order_link(callback.bot, uuid)
 
     await callback.message.edit_text(
         f"✅ <b>Совместный заказ создан!</b>\n\n"
@@ -62,8 +68,25 @@ async def show_menu(ctx: Message, state: FSMContext, page=1, edit=False):
             await ctx.answer("Сначала создайте или присоединитесь к заказу.")
         return
 
-    items, has_next = db.get_menu_page(page, per_page=ITEMS_PER_PAGE)
+    # Версию берём до чтения страницы: если меню поменяется между ними,
+    # свежая страница ляжет под старый ключ, который больше не спросят
+    version = db.get_menu_version()
+    key = ("menu", version, page, order_id)
+    markup = keyboards.get(key)
+    if markup is None:
+        items, has_next = await db.get_menu_page(page, per_page=ITEMS_PER_PAGE)
+        markup = make_kb(_menu_rows(items, has_next, page, order_id))
+        keyboards.put(key, markup)
+
+    text = "🍕 <b>МЕНЮ</b>\nВыберите блюда:"
+
+    if edit and isinstance(ctx, Message):
+        await ctx.edit_text(text, reply_markup=markup, parse_mode="HTML")
+    else:
+        await ctx.answer(text, reply_markup=markup, parse_mode="HTML")
+
 
+def _menu_rows(items, has_next, page, order_id):
     kb = []
     for item in items:
         kb.append([InlineKeyboardButton(
@@ -81,14 +104,7 @@ async def show_menu(ctx: Message, state: FSMContext, page=1, edit=False):
 
     kb.append([InlineKeyboardButton(text="🛒 Корзина", callback_data=f"view_cart_{order_id}")])
     kb.append(back_button())
-
-    text = "🍕 <b>МЕНЮ</b>\nВыберите блюда:"
-    markup = make_kb(kb)
-
-    if edit and isinstance(ctx, Message):
-        await ctx.edit_text(text, reply_markup=markup, parse_mode="HTML")
-    else:
-        await ctx.answer(text, reply_markup=markup, parse_mode="HTML")
+    return kb
 
 
 @router.callback_query(F.data.startswith("open_menu_"))
@@ -118,15 +134,17 @@ async def add_cart_item(callback: CallbackQuery, state: FSMContext):
         await callback.answer("Нет активного заказа!", show_alert=True)
         return
 
-    db.add_to_cart(order_id, callback.from_user.id, item_id)
-    item = db.get_menu_item(item_id)
+    if not await db.add_to_cart(order_id, callback.from_user.id, item_id):
+        await callback.answer("Этой позиции больше нет в меню.", show_alert=True)
+        return
+    item = await db.get_menu_item(item_id)
     await callback.answer(f"➕ {item['name']} добавлено!", show_alert=False)
 
-    user = db.get_user(callback.from_user.id)
-    await broadcast_to_order(
-        callback.message.bot, order_id,
-        f"🛒 <b>{user['full_name']}</b> добавил: {item['name']}",
-        exclude_user_id=callback.from_user.id)
+    # Остальным участникам уйдёт общая сводка за окно, а не сообщение на каждое нажатие
+    user = await db.get_user(callback.from_user.id)
+    order = await db.get_order_by_id(order_id)
+    cart_digest.add(callback.message.bot, order_id, order['initiator_id'], callback.from_user.id,
+                    user['full_name'], item['name'])
 
 
 #Корзина
@@ -135,15 +153,22 @@ async def view_cart(callback: CallbackQuery, state: FSMContext):
     order_id = int(callback.data.split("_")[2])
     await state.update_data(current_order_id=order_id)
 
-    items = db.get_cart_items(order_id)
-    total = sum(i['price'] for i in items)
+    items = await db.get_cart_items(order_id)
+    subtotals = await db.get_order_subtotals(order_id)
+    total = sum(s['total'] for s in subtotals)
 
     text = "🛒 <b>Корзина заказа:</b>\n\n"
     if not items:
         text += "Пусто…"
     else:
         for idx, i in enumerate(items, 1):
-            text += f"{idx}. {i['name']} ({int(i['price'])}₽) — {i['full_name']}\n"
+            qty = f" ×{i['quantity']}" if i['quantity'] > 1 else ""
+            text += f"{idx}. {i['name']}{qty} ({int(i['line_total'])}₽) — {i['full_name']}\n"
+
+    if len(subtotals) > 1:
+        text += "\n<b>По гостям:</b>\n"
+        for s in subtotals:
+            text += f"{s['full_name']}: {int(s['total'])}₽\n"
 
     text += f"\n<b>Итого: {int(total)}₽</b>"
 
@@ -153,7 +178,7 @@ async def view_cart(callback: CallbackQuery, state: FSMContext):
     if items:
         for i in items:
             kb.append([InlineKeyboardButton(
-                text=f"🗑 {i['name']}",
+                text=f"🗑 {i['name']}" + (" (−1)" if i['quantity'] > 1 else ""),
                 callback_data=f"rmcart_{i['cart_id']}_{order_id}")])
 
     kb.extend([
@@ -172,7 +197,7 @@ async def remove_cart(callback: CallbackQuery, state: FSMContext):
     cart_item_id = int(parts[1])
     order_id = int(parts[2])
 
-    db.remove_cart_item(cart_item_id)
+    await db.remove_cart_item(cart_item_id)
     await callback.answer("🗑 Удалено из корзины")
     logger.info("Удалена позиция корзины id=%s", cart_item_id)
 
@@ -185,7 +210,7 @@ async def remove_cart(callback: CallbackQuery, state: FSMContext):
 @router.callback_query(F.data.startswith("checkout_"))
 async def checkout(callback: CallbackQuery):
     order_id = int(callback.data.split("_")[1])
-    order = db.get_order_by_id(order_id)
+    order = await db.get_order_by_id(order_id)
 
     if not order:
         await callback.answer("Заказ не найден!", show_alert=True)
@@ -195,23 +220,23 @@ async def checkout(callback: CallbackQuery):
         await callback.answer("Только инициатор может завершить заказ!", show_alert=True)
         return
 
-    total = db.get_order_total(order_id)
+    total = await db.get_order_total(order_id)
 
     if total == 0:
         await callback.answer("Корзина пуста! Добавьте блюда.", show_alert=True)
         return
 
-    db.close_order(order_id)
+    await db.close_order(order_id)
 
     msg = f"✅ <b>Заказ оформлен!</b>\n\nСумма к оплате: {int(total)}₽\nОфициант скоро подойдет."
     await callback.message.edit_text(
         msg, parse_mode="HTML",
         reply_markup=make_kb([back_button()]))
 
-    await broadcast_to_order(
+    broadcaster.spawn(_finish_order_broadcast(
         callback.message.bot, order_id,
         f"🏁 <b>Заказ завершен!</b>\nИтого: {int(total)}₽",
-        exclude_user_id=callback.from_user.id)
+        exclude_user_id=callback.from_user.id))
 
     logger.info("Заказ #%s оформлен, сумма=%s", order_id, total)
 
@@ -4,9 +4,9 @@ from aiogram.types import Message, CallbackQuery, InlineKeyboardButton
 from aiogram.filters import Command
 from aiogram.fsm.context import FSMContext
 
-import database as db
+import async_db as db
 from config import ADMIN_IDS, RESTAURANT_NAME
-from utils import make_kb, back_button, format_date
+from utils import make_kb, back_button, format_date, cached_kb
 
 logger = logging.getLogger(__name__)
 router = Router()
@@ -17,46 +17,55 @@ def is_admin(user_id: int) -> bool:
     return user_id in ADMIN_IDS
 
 
-def is_employee(user_id: int) -> bool:
-    user = db.get_user(user_id)
+async def is_employee(user_id: int) -> bool:
+    user = await db.get_user(user_id)
     return user is not None and user.get('role') == 'employee'
 
 
-def get_main_kb(user_id: int):
+def _main_rows(employee: bool, admin: bool):
     kb = [
         [InlineKeyboardButton(text="🍽 Забронировать стол", callback_data="start_booking")],
         [InlineKeyboardButton(text="🎫 Моя бронь", callback_data="my_bookings")],
         [InlineKeyboardButton(text="👤 Кто я?", callback_data="my_profile")],
     ]
-    if is_employee(user_id):
+    if employee:
         kb.append([InlineKeyboardButton(text="📂 Активные Брони", callback_data="emp_bookings")])
-    if is_admin(user_id):
+    if admin:
         kb.append([InlineKeyboardButton(text="🛠 Админ-панель", callback_data="admin_menu")])
-    return make_kb(kb)
+    return kb
+
+
+async def get_main_kb(user_id: int):
+    # Вариантов всего четыре — по набору ролей
+    roles = (await is_employee(user_id), is_admin(user_id))
+    return cached_kb(("main",) + roles, lambda: _main_rows(*roles))
 
 
 #Главное меню
 @router.callback_query(F.data == "start_menu")
 async def back_to_main(callback: CallbackQuery, state: FSMContext):
     await state.clear()
-    await callback.message.edit_text("Главное меню", reply_markup=get_main_kb(callback.from_user.id))
+    await callback.message.edit_text("Главное меню", reply_markup=await get_main_kb(callback.from_user.id))
 
 
 # Профиль 
+_HISTORY_ICONS = {"active": "✅", "completed": "🍽"}
+
+
 @router.callback_query(F.data == "my_profile")
 async def my_profile_handler(callback: CallbackQuery):
-    user = db.get_user(callback.from_user.id)
+    user = await db.get_user(callback.from_user.id)
     if not user:
         await callback.answer("Вы не зарегистрированы!", show_alert=True)
         return
 
     # История броней
-    history = db.get_user_bookings_history(callback.from_user.id, limit=5)
+    history = await db.get_user_bookings_history(callback.from_user.id, limit=5)
     history_text = ""
     if history:
         history_text = "\n\n📖 <b>Последние брони:</b>\n"
         for h in history:
-            status_icon = "✅" if h['status'] == 'active' else "❌"
+            status_icon = _HISTORY_ICONS.get(h['status'], "❌")
             date_pretty = format_date(h.get('booking_date', ''))
             history_text += f"{status_icon} {date_pretty} {h['booking_time']} — {h['table_name']}\n"
 
@@ -5,7 +5,7 @@ from aiogram.filters import CommandStart, CommandObject
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 
-import database as db
+import async_db as db
 from utils import make_kb
 
 from .profile import get_main_kb
@@ -26,7 +26,7 @@ async def start(message: Message, command: CommandObject, state: FSMContext):
     args = command.args
     await state.clear()
 
-    user = db.get_user(message.from_user.id)
+    user = await db.get_user(message.from_user.id)
 
     #Не зарегистрирован → регистрация
     if not user:
@@ -38,11 +38,11 @@ async def start(message: Message, command: CommandObject, state: FSMContext):
     #Присоединение к заказу
     if args and args.startswith("ord_"):
         uuid = args.split("_", 1)[1]
-        order = db.get_order_by_uuid(uuid)
+        order = await db.get_order_by_uuid(uuid)
         if order and order['status'] == 'open':
-            db.add_order_participant(order['id'], message.from_user.id)
+            await db.add_order_participant(order['id'], message.from_user.id)
 
-            initiator = db.get_user(order['initiator_id'])
+            initiator = await db.get_user(order['initiator_id'])
             init_name = initiator['full_name'] if initiator else "Инициатора"
             await message.answer(
                 f"🍕 Вы присоединились к заказу {init_name}!\n"
@@ -64,7 +64,7 @@ async def start(message: Message, command: CommandObject, state: FSMContext):
     #Обычный вход
     await message.answer(
         f"👋 Привет, {user['full_name']}!",
-        reply_markup=get_main_kb(message.from_user.id))
+        reply_markup=await get_main_kb(message.from_user.id))
 
 
 #Регистрация
@@ -88,20 +88,20 @@ async def reg_phone(message: Message, state: FSMContext):
 
 async def finish_reg(message: Message, state: FSMContext, user_obj, phone):
     data = await state.get_data()
-    db.add_user(user_obj.id, user_obj.username, data['name'], phone)
+    await db.add_user(user_obj.id, user_obj.username, data['name'], phone)
 
     #Присоединение к заказу после регистрации
     args = data.get('next_arg')
     if args and args.startswith("ord_"):
         await message.answer("Регистрация успешна! Переход к заказу…")
         uuid = args.split("_", 1)[1]
-        order = db.get_order_by_uuid(uuid)
+        order = await db.get_order_by_uuid(uuid)
         if order:
             await state.update_data(current_order_id=order['id'])
             await show_menu(message, state, page=1)
             return
 
     await message.answer("Регистрация завершена!",
-                         reply_markup=get_main_kb(user_obj.id))
+                         reply_markup=await get_main_kb(user_obj.id))
     await state.clear()
     logger.info("Новый пользователь: %s (id=%s)", data['name'], user_obj.id)
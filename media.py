@@ -0,0 +1,64 @@
+"""Повторная отправка файлов по file_id Telegram вместо загрузки с диска.
+
+Файл идентифицируется хэшем содержимого: пока он не менялся, отправляется
+сохранённый в БД file_id, после замены файла — загружается заново.
+"""
+
+import hashlib
+import logging
+import os
+
+from aiogram.exceptions import TelegramBadRequest
+from aiogram.types import FSInputFile, Message
+
+import async_db as db
+
+logger = logging.getLogger(__name__)
+
+# path -> (mtime_ns, size, sha256): пересчитываем хэш только после изменения файла
+_hashes = {}
+# sha256 -> file_id, чтобы не ходить в БД на каждую отправку
+_file_ids = {}
+
+
+def content_hash(path: str) -> str:
+    st = os.stat(path)
+    cached = _hashes.get(path)
+    if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+        return cached[2]
+    h = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 16), b''):
+            h.update(chunk)
+    digest = h.hexdigest()
+    _hashes[path] = (st.st_mtime_ns, st.st_size, digest)
+    return digest
+
+
+async def _file_id(digest: str):
+    file_id = _file_ids.get(digest)
+    if file_id is None:
+        file_id = await db.get_media_file_id(digest)
+        if file_id is not None:
+            _file_ids[digest] = file_id
+    return file_id
+
+
+async def answer_photo(message: Message, path: str, **kwargs) -> Message:
+    """message.answer_photo с кэшем file_id по содержимому файла."""
+    digest = content_hash(path)
+    file_id = await _file_id(digest)
+    if file_id is not None:
+        try:
+            return await message.answer_photo(file_id, **kwargs)
+        except TelegramBadRequest as e:
+            # file_id протух (например, сменился токен бота) — грузим заново
+            logger.warning("file_id для %s не принят: %s", path, e)
+            _file_ids.pop(digest, None)
+            await db.forget_media_file_id(digest)
+
+    sent = await message.answer_photo(FSInputFile(path), **kwargs)
+    file_id = sent.photo[-1].file_id
+    _file_ids[digest] = file_id
+    await db.save_media_file_id(digest, file_id)
+    return sent
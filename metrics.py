@@ -0,0 +1,222 @@
+"""Метрики в формате Prometheus: время хендлеров, запросы к БД и к Bot API.
+
+На каждый апдейт заводится UpdateStats (contextvar), в него по ходу
+обработки складываются вызовы database.py (через async_db), прочитанные
+строки (row_factory соединений, см. updatestats.py) и запросы к Bot API
+(middleware сессии).
+По окончании апдейта всё пишется в метрики с меткой хендлера
+"<модуль>.<функция>", например booking.booking_tbl — так видно, какая
+часть времени хендлера ушла на SQL, а какая на Telegram.
+
+Отдаются на http://METRICS_HOST:METRICS_PORT/metrics.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot, Dispatcher
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.types import TelegramObject
+
+from updatestats import UpdateStats, current
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 50, 100, 1000)
+
+
+#  Метрики
+class _Metric:
+    kind = ""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help = help_text
+        self.labels = labels
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _label_str(self, values, extra=""):
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labels, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            series = {k: list(v) if isinstance(v, list) else v for k, v in self._series.items()}
+        for values, value in sorted(series.items()):
+            lines.extend(self._render_series(values, value))
+        return lines
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, *values, amount=1):
+        with self._lock:
+            self._series[values] = self._series.get(values, 0) + amount
+
+    def _render_series(self, values, value):
+        return [f"{self.name}{self._label_str(values)} {value}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = buckets
+
+    def observe(self, value, *values):
+        with self._lock:
+            # [счётчики по корзинам..., сумма, количество]
+            series = self._series.get(values)
+            if series is None:
+                series = self._series[values] = [0] * (len(self.buckets) + 2)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _render_series(self, values, series):
+        lines = []
+        for bound, count in zip(self.buckets, series):
+            le = self._label_str(values, f'le="{bound}"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+        le = self._label_str(values, 'le="+Inf"')
+        lines.append(f"{self.name}_bucket{le} {series[-1]}")
+        lines.append(f"{self.name}_sum{self._label_str(values)} {series[-2]}")
+        lines.append(f"{self.name}_count{self._label_str(values)} {series[-1]}")
+        return lines
+
+
+handler_seconds = Histogram(
+    "bot_handler_seconds", "Время обработки апдейта", ("handler",))
+handler_db_calls = Histogram(
+    "bot_handler_db_calls", "Вызовов database.py за апдейт", ("handler",), COUNT_BUCKETS)
+handler_db_rows = Histogram(
+    "bot_handler_db_rows", "Прочитано строк из БД за апдейт", ("handler",), COUNT_BUCKETS)
+handler_db_seconds = Counter(
+    "bot_handler_db_seconds_total", "Время ожидания database.py (с очередью пула)", ("handler",))
+handler_api_calls = Histogram(
+    "bot_handler_api_calls", "Запросов к Bot API за апдейт", ("handler",), COUNT_BUCKETS)
+handler_api_seconds = Counter(
+    "bot_handler_api_seconds_total", "Время запросов к Bot API из хендлера", ("handler",))
+handler_errors = Counter(
+    "bot_handler_errors_total", "Апдейтов, завершившихся исключением", ("handler",))
+db_calls = Counter(
+    "bot_db_calls_total", "Вызовов database.py", ("function",))
+api_requests = Histogram(
+    "bot_api_request_seconds", "Запросы к Bot API (включая рассылки)", ("method",))
+
+REGISTRY = [
+    handler_seconds, handler_db_calls, handler_db_rows, handler_db_seconds,
+    handler_api_calls, handler_api_seconds, handler_errors, db_calls, api_requests,
+]
+
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+#  Счётчики текущего апдейта
+def record_db_call(name: str, seconds: float):
+    db_calls.inc(name)
+    stats = current.get()
+    if stats is not None:
+        stats.db_calls += 1
+        stats.db_seconds += seconds
+
+
+#  Middleware
+class UpdateMetricsMiddleware(BaseMiddleware):
+    """Внешний middleware апдейтов: время и счётчики на каждый апдейт."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        stats = UpdateStats()
+        token = current.set(stats)
+        started = time.perf_counter()
+        try:
+            return await handler(event, data)
+        except Exception:
+            handler_errors.inc(stats.handler)
+            raise
+        finally:
+            current.reset(token)
+            label = stats.handler
+            handler_seconds.observe(time.perf_counter() - started, label)
+            handler_db_calls.observe(stats.db_calls, label)
+            handler_db_rows.observe(stats.db_rows, label)
+            handler_db_seconds.inc(label, amount=stats.db_seconds)
+            handler_api_calls.observe(stats.api_calls, label)
+            handler_api_seconds.inc(label, amount=stats.api_seconds)
+
+
+class HandlerLabelMiddleware(BaseMiddleware):
+    """Внутренний middleware: запоминает, какой хендлер выбран для апдейта."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        stats = current.get()
+        if stats is not None:
+            callback = data["handler"].callback
+            stats.handler = f"{callback.__module__.rsplit('.', 1)[-1]}.{callback.__name__}"
+        return await handler(event, data)
+
+
+class ApiMetricsMiddleware(BaseRequestMiddleware):
+    """Middleware сессии бота: каждый запрос к Bot API."""
+
+    async def __call__(self, make_request, bot, method):
+        started = time.perf_counter()
+        try:
+            return await make_request(bot, method)
+        finally:
+            elapsed = time.perf_counter() - started
+            api_requests.observe(elapsed, method.__api_method__)
+            stats = current.get()
+            if stats is not None:
+                stats.api_calls += 1
+                stats.api_seconds += elapsed
+
+
+def install(dp: Dispatcher, bot: Bot):
+    dp.update.outer_middleware(UpdateMetricsMiddleware())
+    # Внутренние middleware наследуются вложенными роутерами
+    dp.message.middleware(HandlerLabelMiddleware())
+    dp.callback_query.middleware(HandlerLabelMiddleware())
+    bot.session.middleware(ApiMetricsMiddleware())
+
+
+#  HTTP
+async def metrics_view(request: web.Request) -> web.Response:
+    return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+
+async def start_server(host: str, port: int) -> web.AppRunner:
+    app = web.Application()
+    app.router.add_get("/metrics", metrics_view)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    logger.info("Метрики: http://%s:%s/metrics", host, port)
+    return runner
@@ -0,0 +1,451 @@
+"""Версионированные миграции схемы SQLite.
+
+Каждый шаг применяется один раз, в своей транзакции; номер последнего
+применённого шага хранится в таблице schema_version.
+"""
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _columns(c, table):
+    return {row[1] for row in c.execute(f'PRAGMA table_info({table})')}
+
+
+#v1: базовые таблицы
+def _base_schema(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS tables (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        seats INTEGER NOT NULL,
+        status TEXT DEFAULT 'free',
+        neighbors TEXT DEFAULT '[]'
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS users (
+        user_id INTEGER PRIMARY KEY,
+        username TEXT,
+        full_name TEXT,
+        phone_number TEXT,
+        role TEXT DEFAULT 'user',
+        is_regular BOOLEAN DEFAULT 0
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bookings (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER,
+        table_id INTEGER,
+        booking_date TEXT,
+        booking_time TEXT,
+        people_count INTEGER,
+        pre_order_sum REAL DEFAULT 0,
+        status TEXT DEFAULT 'active',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(user_id) REFERENCES users(user_id),
+        FOREIGN KEY(table_id) REFERENCES tables(id)
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS menu (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        name TEXT NOT NULL,
+        price REAL NOT NULL,
+        description TEXT,
+        category TEXT
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS orders (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        link_uuid TEXT UNIQUE,
+        initiator_id INTEGER,
+        booking_id INTEGER,
+        status TEXT DEFAULT 'open',
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(booking_id) REFERENCES bookings(id)
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cart_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        user_id INTEGER,
+        item_id INTEGER,
+        quantity INTEGER DEFAULT 1,
+        FOREIGN KEY(order_id) REFERENCES orders(id),
+        FOREIGN KEY(item_id) REFERENCES menu(id)
+    )''')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS order_participants (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        order_id INTEGER,
+        user_id INTEGER,
+        joined_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        FOREIGN KEY(order_id) REFERENCES orders(id),
+        FOREIGN KEY(user_id) REFERENCES users(user_id),
+        UNIQUE(order_id, user_id)
+    )''')
+
+    # Базы, созданные старыми версиями бота, могут не иметь этих колонок
+    if 'booking_id' not in _columns(c, 'orders'):
+        c.execute('ALTER TABLE orders ADD COLUMN booking_id INTEGER')
+    if 'booking_date' not in _columns(c, 'bookings'):
+        c.execute('ALTER TABLE bookings ADD COLUMN booking_date TEXT')
+
+
+#v2: индексы под частые выборки
+def _indexes(c):
+    # get_table_bookings, проверка занятости слота
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_table_date '
+              'ON bookings(table_id, booking_date, status)')
+    # get_active_booking, cancel_booking
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_status '
+              'ON bookings(user_id, status)')
+    # get_user_bookings_history (ORDER BY created_at)
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_user_created '
+              'ON bookings(user_id, created_at)')
+    # get_cart_items, get_order_total
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cart_items_order '
+              'ON cart_items(order_id)')
+    # get_order_by_booking_id
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_booking '
+              'ON orders(booking_id, status)')
+    # get_active_order_by_user
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_initiator '
+              'ON orders(initiator_id, status)')
+    # order_participants(order_id) уже покрыт UNIQUE(order_id, user_id)
+
+
+#v3: загрузка дня в индекс занятости (availability.py)
+def _bookings_by_date(c):
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_date_status '
+              'ON bookings(booking_date, status)')
+
+
+#v4: одна активная бронь на слот стола
+def _unique_active_slot(c):
+    # Дубли, успевшие появиться до индекса, отменяем, оставляя самую раннюю бронь
+    c.execute('''
+    UPDATE bookings SET status = 'cancelled'
+    WHERE status = 'active' AND id NOT IN (
+        SELECT MIN(id) FROM bookings WHERE status = 'active'
+        GROUP BY table_id, booking_date, booking_time
+    )''')
+    c.execute("CREATE UNIQUE INDEX IF NOT EXISTS ux_bookings_active_slot "
+              "ON bookings(table_id, booking_date, booking_time) WHERE status = 'active'")
+
+
+#v5: счётчики для экрана статистики, обновляются триггерами
+def _stats_counters(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS stats (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        users INTEGER NOT NULL DEFAULT 0,
+        active_bookings INTEGER NOT NULL DEFAULT 0,
+        total_bookings INTEGER NOT NULL DEFAULT 0,
+        open_orders INTEGER NOT NULL DEFAULT 0,
+        closed_orders INTEGER NOT NULL DEFAULT 0,
+        preorder_sum REAL NOT NULL DEFAULT 0,
+        menu_count INTEGER NOT NULL DEFAULT 0,
+        tables_count INTEGER NOT NULL DEFAULT 0
+    )''')
+    # Начальные значения заполняет database.reconcile_stats при старте
+    c.execute('INSERT OR IGNORE INTO stats (id) VALUES (1)')
+
+    for table, column in (('users', 'users'), ('menu', 'menu_count'), ('tables', 'tables_count')):
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_ins AFTER INSERT ON {table}
+        BEGIN UPDATE stats SET {column} = {column} + 1 WHERE id = 1; END''')
+        c.execute(f'''
+        CREATE TRIGGER IF NOT EXISTS trg_stats_{table}_del AFTER DELETE ON {table}
+        BEGIN UPDATE stats SET {column} = {column} - 1 WHERE id = 1; END''')
+
+    # Вклад брони в счётчики: active — 0/1, сумма предзаказа только для активных
+    active = "(CASE WHEN {r}.status = 'active' THEN 1 ELSE 0 END)"
+    preorder = "(CASE WHEN {r}.status = 'active' THEN COALESCE({r}.pre_order_sum, 0) ELSE 0 END)"
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_ins AFTER INSERT ON bookings
+    BEGIN UPDATE stats SET
+        total_bookings = total_bookings + 1,
+        active_bookings = active_bookings + {active.format(r='NEW')},
+        preorder_sum = preorder_sum + {preorder.format(r='NEW')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_del AFTER DELETE ON bookings
+    BEGIN UPDATE stats SET
+        total_bookings = total_bookings - 1,
+        active_bookings = active_bookings - {active.format(r='OLD')},
+        preorder_sum = preorder_sum - {preorder.format(r='OLD')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_upd AFTER UPDATE OF status, pre_order_sum ON bookings
+    BEGIN UPDATE stats SET
+        active_bookings = active_bookings + {active.format(r='NEW')} - {active.format(r='OLD')},
+        preorder_sum = preorder_sum + {preorder.format(r='NEW')} - {preorder.format(r='OLD')}
+    WHERE id = 1; END''')
+
+    is_open = "(CASE WHEN {r}.status = 'open' THEN 1 ELSE 0 END)"
+    is_closed = "(CASE WHEN {r}.status = 'closed' THEN 1 ELSE 0 END)"
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_ins AFTER INSERT ON orders
+    BEGIN UPDATE stats SET
+        open_orders = open_orders + {is_open.format(r='NEW')},
+        closed_orders = closed_orders + {is_closed.format(r='NEW')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_del AFTER DELETE ON orders
+    BEGIN UPDATE stats SET
+        open_orders = open_orders - {is_open.format(r='OLD')},
+        closed_orders = closed_orders - {is_closed.format(r='OLD')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_upd AFTER UPDATE OF status ON orders
+    BEGIN UPDATE stats SET
+        open_orders = open_orders + {is_open.format(r='NEW')} - {is_open.format(r='OLD')},
+        closed_orders = closed_orders + {is_closed.format(r='NEW')} - {is_closed.format(r='OLD')}
+    WHERE id = 1; END''')
+
+
+#v6: списки броней по статусу и дате (get_bookings_page)
+def _bookings_by_status(c):
+    c.execute("CREATE INDEX IF NOT EXISTS idx_bookings_status_date "
+              "ON bookings(status, COALESCE(booking_date, ''))")
+
+
+#v7: строка корзины на (заказ, гость, блюдо) с количеством и ценой на момент добавления
+def _cart_lines(c):
+    if 'unit_price' not in _columns(c, 'cart_items'):
+        c.execute('ALTER TABLE cart_items ADD COLUMN unit_price REAL')
+    c.execute('''
+    UPDATE cart_items SET unit_price = (SELECT price FROM menu WHERE menu.id = cart_items.item_id)
+    WHERE unit_price IS NULL''')
+    # Раньше каждое нажатие давало отдельную строку — схлопываем в одну
+    c.execute('''
+    UPDATE cart_items SET quantity = (
+        SELECT SUM(COALESCE(d.quantity, 1)) FROM cart_items d
+        WHERE d.order_id = cart_items.order_id AND d.user_id = cart_items.user_id
+          AND d.item_id = cart_items.item_id)
+    WHERE id IN (SELECT MIN(id) FROM cart_items GROUP BY order_id, user_id, item_id)''')
+    c.execute('''
+    DELETE FROM cart_items
+    WHERE id NOT IN (SELECT MIN(id) FROM cart_items GROUP BY order_id, user_id, item_id)''')
+    c.execute('CREATE UNIQUE INDEX IF NOT EXISTS ux_cart_items_line '
+              'ON cart_items(order_id, user_id, item_id)')
+    # Префикс уникального индекса уже покрывает выборку по order_id
+    c.execute('DROP INDEX IF EXISTS idx_cart_items_order')
+
+
+#v8: состояния FSM (storage.SQLiteStorage)
+def _fsm_storage(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS fsm_storage (
+        key TEXT PRIMARY KEY,
+        state TEXT,
+        data TEXT NOT NULL DEFAULT '{}',
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+
+#v9: счётчики изменений для сброса кэшей в других процессах (workers.py)
+def _cache_epoch(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cache_epoch (
+        id INTEGER PRIMARY KEY CHECK (id = 1),
+        menu INTEGER NOT NULL DEFAULT 0,
+        users INTEGER NOT NULL DEFAULT 0,
+        bookings INTEGER NOT NULL DEFAULT 0,
+        tables INTEGER NOT NULL DEFAULT 0
+    )''')
+    c.execute('INSERT OR IGNORE INTO cache_epoch (id) VALUES (1)')
+    for table in ('menu', 'users', 'bookings', 'tables'):
+        for event in ('INSERT', 'UPDATE', 'DELETE'):
+            c.execute(f'''
+            CREATE TRIGGER IF NOT EXISTS trg_epoch_{table}_{event.lower()} AFTER {event} ON {table}
+            BEGIN UPDATE cache_epoch SET {table} = {table} + 1 WHERE id = 1; END''')
+
+
+#v10: file_id загруженных в Telegram файлов (media.py)
+def _media_files(c):
+    # Хэш содержимого файла -> file_id, выданный Telegram при загрузке
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS media_files (
+        content_hash TEXT PRIMARY KEY,
+        file_id TEXT NOT NULL,
+        uploaded_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+
+
+#v11: архив старых броней и закрытых заказов (database.archive_bookings)
+def _archive(c):
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS bookings_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER,
+        table_id INTEGER,
+        booking_date TEXT,
+        booking_time TEXT,
+        people_count INTEGER,
+        pre_order_sum REAL DEFAULT 0,
+        status TEXT,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_user_created '
+              'ON bookings_archive(user_id, created_at)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_date '
+              'ON bookings_archive(booking_date)')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_bookings_archive_table '
+              'ON bookings_archive(table_id)')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS orders_archive (
+        id INTEGER PRIMARY KEY,
+        link_uuid TEXT,
+        initiator_id INTEGER,
+        booking_id INTEGER,
+        status TEXT,
+        created_at TIMESTAMP,
+        archived_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_archive_booking '
+              'ON orders_archive(booking_id)')
+    # Выборка закрытых заказов на перенос
+    c.execute('CREATE INDEX IF NOT EXISTS idx_orders_status_created '
+              'ON orders(status, created_at)')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS cart_items_archive (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        user_id INTEGER,
+        item_id INTEGER,
+        quantity INTEGER,
+        unit_price REAL
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_cart_items_archive_order '
+              'ON cart_items_archive(order_id)')
+
+    c.execute('''
+    CREATE TABLE IF NOT EXISTS order_participants_archive (
+        id INTEGER PRIMARY KEY,
+        order_id INTEGER,
+        user_id INTEGER,
+        joined_at TIMESTAMP
+    )''')
+    c.execute('CREATE INDEX IF NOT EXISTS idx_order_participants_archive_order '
+              'ON order_participants_archive(order_id)')
+
+    # Перенос в архив — DELETE из горячей таблицы, триггеры v5 уменьшают
+    # total_bookings и closed_orders; возвращаем их вставкой в архив.
+    # active_bookings и preorder_sum считаются только по горячей таблице.
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_archive_ins AFTER INSERT ON bookings_archive
+    BEGIN UPDATE stats SET total_bookings = total_bookings + 1 WHERE id = 1; END''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_bookings_archive_del AFTER DELETE ON bookings_archive
+    BEGIN UPDATE stats SET total_bookings = total_bookings - 1 WHERE id = 1; END''')
+    c.execute('''
+    CREATE TRIGGER IF NOT EXISTS trg_stats_orders_archive_ins AFTER INSERT ON orders_archive
+    BEGIN UPDATE stats SET closed_orders = closed_orders + 1 WHERE id = 1; END''')
+
+
+#v12: бронь компании на несколько соседних столов (seating.py)
+def _parties(c):
+    # Строки остальных столов компании ссылаются на основную бронь через
+    # party_id, основная — сама на себя (party_id = id): по строке видно,
+    # что это компания. У обычных броней party_id пустой
+    for table in ('bookings', 'bookings_archive'):
+        if 'party_id' not in _columns(c, table):
+            c.execute(f'ALTER TABLE {table} ADD COLUMN party_id INTEGER')
+        c.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_party ON {table}(party_id)')
+
+    # В счётчиках компания — одна бронь: дополнительные столы не считаем
+    main = "({r}.party_id IS NULL OR {r}.party_id = {r}.id)"
+    active = "(CASE WHEN {r}.status = 'active' THEN 1 ELSE 0 END)"
+    preorder = "(CASE WHEN {r}.status = 'active' THEN COALESCE({r}.pre_order_sum, 0) ELSE 0 END)"
+    for name in ('bookings_ins', 'bookings_del', 'bookings_upd',
+                 'bookings_archive_ins', 'bookings_archive_del'):
+        c.execute(f'DROP TRIGGER IF EXISTS trg_stats_{name}')
+    c.execute(f'''
+    CREATE TRIGGER trg_stats_bookings_ins AFTER INSERT ON bookings
+    WHEN {main.format(r='NEW')}
+    BEGIN UPDATE stats SET
+        total_bookings = total_bookings + 1,
+        active_bookings = active_bookings + {active.format(r='NEW')},
+        preorder_sum = preorder_sum + {preorder.format(r='NEW')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER trg_stats_bookings_del AFTER DELETE ON bookings
+    WHEN {main.format(r='OLD')}
+    BEGIN UPDATE stats SET
+        total_bookings = total_bookings - 1,
+        active_bookings = active_bookings - {active.format(r='OLD')},
+        preorder_sum = preorder_sum - {preorder.format(r='OLD')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER trg_stats_bookings_upd AFTER UPDATE OF status, pre_order_sum ON bookings
+    WHEN {main.format(r='NEW')}
+    BEGIN UPDATE stats SET
+        active_bookings = active_bookings + {active.format(r='NEW')} - {active.format(r='OLD')},
+        preorder_sum = preorder_sum + {preorder.format(r='NEW')} - {preorder.format(r='OLD')}
+    WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER trg_stats_bookings_archive_ins AFTER INSERT ON bookings_archive
+    WHEN {main.format(r='NEW')}
+    BEGIN UPDATE stats SET total_bookings = total_bookings + 1 WHERE id = 1; END''')
+    c.execute(f'''
+    CREATE TRIGGER trg_stats_bookings_archive_del AFTER DELETE ON bookings_archive
+    WHEN {main.format(r='OLD')}
+    BEGIN UPDATE stats SET total_bookings = total_bookings - 1 WHERE id = 1; END''')
+
+
+# Порядок важен: новые шаги только дописываются в конец
+MIGRATIONS = [
+    (1, _base_schema),
+    (2, _indexes),
+    (3, _bookings_by_date),
+    (4, _unique_active_slot),
+    (5, _stats_counters),
+    (6, _bookings_by_status),
+    (7, _cart_lines),
+    (8, _fsm_storage),
+    (9, _cache_epoch),
+    (10, _media_files),
+    (11, _archive),
+    (12, _parties),
+]
+
+
+def get_version(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )''')
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn):
+    """Применить все ещё не применённые шаги. Возвращает итоговую версию."""
+    current = get_version(conn)
+    conn.commit()
+    for version, step in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute('BEGIN')
+        try:
+            step(conn.cursor())
+            conn.execute('INSERT INTO schema_version (version) VALUES (?)', (version,))
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        logger.info("Миграция схемы v%s применена (%s)", version, step.__name__)
+        current = version
+    conn.execute('PRAGMA optimize')
+    return current
@@ -0,0 +1,68 @@
+"""Подбор столов для компании: наименьший набор соседних свободных столов.
+
+Столы — вершины графа, рёбра — tables.neighbors (связь считается взаимной,
+даже если записана только у одного из столов). Для компании, которой не
+хватает одного стола, ищется связный набор столов, свободных в нужный час,
+с суммой мест не меньше числа гостей: из наименьшего числа столов, а среди
+таких — с наименьшим числом лишних мест.
+
+Схема зала (Floor) строится один раз и кэшируется в database.floor до
+изменения столов; занятость берётся из индекса availability.SlotIndex.
+"""
+
+
+class Floor:
+    def __init__(self, tables):
+        # tables — словарь id -> стол, как из database.get_all_tables
+        self.names = {t_id: t['name'] for t_id, t in tables.items()}
+        self.seats = {t_id: t['seats'] for t_id, t in tables.items()}
+        adjacency = {t_id: set() for t_id in tables}
+        for t_id, t in tables.items():
+            for n in t['neighbors']:
+                if n in adjacency and n != t_id:
+                    adjacency[t_id].add(n)
+                    adjacency[n].add(t_id)
+        self.adjacency = {t_id: frozenset(n) for t_id, n in adjacency.items()}
+
+    def label(self, table_ids) -> str:
+        return " + ".join(self.names.get(t, "?") for t in table_ids)
+
+    def combine(self, people, free, max_tables):
+        """Столы из free на people гостей (список id) или None."""
+        free = set(free)
+        largest = sorted((self.seats[t] for t in free), reverse=True)
+        for size in range(1, max_tables + 1):
+            # Даже size самых больших свободных столов не хватает — не перебираем
+            if sum(largest[:size]) < people:
+                continue
+            best = None
+            for group in self._connected(free, size):
+                spare = sum(self.seats[t] for t in group) - people
+                if spare >= 0 and (best is None or (spare, group) < best):
+                    best = (spare, group)
+            if best is not None:
+                return list(best[1])
+        return None
+
+    def _connected(self, free, size):
+        """Связные наборы из size столов среди free, каждый ровно один раз.
+
+        Алгоритм ESU (Wernicke): набор растёт от наименьшего id root только
+        через столы с id больше root и только через «новых» соседей, поэтому
+        одинаковые наборы не порождаются разными путями.
+        """
+        for root in sorted(free):
+            frontier = {n for n in self.adjacency[root] if n in free and n > root}
+            yield from self._extend((root,), frontier, self.adjacency[root] | {root}, root, free, size)
+
+    def _extend(self, group, frontier, reached, root, free, size):
+        if len(group) == size:
+            yield tuple(sorted(group))
+            return
+        frontier = set(frontier)
+        while frontier:
+            t = frontier.pop()
+            exclusive = {n for n in self.adjacency[t]
+                         if n in free and n > root and n not in reached}
+            yield from self._extend(group + (t,), frontier | exclusive,
+                                    reached | self.adjacency[t], root, free, size)
@@ -0,0 +1,201 @@
+"""Трассировка SQL: время каждого запроса, журнал медленных и их планы.
+
+Включается DB_TRACE в config.py: get_connection отдаёт соединение-обёртку,
+которая засекает execute и последующие fetch* каждого запроса. Запросы
+медленнее DB_SLOW_QUERY_MS пишутся в лог с параметрами и функцией
+database.py, из которой пришли, а при DB_TRACE_EXPLAIN — ещё и с
+EXPLAIN QUERY PLAN (SCAN без индекса сразу видно). Статистика копится по
+тексту запроса; tracer.report() — топ по суммарному времени.
+"""
+
+import logging
+import re
+import reprlib
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_SPACES = re.compile(r"\s+")
+_EXPLAINABLE = ("SELECT", "WITH", "UPDATE", "DELETE", "INSERT", "REPLACE")
+
+
+def normalize(sql: str) -> str:
+    return _SPACES.sub(" ", sql).strip()
+
+
+def _caller():
+    """Первая функция вне этого модуля и contextlib — обычно из database.py."""
+    frame = sys._getframe(2)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename != __file__ and not filename.endswith("contextlib.py"):
+            return frame.f_code.co_name
+        frame = frame.f_back
+    return "?"
+
+
+class QueryStats:
+    __slots__ = ("sql", "count", "total", "max", "rows", "callers", "plan", "params")
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.rows = 0
+        self.callers = set()
+        self.plan = None
+        self.params = ()  # параметры последнего вызова, для EXPLAIN в отчёте (None — без плана)
+
+
+class Tracer:
+    def __init__(self, slow_ms, explain):
+        self.slow = slow_ms / 1000
+        self.explain = explain
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def record(self, conn, sql, params, seconds, rows, caller):
+        key = normalize(sql)
+        with self._lock:
+            stats = self._stats.get(key)
+            if stats is None:
+                stats = self._stats[key] = QueryStats(key)
+            stats.count += 1
+            stats.total += seconds
+            stats.max = max(stats.max, seconds)
+            stats.rows += rows
+            stats.callers.add(caller)
+            stats.params = params
+            need_plan = (self.explain and stats.plan is None and params is not None
+                         and seconds >= self.slow)
+        if seconds < self.slow:
+            return
+        if need_plan:
+            stats.plan = self._explain(conn, sql, params)
+        logger.warning("Медленный запрос %.1f мс (%s, строк: %s): %s %s%s",
+                       seconds * 1000, caller, rows, key, reprlib.repr(params),
+                       "".join(f"\n    {line}" for line in stats.plan or ()))
+
+    @staticmethod
+    def _explain(conn, sql, params):
+        if params is None or not normalize(sql).upper().startswith(_EXPLAINABLE):
+            return []
+        try:
+            rows = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+        except Exception as e:
+            return [f"(план недоступен: {e})"]
+        return [row[-1] for row in rows]
+
+    def top(self, n=20):
+        with self._lock:
+            stats = list(self._stats.values())
+        return sorted(stats, key=lambda s: s.total, reverse=True)[:n]
+
+    def report(self, n=20, conn=None) -> str:
+        """Топ запросов; с conn — заодно планы тех, что не попали в медленные."""
+        lines = [f"Топ-{n} запросов по суммарному времени:"]
+        for s in self.top(n):
+            if conn is not None and s.plan is None:
+                s.plan = self._explain(conn, s.sql, s.params)
+            lines.append(
+                f"{s.total * 1000:10.1f} мс  ×{s.count:<7} ср {s.total / s.count * 1000:.2f} "
+                f"макс {s.max * 1000:.1f} мс  строк {s.rows}  [{', '.join(sorted(s.callers))}]")
+            lines.append(f"    {s.sql[:200]}")
+            if s.plan:
+                lines.extend(f"      {line}" for line in s.plan)
+        return "\n".join(lines)
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+
+
+class TracedCursor:
+    """Курсор, засекающий запрос от execute до последнего fetch."""
+
+    def __init__(self, conn, cursor, tracer):
+        self._conn = conn
+        self._cursor = cursor
+        self._tracer = tracer
+        self._pending = None  # [sql, params, секунды, строки, вызывающая функция]
+
+    def _finish(self):
+        if self._pending is not None:
+            sql, params, seconds, rows, caller = self._pending
+            self._pending = None
+            self._tracer.record(self._conn, sql, params, seconds, rows, caller)
+
+    def _run(self, method, sql, params, rows_of, traced_params):
+        self._finish()
+        started = time.perf_counter()
+        getattr(self._cursor, method)(sql, params)
+        seconds = time.perf_counter() - started
+        self._pending = [sql, traced_params, seconds, rows_of(self._cursor), _caller()]
+        return self
+
+    def execute(self, sql, params=()):
+        return self._run("execute", sql, params, lambda c: 0, params)
+
+    def executemany(self, sql, seq):
+        # Для лога и EXPLAIN — первый набор параметров; пустой seq — без плана
+        seq = list(seq)
+        return self._run("executemany", sql, seq, lambda c: max(c.rowcount, 0),
+                         seq[0] if seq else None)
+
+    def _fetch(self, method, *args):
+        started = time.perf_counter()
+        result = getattr(self._cursor, method)(*args)
+        if self._pending is not None:
+            self._pending[2] += time.perf_counter() - started
+            self._pending[3] += (1 if result is not None else 0) if method == "fetchone" else len(result)
+        return result
+
+    def fetchone(self):
+        return self._fetch("fetchone")
+
+    def fetchall(self):
+        return self._fetch("fetchall")
+
+    def fetchmany(self, size=None):
+        return self._fetch("fetchmany", size if size is not None else self._cursor.arraysize)
+
+    def __iter__(self):
+        return iter(self.fetchall())
+
+    def close(self):
+        self._finish()
+        self._cursor.close()
+
+    def __getattr__(self, name):
+        # lastrowid, rowcount, description...
+        return getattr(self._cursor, name)
+
+
+class TracedConnection:
+    def __init__(self, conn, tracer):
+        self._conn = conn
+        self._tracer = tracer
+        self._cursors = []
+
+    def cursor(self):
+        cursor = TracedCursor(self._conn, self._conn.cursor(), self._tracer)
+        self._cursors.append(cursor)
+        return cursor
+
+    def execute(self, sql, params=()):
+        return self.cursor().execute(sql, params)
+
+    def executemany(self, sql, seq):
+        return self.cursor().executemany(sql, seq)
+
+    def finish(self):
+        """Досчитать незакрытые запросы; вызывается при возврате соединения в пул."""
+        for cursor in self._cursors:
+            cursor._finish()
+        self._cursors = []
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
@@ -0,0 +1,137 @@
+"""Хранилище FSM в SQLite с отложенной записью.
+
+Состояние диалога читается из БД один раз и дальше живёт в памяти.
+Изменения (set_state, update_data) только помечают запись грязной;
+flush() пишет все грязные записи одной транзакцией. FSMFlushMiddleware
+вызывает flush() после каждого апдейта, так что несколько update_data
+в одном хендлере дают одну запись в БД. В памяти держится не больше
+FSM_CACHE_SIZE диалогов: давно не тронутые и уже записанные вытесняются.
+"""
+
+import asyncio
+import json
+import logging
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Mapping
+
+from aiogram import BaseMiddleware
+from aiogram.fsm.state import State
+from aiogram.fsm.storage.base import BaseStorage, StateType, StorageKey
+from aiogram.types import TelegramObject
+
+import async_db
+from config import FSM_CACHE_SIZE
+
+logger = logging.getLogger(__name__)
+
+
+class SQLiteStorage(BaseStorage):
+    def __init__(self, maxsize=FSM_CACHE_SIZE):
+        # key -> [state, data], от давно не тронутых к свежим
+        self._records: OrderedDict[str, list] = OrderedDict()
+        self._maxsize = maxsize
+        self._dirty: set[str] = set()
+        self._loading: dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def _key(key: StorageKey) -> str:
+        return ":".join(str(part) if part is not None else "" for part in (
+            key.bot_id, key.chat_id, key.user_id, key.thread_id,
+            key.business_connection_id, key.destiny))
+
+    async def _record(self, key: StorageKey) -> list:
+        k = self._key(key)
+        record = self._records.get(k)
+        if record is not None:
+            self._records.move_to_end(k)
+            return record
+        # Параллельные апдейты одного чата ждут одну и ту же загрузку
+        pending = self._loading.get(k)
+        if pending is not None:
+            return await pending
+        future = asyncio.get_running_loop().create_future()
+        self._loading[k] = future
+        try:
+            row = await async_db.fsm_load(k)
+            record = [row[0], json.loads(row[1])] if row else [None, {}]
+            self._records[k] = record
+            future.set_result(record)
+        except Exception as e:
+            future.set_exception(e)
+            # Ожидающие получат ошибку сами; без них она бы ушла в лог
+            # «Future exception was never retrieved». Следующий вызов загрузит заново
+            future.exception()
+            raise
+        finally:
+            del self._loading[k]
+        self._evict()
+        return record
+
+    def _evict(self):
+        # Вытесняются только записанные диалоги: их можно перечитать fsm_load
+        excess = len(self._records) - self._maxsize
+        if excess <= 0:
+            return
+        for k in [k for k in self._records if k not in self._dirty][:excess]:
+            del self._records[k]
+
+    async def set_state(self, key: StorageKey, state: StateType = None) -> None:
+        record = await self._record(key)
+        record[0] = state.state if isinstance(state, State) else state
+        self._dirty.add(self._key(key))
+
+    async def get_state(self, key: StorageKey) -> str | None:
+        return (await self._record(key))[0]
+
+    async def set_data(self, key: StorageKey, data: Mapping[str, Any]) -> None:
+        record = await self._record(key)
+        record[1] = dict(data)
+        self._dirty.add(self._key(key))
+
+    async def get_data(self, key: StorageKey) -> dict[str, Any]:
+        return dict((await self._record(key))[1])
+
+    async def flush(self) -> None:
+        """Записать все изменённые диалоги в БД."""
+        if not self._dirty:
+            return
+        keys = list(self._dirty)
+        self._dirty.clear()
+        batch = []
+        for k in keys:
+            state, data = self._records[k]
+            batch.append((k, state, json.dumps(data, ensure_ascii=False)))
+        try:
+            await async_db.fsm_save(batch)
+        except Exception:
+            self._dirty.update(keys)
+            raise
+        # Пустые диалоги держать в памяти незачем: в БД их тоже нет
+        for k in keys:
+            if k not in self._dirty and self._records.get(k) == [None, {}]:
+                del self._records[k]
+        self._evict()
+
+    async def close(self) -> None:
+        await self.flush()
+
+
+class FSMFlushMiddleware(BaseMiddleware):
+    """Сбрасывает накопленные изменения FSM после обработки апдейта."""
+
+    def __init__(self, storage: SQLiteStorage):
+        self.storage = storage
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        try:
+            return await handler(event, data)
+        finally:
+            try:
+                await self.storage.flush()
+            except Exception:
+                logger.exception("Не удалось сохранить состояние FSM")
@@ -0,0 +1,77 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+DAY = "2030-01-01"
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    database.close_pool()
+    monkeypatch.setattr(database, "DB_NAME", str(tmp_path / "test.db"))
+    database.init_db()
+    database.slots.clear()
+    database.floor.invalidate()
+    yield database
+    database.close_pool()
+
+
+def _floor(db, *names):
+    for name in names:
+        db.add_table(name, 4)
+    ids = {t["name"]: t_id for t_id, t in db.get_all_tables().items()}
+    db.add_user(1, "guest", "Гость")
+    db.add_user(2, "other", "Другой")
+    return ids
+
+
+def _rows(db, table="bookings"):
+    with db.get_connection(readonly=True) as conn:
+        return {row["table_id"]: (row["status"], row["party_id"])
+                for row in conn.execute(f"SELECT * FROM {table}")}
+
+
+def test_delete_table_of_party_removes_whole_party(db):
+    t = _floor(db, "A", "B", "C", "D")
+    party = db.book_slot(1, t["A"], DAY, "12:00", 10, extra_tables=(t["B"], t["C"]))
+    db.book_slot(2, t["D"], DAY, "12:00", 2)
+
+    db.delete_table(t["B"])
+
+    assert set(_rows(db)) == {t["D"]}
+    assert db.get_active_booking(1) is None
+    assert db.get_stats()["active_bookings"] == 1
+    assert party["booking_id"] not in [r["id"] for r in db.get_bookings_page()[0]]
+
+
+def test_delete_table_keeps_unrelated_archived_parties(db):
+    t = _floor(db, "A", "B", "C", "D")
+    db.book_slot(1, t["A"], DAY, "12:00", 6, extra_tables=(t["B"],))
+    db.book_slot(2, t["C"], DAY, "12:00", 6, extra_tables=(t["D"],))
+    db.book_slot(2, t["C"], DAY, "13:00", 2)
+    db.archive_bookings("2031-01-01")
+
+    db.delete_table(t["B"])
+
+    archived = _rows(db, "bookings_archive")
+    assert t["A"] not in archived
+    assert {t["C"], t["D"]} <= set(archived)
+    assert db.reconcile_stats()["total_bookings"] == 2
+
+
+def test_archived_past_bookings_are_completed(db):
+    t = _floor(db, "A", "B")
+    db.book_slot(1, t["A"], DAY, "12:00", 2)
+    db.book_slot(1, t["B"], DAY, "13:00", 2)
+    db.cancel_booking(1)
+    db.archive_bookings("2031-01-01")
+
+    assert sorted(h["status"] for h in db.get_user_bookings_history(1)) == ["cancelled", "completed"]
+    stats = db.get_stats()
+    assert stats["active_bookings"] == 0
+    assert db.reconcile_stats() == stats
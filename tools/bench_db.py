@@ -0,0 +1,379 @@
+"""Бенчмарк функций database.py на базе production-размера.
+
+Создаёт отдельную БД (по умолчанию bench.db, рабочая restaurant.db не
+трогается) с реалистичными объёмами: 50k пользователей, 500k броней
+(из них 10k компаний на два стола), 100k строк корзин, 200 позиций меню — и замеряет публичные функции
+database.py. Результаты пишутся в JSON, два прогона можно сравнить.
+
+    python tools/bench_db.py --out before.json
+    # ...изменения схемы или запросов...
+    python tools/bench_db.py --out after.json --compare before.json
+
+База пересоздаётся, только если её нет или изменились объёмы (--scale)
+либо передан --reseed. Замеры идут на копии (bench.db.run), которая
+удаляется после прогона: пишущие функции не меняют данные следующих
+прогонов, поэтому повторные прогоны и --compare идут на тех же данных.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import time
+from datetime import date, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import database  # noqa: E402
+from availability import slot_label  # noqa: E402
+from config import WORKING_HOURS_START, WORKING_HOURS_END  # noqa: E402
+from replay_updates import percentile  # noqa: E402
+
+VOLUMES = {"users": 50_000, "bookings": 500_000, "parties": 10_000, "cart_lines": 100_000}
+MENU_ITEMS = 200
+TABLES = 60
+HISTORY_DAYS = 730
+CATEGORIES = ["Закуски", "Салаты", "Супы", "Горячее", "Гарнир", "Десерты", "Напитки", "Бар"]
+
+
+#  Наполнение
+def volumes(scale):
+    return {k: max(1, int(v * scale)) for k, v in VOLUMES.items()}
+
+
+def _remove_db(path):
+    for suffix in ("", "-wal", "-shm"):
+        if os.path.exists(path + suffix):
+            os.remove(path + suffix)
+
+
+def _copy_db(src, dst):
+    """Рабочая копия засеянной базы (backup API учитывает и WAL)."""
+    _remove_db(dst)
+    source, target = sqlite3.connect(src), sqlite3.connect(dst)
+    with target:
+        source.backup(target)
+    source.close()
+    target.close()
+
+
+def seed(path, counts, rng):
+    """Пересоздать БД по миграциям и залить данные одной транзакцией."""
+    _remove_db(path)
+    database.init_db()
+    database.close_pool()
+
+    today = date.today()
+    hours = range(WORKING_HOURS_START, WORKING_HOURS_END)
+    conn = sqlite3.connect(path)
+    conn.execute('PRAGMA synchronous = OFF')
+    with conn:
+        c = conn.cursor()
+        c.executemany('INSERT INTO tables (name, seats, neighbors) VALUES (?, ?, ?)', [
+            (f"Стол {i:02d}", rng.choice((2, 2, 4, 4, 6, 8)),
+             json.dumps([n for n in (i - 1, i + 1) if 1 <= n <= TABLES]))
+            for i in range(1, TABLES + 1)])
+        c.executemany('INSERT INTO menu (name, price, description, category) VALUES (?, ?, ?, ?)', [
+            (f"Блюдо {i:03d}", rng.randint(4, 60) * 50, "", rng.choice(CATEGORIES))
+            for i in range(1, MENU_ITEMS + 1)])
+
+        n_users = counts["users"]
+        c.executemany(
+            'INSERT INTO users (user_id, username, full_name, phone_number, role) VALUES (?, ?, ?, ?, ?)',
+            ((uid, f"user{uid}", f"Гость {uid}", f"+7900{uid:07d}" if uid % 3 else None,
+              'employee' if uid % 1000 == 0 else 'user')
+             for uid in range(1, n_users + 1)))
+
+        # Активная бронь на слот может быть только одна (ux_bookings_active_slot)
+        taken = set()
+        bookings = []
+        for _ in range(counts["bookings"]):
+            day = today + timedelta(days=rng.randint(-HISTORY_DAYS, 7))
+            table_id, hour = rng.randint(1, TABLES), rng.choice(hours)
+            slot = (table_id, day, hour)
+            status = 'active' if slot not in taken and rng.random() < 0.2 else 'cancelled'
+            if status == 'active':
+                taken.add(slot)
+            bookings.append((rng.randint(1, n_users), table_id, day.isoformat(), slot_label(hour),
+                             rng.randint(1, 8), rng.choice((0, 0, 0, 1500, 3000)), status))
+        c.executemany('''
+            INSERT INTO bookings (user_id, table_id, booking_date, booking_time,
+                                  people_count, pre_order_sum, status)
+            VALUES (?, ?, ?, ?, ?, ?, ?)''', bookings)
+
+        # Компании: основная бронь (party_id = id) и соседний стол;
+        # занятый активный слот соседа пропускается
+        parties = rng.sample(range(1, len(bookings) + 1), min(counts["parties"], len(bookings)))
+        c.executemany('UPDATE bookings SET party_id = id WHERE id = ?', ((b,) for b in parties))
+        c.execute(f'''
+            INSERT OR IGNORE INTO bookings (user_id, table_id, booking_date, booking_time,
+                                            people_count, status, party_id)
+            SELECT user_id, table_id % {TABLES} + 1, booking_date, booking_time, 0, status, id
+            FROM bookings WHERE party_id = id''')
+
+        # Заказы: в среднем по 5 строк корзины и 2-3 участника
+        n_orders = max(1, counts["cart_lines"] // 5)
+        orders, participants = [], []
+        for order_id in range(1, n_orders + 1):
+            initiator = rng.randint(1, n_users)
+            booking_id = rng.randint(1, len(bookings)) if rng.random() < 0.5 else None
+            orders.append((order_id, f"{order_id:08x}", initiator, booking_id,
+                           'open' if rng.random() < 0.1 else 'closed'))
+            guests = {initiator} | {rng.randint(1, n_users) for _ in range(rng.randint(0, 3))}
+            participants.extend((order_id, uid) for uid in guests)
+        c.executemany('INSERT INTO orders (id, link_uuid, initiator_id, booking_id, status) '
+                      'VALUES (?, ?, ?, ?, ?)', orders)
+        c.executemany('INSERT INTO order_participants (order_id, user_id) VALUES (?, ?)', participants)
+
+        by_order = {}
+        for order_id, uid in participants:
+            by_order.setdefault(order_id, []).append(uid)
+        lines = set()
+        while len(lines) < counts["cart_lines"]:
+            order_id = rng.randint(1, n_orders)
+            lines.add((order_id, rng.choice(by_order[order_id]), rng.randint(1, MENU_ITEMS)))
+        c.executemany('''
+            INSERT INTO cart_items (order_id, user_id, item_id, quantity, unit_price)
+            SELECT ?, ?, ?, ?, price FROM menu WHERE id = ?''',
+            ((o, u, i, rng.randint(1, 3), i) for o, u, i in sorted(lines)))
+    conn.execute('ANALYZE')
+    conn.close()
+
+
+def sample(rng, size=500):
+    """Ключи для аргументов: берутся из самой базы, чтобы запросы что-то находили."""
+    def ids(sql):
+        with database.get_connection(readonly=True) as conn:
+            rows = [r[0] for r in conn.execute(sql)]
+        return rng.sample(rows, min(size, len(rows))) or [0]
+
+    today = date.today()
+    return {
+        "users": ids('SELECT user_id FROM users'),
+        "active_users": ids("SELECT DISTINCT user_id FROM bookings WHERE status = 'active' "
+                            "AND booking_date >= date('now')"),
+        "party_users": ids("SELECT user_id FROM bookings WHERE party_id = id AND status = 'active'"),
+        "initiators": ids("SELECT initiator_id FROM orders WHERE status = 'open'"),
+        "orders": ids('SELECT DISTINCT order_id FROM cart_items'),
+        "uuids": ids('SELECT link_uuid FROM orders'),
+        "booked": ids('SELECT booking_id FROM orders WHERE booking_id IS NOT NULL'),
+        "tables": ids('SELECT id FROM tables'),
+        "items": ids('SELECT id FROM menu'),
+        "dates": [(today + timedelta(days=d)).isoformat() for d in range(-30, 8)],
+        "future": [(today + timedelta(days=d)).isoformat() for d in range(1, 8)],
+        "hours": list(range(WORKING_HOURS_START, WORKING_HOURS_END)),
+    }
+
+
+#  Замеры
+def pick(seq):
+    return lambda rng: (rng.choice(seq),)
+
+
+def cases(s):
+    """(имя, функция, аргументы(rng)). Имена с ':' — варианты одной функции."""
+    none = lambda rng: ()  # noqa: E731
+    deep_cursor = {}
+
+    def bookings_deep(rng):
+        # Курсор из середины списка: keyset-пагинация не должна замедляться к концу
+        if "cursor" not in deep_cursor:
+            cursor = None
+            for _ in range(50):
+                _, cursor = database.get_bookings_page(status=None, after=cursor)
+            deep_cursor["cursor"] = cursor
+        return ()
+
+    return [
+        ("ping", database.ping, none),
+        # Меню
+        ("get_menu_page", database.get_menu_page, lambda rng: (rng.randint(1, 40),)),
+        ("get_menu_item", database.get_menu_item, pick(s["items"])),
+        ("get_all_menu_items", database.get_all_menu_items, none),
+        ("_load_menu:cold", database._load_menu, none),
+        # Пользователи
+        ("get_user", database.get_user, pick(s["users"])),
+        ("_load_user:cold", database._load_user, pick(s["users"])),
+        ("get_all_users", database.get_all_users, none),
+        # Столы и брони
+        ("get_all_tables", database.get_all_tables, none),
+        ("get_active_booking", database.get_active_booking, pick(s["active_users"])),
+        ("get_active_booking:party", database.get_active_booking, pick(s["party_users"])),
+        ("get_user_bookings_history", database.get_user_bookings_history, pick(s["users"])),
+        ("get_user_bookings_history:party", database.get_user_bookings_history,
+         pick(s["party_users"])),
+        ("get_table_bookings", database.get_table_bookings,
+         lambda rng: (rng.choice(s["tables"]), rng.choice(s["dates"]))),
+        ("get_table_bookings:all_dates", database.get_table_bookings, pick(s["tables"])),
+        ("get_free_slots", database.get_free_slots,
+         lambda rng: (rng.choice(s["tables"]), rng.choice(s["future"]))),
+        ("_load_day_bookings:cold", database._load_day_bookings, pick(s["dates"])),
+        ("get_free_tables", database.get_free_tables,
+         lambda rng: (rng.choice(s["future"]), rng.choice(s["hours"]), rng.randint(1, 6))),
+        ("get_bookings_page", database.get_bookings_page, none),
+        ("get_bookings_page:all_statuses",
+         lambda: database.get_bookings_page(status=None, after=deep_cursor["cursor"]), bookings_deep),
+        ("get_bookings_page:date_range", database.get_bookings_page,
+         lambda rng: ('active', s["future"][0], s["future"][-1])),
+        ("get_all_bookings_full", database.get_all_bookings_full, none),
+        # Заказы
+        ("get_order_by_uuid", database.get_order_by_uuid, pick(s["uuids"])),
+        ("get_order_by_id", database.get_order_by_id, pick(s["orders"])),
+        ("get_order_by_booking_id", database.get_order_by_booking_id, pick(s["booked"])),
+        ("get_active_order_by_user", database.get_active_order_by_user, pick(s["initiators"])),
+        ("get_order_participants", database.get_order_participants, pick(s["orders"])),
+        ("get_cart_items", database.get_cart_items, pick(s["orders"])),
+        ("get_order_total", database.get_order_total, pick(s["orders"])),
+        ("get_order_subtotals", database.get_order_subtotals, pick(s["orders"])),
+        # Статистика
+        ("get_stats", database.get_stats, none),
+        ("reconcile_stats", database.reconcile_stats, none),
+    ]
+
+
+def write_cases(s):
+    return [
+        ("add_to_cart", database.add_to_cart,
+         lambda rng: (rng.choice(s["orders"]), rng.choice(s["users"]), rng.choice(s["items"]))),
+        ("create_order", database.create_order, pick(s["users"])),
+        ("book_slot", database.book_slot,
+         lambda rng: (rng.choice(s["users"]), rng.choice(s["tables"]), rng.choice(s["future"]),
+                      slot_label(rng.choice(s["hours"])), 2)),
+        ("update_user_phone", database.update_user_phone,
+         lambda rng: (rng.choice(s["users"]), f"+7999{rng.randint(0, 9999999):07d}")),
+        ("fsm_save", database.fsm_save,
+         lambda rng: ([(f"bench:{rng.randint(1, 1000)}", "BookingStates:waiting_for_date",
+                        '{"booking_date": "2030-01-01"}')],)),
+    ]
+
+
+def measure(func, make_args, rng, iterations, max_seconds):
+    """Время вызовов в секундах; не больше iterations и примерно max_seconds."""
+    for _ in range(3):
+        func(*make_args(rng))
+    times = []
+    deadline = time.perf_counter() + max_seconds
+    while len(times) < iterations and (len(times) < 5 or time.perf_counter() < deadline):
+        args = make_args(rng)
+        started = time.perf_counter()
+        func(*args)
+        times.append(time.perf_counter() - started)
+    times.sort()
+    return {
+        "n": len(times),
+        "min_ms": times[0] * 1000,
+        "median_ms": percentile(times, 0.5) * 1000,
+        "p95_ms": percentile(times, 0.95) * 1000,
+        "mean_ms": sum(times) / len(times) * 1000,
+    }
+
+
+def _git_rev():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline, threshold):
+    """Печатает медианы рядом; возвращает имена замеров, ставших медленнее порога."""
+    regressions = []
+    print(f"\n{'замер':<34}{'было':>10}{'стало':>10}{'Δ':>9}")
+    for name, new in results.items():
+        old = baseline.get(name)
+        if not old:
+            continue
+        delta = new["median_ms"] / old["median_ms"] - 1 if old["median_ms"] else 0
+        mark = ""
+        if delta > threshold:
+            regressions.append(name)
+            mark = "  ⚠"
+        print(f"{name:<34}{old['median_ms']:>10.3f}{new['median_ms']:>10.3f}{delta:>+9.0%}{mark}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--db", default=os.path.join(ROOT, "bench.db"))
+    parser.add_argument("--scale", type=float, default=1.0, help="множитель объёмов данных")
+    parser.add_argument("--reseed", action="store_true")
+    parser.add_argument("--seed", type=int, default=42, help="зерно генератора (данные и аргументы)")
+    parser.add_argument("--iterations", type=int, default=300)
+    parser.add_argument("--max-seconds", type=float, default=2.0, help="предел на один замер")
+    parser.add_argument("-k", dest="only", help="только замеры, в имени которых есть подстрока")
+    parser.add_argument("--no-writes", action="store_true", help="без пишущих функций")
+    parser.add_argument("--out", help="сохранить результаты в JSON")
+    parser.add_argument("--compare", help="JSON прошлого прогона")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление медианы")
+    args = parser.parse_args()
+
+    database.DB_NAME = args.db
+    rng = random.Random(args.seed)
+    counts = volumes(args.scale)
+    meta_path = args.db + ".seed.json"
+    seeded = None
+    if os.path.exists(args.db) and os.path.exists(meta_path):
+        with open(meta_path, encoding="utf-8") as f:
+            seeded = json.load(f)
+    if args.reseed or seeded != counts:
+        print(f"Наполнение {args.db}: {counts}…", flush=True)
+        started = time.perf_counter()
+        seed(args.db, counts, rng)
+        with open(meta_path, "w", encoding="utf-8") as f:
+            json.dump(counts, f)
+        print(f"Готово за {time.perf_counter() - started:.1f}с")
+    database.init_db()
+    database.close_pool()
+    run_path = args.db + ".run"
+    _copy_db(args.db, run_path)
+    database.DB_NAME = run_path
+
+    s = sample(random.Random(args.seed))
+    selected = cases(s) + ([] if args.no_writes else write_cases(s))
+    if args.only:
+        selected = [c for c in selected if args.only in c[0]]
+
+    results = {}
+    print(f"{'замер':<34}{'n':>6}{'median':>10}{'p95':>10}{'min':>10}  мс")
+    for name, func, make_args in selected:
+        r = measure(func, make_args, random.Random(args.seed), args.iterations, args.max_seconds)
+        results[name] = r
+        print(f"{name:<34}{r['n']:>6}{r['median_ms']:>10.3f}{r['p95_ms']:>10.3f}{r['min_ms']:>10.3f}",
+              flush=True)
+    database.close_pool()
+    _remove_db(run_path)
+
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "git": _git_rev(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "volumes": counts,
+        },
+        "results": results,
+    }
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("volumes") != counts:
+            print("⚠ Объёмы данных в прогонах различаются — сравнение условное")
+        regressions = compare(results, baseline["results"], args.threshold)
+        if regressions:
+            print(f"\nМедленнее более чем на {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,190 @@
+"""Локальная заглушка Bot API для нагрузочных прогонов без настоящего Telegram.
+
+Бот подключается к ней через BOT_API_URL в config.py. Заглушка отдаёт апдейты
+через getUpdates (polling) или POST-ом на адрес из setWebhook, а все исходящие
+вызовы бота (sendMessage, editMessageText, ...) складывает в очередь чата —
+по ним виртуальные пользователи tools/loadtest.py читают ответы и кнопки.
+
+    python tools/fake_telegram.py --port 8081
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import time
+from collections import defaultdict
+
+import aiohttp
+from aiohttp import web
+
+BOT_USERNAME = "fake_bot"
+
+
+class BotCall:
+    """Один исходящий вызов бота, адресованный чату."""
+
+    __slots__ = ("method", "chat_id", "message_id", "text", "markup", "at")
+
+    def __init__(self, method, chat_id, message_id, text, markup):
+        self.method = method
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.text = text or ""
+        self.markup = markup
+        self.at = time.perf_counter()
+
+    def buttons(self, prefix=""):
+        """callback_data кнопок, начинающиеся с prefix."""
+        if not self.markup:
+            return []
+        return [b["callback_data"] for row in self.markup.get("inline_keyboard", [])
+                for b in row if b.get("callback_data", "").startswith(prefix)]
+
+
+class FakeTelegram:
+    def __init__(self):
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._file_ids = itertools.count(1)
+        self._pending = []
+        self._has_updates = asyncio.Condition()
+        self._callbacks = {}  # callback_query_id -> chat_id (для answerCallbackQuery)
+        self.inbox = defaultdict(asyncio.Queue)  # chat_id -> очередь BotCall
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._webhook_session = None
+        self._webhook_tasks = set()
+        self.calls = defaultdict(int)
+
+    #  Апдейты к боту
+    def next_message_id(self):
+        return next(self._message_ids)
+
+    async def push(self, payload: dict):
+        """Отправить боту апдейт; payload — {"message": ...} или {"callback_query": ...}."""
+        update = {"update_id": next(self._update_ids), **payload}
+        if "callback_query" in payload:
+            cq = payload["callback_query"]
+            self._callbacks[cq["id"]] = cq["from"]["id"]
+        if self.webhook_url:
+            task = asyncio.create_task(self._deliver(update))
+            self._webhook_tasks.add(task)
+            task.add_done_callback(self._webhook_tasks.discard)
+            return
+        async with self._has_updates:
+            self._pending.append(update)
+            self._has_updates.notify_all()
+
+    async def _deliver(self, update):
+        headers = {"X-Telegram-Bot-Api-Secret-Token": self.webhook_secret} if self.webhook_secret else {}
+        try:
+            async with self._webhook_session.post(self.webhook_url, json=update, headers=headers) as resp:
+                await resp.read()
+        except aiohttp.ClientError as e:
+            self.calls[f"webhook_error:{type(e).__name__}"] += 1
+
+    async def _get_updates(self, params):
+        offset = int(params.get("offset") or 0)
+        timeout = float(params.get("timeout") or 0)
+        async with self._has_updates:
+            # Подтверждённые offset-ом апдейты больше не нужны
+            self._pending = [u for u in self._pending if u["update_id"] >= offset]
+            if not self._pending and timeout:
+                try:
+                    await asyncio.wait_for(self._has_updates.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            return list(self._pending[:int(params.get("limit") or 100)])
+
+    #  Вызовы бота
+    def _record(self, method, params, message_id=None):
+        chat_id = int(params["chat_id"])
+        markup = params.get("reply_markup")
+        call = BotCall(method, chat_id, message_id, params.get("text") or params.get("caption"),
+                       json.loads(markup) if isinstance(markup, str) else markup)
+        self.inbox[chat_id].put_nowait(call)
+        return call
+
+    def _message(self, chat_id, message_id, **extra):
+        return {"message_id": message_id, "date": int(time.time()),
+                "chat": {"id": chat_id, "type": "private"}, **extra}
+
+    async def _call(self, method, params):
+        if method == "getUpdates":
+            return await self._get_updates(params)
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "Fake", "username": BOT_USERNAME}
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token", "")
+            if self._webhook_session is None:
+                self._webhook_session = aiohttp.ClientSession()
+            return True
+        if method == "deleteWebhook":
+            self.webhook_url = ""
+            return True
+        if method in ("sendMessage", "sendPhoto"):
+            message_id = self.next_message_id()
+            call = self._record(method, params, message_id)
+            extra = {"text": call.text}
+            if method == "sendPhoto":
+                file_id = params.get("photo")
+                if not isinstance(file_id, str) or file_id.startswith("attach://"):
+                    file_id = f"fake-photo-{next(self._file_ids)}"
+                extra = {"caption": call.text, "photo": [
+                    {"file_id": file_id, "file_unique_id": file_id, "width": 800, "height": 600}]}
+            return self._message(call.chat_id, message_id, **extra)
+        if method in ("editMessageText", "editMessageReplyMarkup"):
+            call = self._record(method, params, int(params["message_id"]))
+            return self._message(call.chat_id, call.message_id, text=call.text)
+        if method == "deleteMessage":
+            return True
+        if method == "answerCallbackQuery":
+            chat_id = self._callbacks.pop(params.get("callback_query_id"), None)
+            if chat_id is not None:
+                self.inbox[chat_id].put_nowait(
+                    BotCall(method, chat_id, None, params.get("text"), None))
+            return True
+        return True
+
+    async def handle(self, request: web.Request):
+        method = request.match_info["method"]
+        self.calls[method] += 1
+        if request.content_type == "application/json":
+            params = await request.json()
+        else:
+            params = {k: v for k, v in (await request.post()).items() if isinstance(v, str)}
+        result = await self._call(method, params)
+        return web.json_response({"ok": True, "result": result})
+
+    def app(self) -> web.Application:
+        app = web.Application(client_max_size=20 * 1024 * 1024)
+        app.router.add_post("/bot{token}/{method}", self.handle)
+        app.on_cleanup.append(self._cleanup)
+        return app
+
+    async def _cleanup(self, app):
+        if self._webhook_tasks:
+            await asyncio.gather(*self._webhook_tasks, return_exceptions=True)
+        if self._webhook_session is not None:
+            await self._webhook_session.close()
+
+
+async def start(fake: FakeTelegram, host: str, port: int) -> web.AppRunner:
+    runner = web.AppRunner(fake.app())
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    args = parser.parse_args()
+    web.run_app(FakeTelegram().app(), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
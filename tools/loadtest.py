@@ -0,0 +1,300 @@
+"""Нагрузочный прогон: виртуальные пользователи проходят настоящие сценарии бота.
+
+Бот работает как обычно (polling, webhook или с воркерами), но ходит не в
+Telegram, а в заглушку tools/fake_telegram.py, которую поднимает этот скрипт.
+Каждый пользователь регистрируется, бронирует стол (дата → гости → стол →
+время → предзаказ; компании больше любого стола — дата → гости → время
+за соседними столами); брони больше SHARED_ORDER_THRESHOLD гостей создают
+совместный заказ, к которому по ссылке ord_ присоединяются другие
+пользователи, набирают корзину, а инициатор оформляет заказ.
+
+    python tools/loadtest.py --seed          # столы и меню в пустую БД
+    # config.py: BOT_API_URL = "http://127.0.0.1:8081", затем python bot.py
+    python tools/loadtest.py --users 2000 --concurrency 500 --ramp 30
+
+Для каждого шага печатаются p50/p95/p99 от отправки апдейта до ответа бота.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import time
+from collections import Counter, defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from fake_telegram import FakeTelegram, start  # noqa: E402
+from replay_updates import percentile  # noqa: E402
+
+LINK_RE = re.compile(r"start=(ord_[\w-]+)")
+
+_callback_ids = itertools.count(1)
+
+
+class StepFailed(Exception):
+    pass
+
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.timeouts = Counter()
+        self.outcomes = Counter()
+        self.updates = 0
+
+    def report(self, elapsed):
+        lines = [f"{'шаг':<14}{'n':>7}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}  мс"]
+        for step, values in sorted(self.latencies.items()):
+            values.sort()
+            ms = [percentile(values, q) * 1000 for q in (0.5, 0.95, 0.99)] + [values[-1] * 1000]
+            lines.append(f"{step:<14}{len(values):>7}" + "".join(f"{v:>9.1f}" for v in ms))
+        lines.append(f"Апдейтов: {self.updates} за {elapsed:.1f}с ({self.updates / elapsed:.1f}/с)")
+        lines.append(f"Итоги сценариев: {dict(self.outcomes)}")
+        if self.timeouts:
+            lines.append(f"Нет ответа: {dict(self.timeouts)}")
+        return "\n".join(lines)
+
+    def as_dict(self, elapsed):
+        steps = {}
+        for step, values in self.latencies.items():
+            values.sort()
+            steps[step] = {"n": len(values), "p50": percentile(values, 0.5),
+                           "p95": percentile(values, 0.95), "p99": percentile(values, 0.99),
+                           "max": values[-1]}
+        return {"elapsed": elapsed, "updates": self.updates,
+                "throughput": self.updates / elapsed if elapsed else 0,
+                "steps": steps, "outcomes": dict(self.outcomes), "timeouts": dict(self.timeouts)}
+
+
+class VirtualUser:
+    def __init__(self, fake: FakeTelegram, user_id: int, stats: Stats, timeout: float):
+        self.fake = fake
+        self.user_id = user_id
+        self.stats = stats
+        self.timeout = timeout
+        self.inbox = fake.inbox[user_id]
+        self.screen = None  # последнее сообщение бота с кнопками
+        self.user = {"id": user_id, "is_bot": False, "first_name": f"U{user_id}",
+                     "username": f"load_{user_id}"}
+
+    def _chat(self):
+        return {"id": self.user_id, "type": "private", "first_name": self.user["first_name"]}
+
+    async def send(self, step, text, expect):
+        message = {"message_id": self.fake.next_message_id(), "date": int(time.time()),
+                   "chat": self._chat(), "from": self.user, "text": text}
+        if text.startswith("/"):
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+        return await self._roundtrip(step, {"message": message}, expect)
+
+    async def click(self, step, data, expect):
+        screen = self.screen
+        query = {"id": str(next(_callback_ids)), "chat_instance": str(self.user_id),
+                 "from": self.user, "data": data,
+                 "message": {"message_id": screen.message_id, "date": int(time.time()),
+                             "chat": self._chat(), "text": screen.text}}
+        return await self._roundtrip(step, {"callback_query": query}, expect)
+
+    async def _roundtrip(self, step, payload, expect):
+        # Хвосты прошлых шагов и рассылки (сводки корзины и т.п.) не считаются ответом
+        while not self.inbox.empty():
+            self.inbox.get_nowait()
+        started = time.perf_counter()
+        self.stats.updates += 1
+        await self.fake.push(payload)
+        deadline = started + self.timeout
+        while True:
+            try:
+                call = await asyncio.wait_for(self.inbox.get(), deadline - time.perf_counter())
+            except (asyncio.TimeoutError, ValueError):
+                self.stats.timeouts[step] += 1
+                raise StepFailed(step)
+            if call.markup and call.message_id:
+                self.screen = call
+            if expect(call):
+                self.stats.latencies[step].append(call.at - started)
+                return call
+
+    def choose(self, prefix):
+        options = self.screen.buttons(prefix) if self.screen else []
+        if not options:
+            raise StepFailed(prefix)
+        return random.choice(options)
+
+
+def has_buttons(prefix):
+    return lambda call: bool(call.buttons(prefix))
+
+
+def has_text(*parts):
+    return lambda call: any(p in call.text for p in parts)
+
+
+def either(*preds):
+    return lambda call: any(p(call) for p in preds)
+
+
+def is_callback_answer(call):
+    return call.method == "answerCallbackQuery"
+
+
+async def register(vu: VirtualUser):
+    call = await vu.send("start", "/start", either(has_text("Как вас зовут"), has_buttons("start_booking")))
+    if call.buttons("start_booking"):
+        return
+    await vu.send("reg_name", f"Гость {vu.user_id}", has_buttons("skip_phone"))
+    await vu.click("skip_phone", "skip_phone", has_buttons("start_booking"))
+
+
+async def book(vu: VirtualUser, people: int):
+    """Возвращает ord_-payload совместного заказа, "" или None, если стол не нашёлся."""
+    await vu.click("start_booking", "start_booking", has_buttons("bdate_"))
+    await vu.click("bdate", vu.choose("bdate_"), has_text("На сколько человек"))
+    call = await vu.send("people", str(people), either(
+        has_buttons("book_tbl_"), has_buttons("ptime_"), has_text("Нет подходящих")))
+    if call.buttons("ptime_"):
+        call = await vu.click("party_time", vu.choose("ptime_"),
+                              either(has_buttons("preorder_"), has_text("только что заняли")))
+        if not call.buttons("preorder_"):
+            vu.stats.outcomes["slot_taken"] += 1
+            return None
+    elif call.buttons("book_tbl_"):
+        call = await vu.click("book_tbl", vu.choose("book_tbl_"), either(has_buttons("time_"), has_text("Все слоты")))
+        if not call.buttons("time_"):
+            return None
+        await vu.click("time", vu.choose("time_"), has_buttons("preorder_"))
+    else:
+        return None
+    call = await vu.click("preorder_no", "preorder_no", has_text("подтверждена", "только что заняли"))
+    if "только что заняли" in call.text:
+        vu.stats.outcomes["slot_taken"] += 1
+        return None
+    link = LINK_RE.search(call.text)
+    return link.group(1) if link else ""
+
+
+async def fill_cart(vu: VirtualUser, payload: str, items: int):
+    call = await vu.send("join_order", f"/start {payload}",
+                         either(has_buttons("add_cart_"), has_text("недействительна")))
+    if not call.buttons("add_cart_"):
+        return False
+    for _ in range(items):
+        await vu.click("add_cart", vu.choose("add_cart_"), is_callback_answer)
+    await vu.click("view_cart", vu.choose("view_cart_"), has_buttons("checkout_"))
+    return True
+
+
+async def scenario(vu: VirtualUser, args, open_orders: list):
+    await register(vu)
+    payload = await book(vu, random.randint(1, args.max_people))
+    if payload is None:
+        vu.stats.outcomes["no_table"] += 1
+    elif payload:
+        vu.stats.outcomes["shared_order"] += 1
+        open_orders.append(payload)
+        if await fill_cart(vu, payload, random.randint(1, 3)):
+            # Даём гостям время набрать корзину
+            await asyncio.sleep(args.order_wait)
+            open_orders.remove(payload)
+            await vu.click("checkout", vu.choose("checkout_"), has_text("Заказ оформлен"))
+            vu.stats.outcomes["checkout"] += 1
+        return
+    else:
+        vu.stats.outcomes["booked"] += 1
+
+    if open_orders and random.random() < args.guest_ratio:
+        if await fill_cart(vu, random.choice(open_orders), random.randint(1, 3)):
+            vu.stats.outcomes["guest"] += 1
+
+
+async def wait_for_bot(fake: FakeTelegram, timeout: float):
+    deadline = time.monotonic() + timeout
+    while not (fake.calls["getUpdates"] or fake.webhook_url):
+        if time.monotonic() > deadline:
+            raise SystemExit("Бот не подключился к заглушке (проверьте BOT_API_URL)")
+        await asyncio.sleep(0.2)
+
+
+async def run(args):
+    fake = FakeTelegram()
+    runner = await start(fake, args.host, args.port)
+    print(f"Заглушка Bot API: http://{args.host}:{args.port}, ждём бота…")
+    try:
+        await wait_for_bot(fake, args.wait_bot)
+        stats = Stats()
+        sem = asyncio.Semaphore(args.concurrency)
+        open_orders = []
+
+        async def one(i):
+            await asyncio.sleep(args.ramp * i / args.users)
+            async with sem:
+                vu = VirtualUser(fake, args.user_base + i, stats, args.timeout)
+                try:
+                    await scenario(vu, args, open_orders)
+                except StepFailed as e:
+                    stats.outcomes[f"failed:{e}"] += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(args.users)))
+        elapsed = time.perf_counter() - started
+    finally:
+        await runner.cleanup()
+
+    print(stats.report(elapsed))
+    print("Вызовы Bot API:", dict(fake.calls))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(stats.as_dict(elapsed), f, ensure_ascii=False, indent=2)
+    return stats
+
+
+def seed(tables, menu_items):
+    """Столы и меню для прогона, если БД пустая. Запускать до старта бота."""
+    import database as db
+
+    db.init_db()
+    if not db.get_all_tables():
+        # Ряды по 4 соседних стола — для компаний за несколькими столами
+        db.import_tables([{"name": f"Стол {i:02d}", "seats": random.choice((2, 4, 6, 8)),
+                           "neighbors": [f"Стол {i + 1:02d}"] if i % 4 and i < tables else []}
+                          for i in range(1, tables + 1)])
+    if not db.get_all_menu_items():
+        for i in range(1, menu_items + 1):
+            db.add_menu_item(f"Блюдо {i:02d}", random.randint(2, 20) * 50)
+    print(f"Столов: {len(db.get_all_tables())}, позиций меню: {len(db.get_all_menu_items())}")
+    db.close_pool()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--seed", action="store_true", help="заполнить БД и выйти")
+    parser.add_argument("--seed-tables", type=int, default=40)
+    parser.add_argument("--seed-menu", type=int, default=30)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=200, help="одновременных пользователей")
+    parser.add_argument("--ramp", type=float, default=10.0, help="секунд на запуск всех пользователей")
+    parser.add_argument("--user-base", type=int, default=10_000_000, help="id первого пользователя")
+    parser.add_argument("--max-people", type=int, default=6)
+    parser.add_argument("--guest-ratio", type=float, default=0.5, help="доля гостей совместных заказов")
+    parser.add_argument("--order-wait", type=float, default=2.0, help="сколько инициатор ждёт гостей, с")
+    parser.add_argument("--timeout", type=float, default=10.0, help="ожидание ответа на шаг, с")
+    parser.add_argument("--wait-bot", type=float, default=60.0)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args()
+
+    if args.seed:
+        seed(args.seed_tables, args.seed_menu)
+        return
+    stats = asyncio.run(run(args))
+    sys.exit(1 if stats.timeouts else 0)
+
+
+if __name__ == "__main__":
+    main()
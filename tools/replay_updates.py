@@ -0,0 +1,82 @@
+"""Заглушка Telegram для webhook-режима: отправляет записанные апдейты на webhook.
+
+Файл — JSON-массив апдейтов или JSONL (по апдейту на строку), в формате
+Bot API (как их присылает Telegram или отдаёт getUpdates).
+
+    python tools/replay_updates.py updates.jsonl --url http://127.0.0.1:8080/webhook \\
+        --secret <WEBHOOK_SECRET> --concurrency 20
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from collections import Counter
+
+import aiohttp
+
+
+def load_updates(path):
+    with open(path, encoding="utf-8") as f:
+        text = f.read().strip()
+    if text.startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+def percentile(sorted_values, q):
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def replay(updates, url, secret, concurrency, repeat):
+    headers = {"X-Telegram-Bot-Api-Secret-Token": secret} if secret else {}
+    sem = asyncio.Semaphore(concurrency)
+    statuses = Counter()
+    latencies = []
+
+    async def post(session, update):
+        async with sem:
+            started = time.perf_counter()
+            try:
+                async with session.post(url, json=update, headers=headers) as resp:
+                    await resp.read()
+                    statuses[resp.status] += 1
+            except aiohttp.ClientError as e:
+                statuses[type(e).__name__] += 1
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    async with aiohttp.ClientSession() as session:
+        for _ in range(repeat):
+            # Апдейты одного прогона уходят по порядку update_id, как от Telegram
+            await asyncio.gather(*(post(session, u) for u in updates))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    total = len(latencies)
+    print(f"Отправлено: {total} за {elapsed:.2f}с ({total / elapsed:.1f}/с)")
+    print("Ответы:", dict(statuses))
+    if latencies:
+        print(f"p50={percentile(latencies, 0.5) * 1000:.1f}мс "
+              f"p95={percentile(latencies, 0.95) * 1000:.1f}мс "
+              f"max={latencies[-1] * 1000:.1f}мс")
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("file", help="JSON/JSONL с апдейтами")
+    parser.add_argument("--url", default="http://127.0.0.1:8080/webhook")
+    parser.add_argument("--secret", default="")
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--repeat", type=int, default=1)
+    args = parser.parse_args()
+
+    updates = load_updates(args.file)
+    statuses = asyncio.run(replay(updates, args.url, args.secret, args.concurrency, args.repeat))
+    sys.exit(0 if set(statuses) <= {200} else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+"""Счётчики текущего апдейта без зависимостей от aiogram и aiohttp.
+
+UpdateStats апдейта лежит в contextvar current: его заводит middleware
+metrics.py, а database.py через row_factory соединений считает в нём
+прочитанные строки. Слой данных импортирует только этот модуль, поэтому
+database.py работает и без стека бота (tools/).
+"""
+
+import contextvars
+import sqlite3
+
+
+class UpdateStats:
+    __slots__ = ("handler", "db_calls", "db_rows", "db_seconds", "api_calls", "api_seconds")
+
+    def __init__(self):
+        self.handler = "unhandled"
+        self.db_calls = 0
+        self.db_rows = 0
+        self.db_seconds = 0.0
+        self.api_calls = 0
+        self.api_seconds = 0.0
+
+
+current = contextvars.ContextVar("update_stats", default=None)
+
+
+def counting_row(cursor, row):
+    """row_factory соединений БД: sqlite3.Row плюс счётчик строк апдейта."""
+    stats = current.get()
+    if stats is not None:
+        stats.db_rows += 1
+    return sqlite3.Row(cursor, row)
@@ -3,9 +3,34 @@ import logging
 from datetime import datetime
 from aiogram.types import InlineKeyboardButton, InlineKeyboardMarkup
 
+from cache import TTLCache
+from config import KEYBOARD_CACHE_SIZE
+
 logger = logging.getLogger(__name__)
 
 
+# Username бота: запрашивается один раз при старте (bot.main), нужен для ссылок
+_bot_username = None
+
+
+def set_bot_username(username: str):
+    global _bot_username
+    _bot_username = username
+
+
+async def deep_link(bot, payload: str) -> str:
+    """https://t.me/<бот>?start=<payload>; get_me — только если старт его не заполнил."""
+    global _bot_username
+    if _bot_username is None:
+        _bot_username = (await bot.get_me()).username
+    return f"https://t.me/{_bot_username}?start={payload}"
+
+
+async def order_link(bot, link_uuid: str) -> str:
+    """Ссылка-приглашение в совместный заказ (разбирается в /start как ord_<uuid>)."""
+    return await deep_link(bot, f"ord_{link_uuid}")
+
+
 # Дни/месяцы
 DAY_NAMES = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
 MONTH_NAMES = ["янв", "фев", "мар", "апр", "май", "июн",
@@ -21,6 +46,20 @@ def format_date(date_str: str) -> str:
         return date_str
 
 
+def cursor_data(prefix: str, cursor) -> str:
+    """callback_data следующей страницы: prefix_<дата>_<id>."""
+    booking_date, last_id = cursor
+    return f"{prefix}_{booking_date}_{last_id}"
+
+
+def parse_cursor(data: str, prefix: str):
+    """Обратное к cursor_data; None — первая страница."""
+    if not data.startswith(prefix + "_"):
+        return None
+    booking_date, last_id = data[len(prefix) + 1:].rsplit("_", 1)
+    return booking_date, int(last_id)
+
+
 def back_button(callback_data: str = "start_menu", text: str = "🔙 Назад") -> list:
     return [InlineKeyboardButton(text=text, callback_data=callback_data)]
 
@@ -31,3 +70,15 @@ def cancel_row(callback_data: str = "start_menu") -> list:
 
 def make_kb(rows: list[list[InlineKeyboardButton]]) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=rows)
+
+
+# Готовые клавиатуры: ключ описывает всё, от чего зависит разметка
+# (роли, день, страница, версия меню), поэтому при изменении данных
+# меняется и ключ, а старые записи просто вытесняются по LRU.
+# Разметки общие для всех запросов — менять их после получения нельзя.
+keyboards = TTLCache(KEYBOARD_CACHE_SIZE, ttl=float("inf"))
+
+
+def cached_kb(key: tuple, build) -> InlineKeyboardMarkup:
+    """Разметка по ключу; build() -> rows вызывается только при промахе."""
+    return keyboards.get_or_load(key, lambda _: make_kb(build()))
@@ -0,0 +1,94 @@
+"""Режим webhook: aiohttp-сервер, принимающий апдейты от Telegram.
+
+Кроме пути webhook отдаёт /healthz (процесс жив) и /readyz (старт завершён,
+база отвечает) — для reverse proxy и оркестратора. Апдейты принимает
+один процесс; параллельная обработка — через WORKERS (workers.py).
+"""
+
+import asyncio
+import logging
+
+from aiohttp import web
+from aiogram import Bot, Dispatcher
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+
+import async_db
+from config import (
+    WEBHOOK_BASE_URL, WEBHOOK_PATH, WEBHOOK_SECRET,
+    WEBHOOK_HOST, WEBHOOK_PORT,
+)
+
+logger = logging.getLogger(__name__)
+
+READY_KEY = web.AppKey("ready", bool)
+# Дополнительные проверки готовности: callable() -> текст проблемы или None
+READY_CHECKS_KEY = web.AppKey("ready_checks", list)
+
+
+async def healthz(request: web.Request) -> web.Response:
+    return web.json_response({"status": "ok"})
+
+
+async def readyz(request: web.Request) -> web.Response:
+    if not request.app[READY_KEY]:
+        return web.json_response({"status": "starting"}, status=503)
+    try:
+        await async_db.ping()
+    except Exception as e:
+        logger.warning("readyz: база недоступна: %s", e)
+        return web.json_response({"status": "db unavailable"}, status=503)
+    for check in request.app[READY_CHECKS_KEY]:
+        problem = check()
+        if problem:
+            return web.json_response({"status": problem}, status=503)
+    return web.json_response({"status": "ready"})
+
+
+def base_app() -> web.Application:
+    """Приложение с /healthz и /readyz; READY_KEY выставляется по окончании старта."""
+    app = web.Application()
+    app[READY_KEY] = False
+    app[READY_CHECKS_KEY] = []
+    app.router.add_get("/healthz", healthz)
+    app.router.add_get("/readyz", readyz)
+    return app
+
+
+async def register_webhook(bot: Bot, allowed_updates):
+    await bot.set_webhook(
+        WEBHOOK_BASE_URL.rstrip("/") + WEBHOOK_PATH,
+        secret_token=WEBHOOK_SECRET or None,
+        allowed_updates=allowed_updates)
+    logger.info("Webhook зарегистрирован: %s%s", WEBHOOK_BASE_URL, WEBHOOK_PATH)
+
+
+def build_app(dp: Dispatcher, bot: Bot) -> web.Application:
+    app = base_app()
+
+    # Сначала shutdown диспетчера (досылает рассылки), потом закрытие сессии бота
+    setup_application(app, dp, bot=bot)
+    SimpleRequestHandler(dp, bot, secret_token=WEBHOOK_SECRET or None).register(app, path=WEBHOOK_PATH)
+
+    async def on_startup(app: web.Application):
+        await register_webhook(bot, dp.resolve_used_update_types())
+        app[READY_KEY] = True
+
+    app.on_startup.append(on_startup)
+    return app
+
+
+async def run_webhook(dp: Dispatcher, bot: Bot):
+    await serve(build_app(dp, bot))
+
+
+async def serve(app: web.Application):
+    """Запустить приложение на WEBHOOK_HOST:WEBHOOK_PORT и работать до отмены."""
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, WEBHOOK_HOST, WEBHOOK_PORT)
+    await site.start()
+    logger.info("Webhook-сервер слушает %s:%s%s", WEBHOOK_HOST, WEBHOOK_PORT, WEBHOOK_PATH)
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await runner.cleanup()
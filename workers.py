@@ -0,0 +1,224 @@
+"""Несколько рабочих процессов за одним приёмником апдейтов.
+
+Фронт (основной процесс) получает апдейты — long polling или webhook — и
+раздаёт их WORKERS процессам по chat_id: все шаги одного диалога попадают
+в один процесс и выполняются там по порядку, а разные чаты обрабатываются
+параллельно на разных ядрах. Все процессы работают с одной restaurant.db;
+кэши процессов сбрасываются по таблице cache_epoch (database.sync_caches).
+События сводки корзины воркеры пересылают друг другу через те же очереди —
+в процесс инициатора заказа (broadcast.CartDigest).
+"""
+
+import asyncio
+import logging
+import multiprocessing as mp
+from typing import Any, Awaitable, Callable
+
+from aiohttp import web
+from aiogram import BaseMiddleware, Bot
+from aiogram.exceptions import TelegramNetworkError, TelegramServerError
+from aiogram.types import TelegramObject, Update
+
+import async_db
+import metrics
+from broadcast import cart_digest
+from config import (
+    BOT_MODE, WORKERS, WEBHOOK_PATH, WEBHOOK_SECRET,
+    METRICS_ENABLED, METRICS_HOST, METRICS_PORT,
+)
+from utils import set_bot_username
+from webhook import READY_KEY, READY_CHECKS_KEY, base_app, register_webhook, serve
+
+logger = logging.getLogger(__name__)
+
+POLL_TIMEOUT = 30
+CART_DIGEST_KEY = "cart_digest"  # не поле Update: событие сводки от другого воркера
+
+
+def affinity_key(raw: dict) -> int:
+    """chat_id (или id пользователя) апдейта — по нему выбирается процесс."""
+    for kind, payload in raw.items():
+        if kind == "update_id" or not isinstance(payload, dict):
+            continue
+        chat = payload.get("chat") or (payload.get("message") or {}).get("chat")
+        if chat:
+            return chat["id"]
+        user = payload.get("from") or payload.get("user")
+        if user:
+            return user["id"]
+    return raw.get("update_id", 0)
+
+
+#  Рабочий процесс
+class ChatOrderedRunner:
+    """Параллельная обработка апдейтов с сохранением порядка внутри чата."""
+
+    def __init__(self):
+        self._tails: dict[int, asyncio.Task] = {}
+
+    def submit(self, key: int, coro: Awaitable):
+        task = asyncio.create_task(self._run(self._tails.get(key), coro))
+        self._tails[key] = task
+        task.add_done_callback(lambda t: self._tails.pop(key) if self._tails.get(key) is t else None)
+
+    @staticmethod
+    async def _run(prev: asyncio.Task | None, coro: Awaitable):
+        if prev is not None:
+            await asyncio.wait([prev])
+        try:
+            await coro
+        except Exception:
+            logger.exception("Ошибка обработки апдейта")
+
+    async def drain(self):
+        while self._tails:
+            await asyncio.wait(list(self._tails.values()))
+
+
+class CacheSyncMiddleware(BaseMiddleware):
+    """Перед апдейтом сбрасывает кэши, если данные поменял другой процесс."""
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, dict[str, Any]], Awaitable[Any]],
+        event: TelegramObject,
+        data: dict[str, Any],
+    ) -> Any:
+        await async_db.sync_caches()
+        return await handler(event, data)
+
+
+def worker_for(key: int, size: int) -> int:
+    return key % size
+
+
+def _digest_router(index: int, queues):
+    """route для CartDigest: событие заказа — в воркер его инициатора."""
+    def route(owner_id: int, event: dict) -> bool:
+        target = worker_for(owner_id, len(queues))
+        if target == index:
+            return False
+        queues[target].put({CART_DIGEST_KEY: event})
+        return True
+    return route
+
+
+def worker_main(index: int, queues, token: str, bot_username: str):
+    asyncio.run(_worker(index, queues, token, bot_username))
+
+
+async def _worker(index: int, queues, token: str, bot_username: str):
+    from bot import build_dispatcher, make_bot
+
+    set_bot_username(bot_username)
+    bot = make_bot(token)
+    dp = build_dispatcher()
+    metrics_runner = None
+    if METRICS_ENABLED:
+        metrics.install(dp, bot)
+        metrics_runner = await metrics.start_server(METRICS_HOST, METRICS_PORT + 1 + index)
+    dp.update.outer_middleware(CacheSyncMiddleware())
+    cart_digest.route = _digest_router(index, queues)
+    queue = queues[index]
+    await dp.emit_startup(bot=bot)
+    logger.info("Воркер %s запущен", index)
+
+    loop = asyncio.get_running_loop()
+    runner = ChatOrderedRunner()
+    try:
+        while True:
+            raw = await loop.run_in_executor(None, queue.get)
+            if raw is None:
+                break
+            if CART_DIGEST_KEY in raw:
+                cart_digest.add(bot, **raw[CART_DIGEST_KEY])
+                continue
+            update = Update.model_validate(raw, context={"bot": bot})
+            runner.submit(affinity_key(raw), dp.feed_update(bot, update))
+        await runner.drain()
+    finally:
+        await dp.emit_shutdown(bot=bot)
+        await bot.session.close()
+        if metrics_runner is not None:
+            await metrics_runner.cleanup()
+        logger.info("Воркер %s остановлен", index)
+
+
+#  Фронт
+class WorkerPool:
+    def __init__(self, size: int, token: str, bot_username: str):
+        ctx = mp.get_context("spawn")
+        self.queues = [ctx.Queue() for _ in range(size)]
+        self.processes = [
+            ctx.Process(target=worker_main, args=(i, self.queues, token, bot_username),
+                        name=f"bot-worker-{i}")
+            for i in range(size)
+        ]
+
+    def start(self):
+        for p in self.processes:
+            p.start()
+
+    def dispatch(self, raw: dict):
+        self.queues[worker_for(affinity_key(raw), len(self.queues))].put(raw)
+
+    def dead_workers(self) -> str | None:
+        dead = [p.name for p in self.processes if not p.is_alive()]
+        return f"workers down: {', '.join(dead)}" if dead else None
+
+    async def stop(self):
+        for q in self.queues:
+            q.put(None)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(None, p.join) for p in self.processes))
+
+
+async def _poll(bot: Bot, pool: WorkerPool, allowed_updates):
+    await bot.delete_webhook(drop_pending_updates=True)
+    offset = None
+    backoff = 1
+    while True:
+        try:
+            updates = await bot.get_updates(
+                offset=offset, timeout=POLL_TIMEOUT, allowed_updates=allowed_updates)
+        except (TelegramNetworkError, TelegramServerError) as e:
+            logger.warning("getUpdates: %s, повтор через %sс", e, backoff)
+            await asyncio.sleep(backoff)
+            backoff = min(backoff * 2, 30)
+            continue
+        backoff = 1
+        for update in updates:
+            offset = update.update_id + 1
+            pool.dispatch(update.model_dump(mode="json", by_alias=True, exclude_none=True))
+
+
+async def _serve_webhook(bot: Bot, pool: WorkerPool, allowed_updates):
+    app = base_app()
+    app[READY_CHECKS_KEY].append(pool.dead_workers)
+
+    async def receive(request: web.Request) -> web.Response:
+        if WEBHOOK_SECRET and request.headers.get("X-Telegram-Bot-Api-Secret-Token") != WEBHOOK_SECRET:
+            return web.Response(status=401)
+        pool.dispatch(await request.json())
+        return web.Response()
+
+    async def on_startup(app: web.Application):
+        await register_webhook(bot, allowed_updates)
+        app[READY_KEY] = True
+
+    app.router.add_post(WEBHOOK_PATH, receive)
+    app.on_startup.append(on_startup)
+    await serve(app)
+
+
+async def run_front(bot: Bot, allowed_updates, bot_username: str):
+    pool = WorkerPool(WORKERS, bot.token, bot_username)
+    pool.start()
+    logger.info("Запущено воркеров: %s", WORKERS)
+    try:
+        if BOT_MODE == "webhook":
+            await _serve_webhook(bot, pool, allowed_updates)
+        else:
+            await _poll(bot, pool, allowed_updates)
+    finally:
+        await pool.stop()